@@ -0,0 +1,223 @@
+"""Admission control and load shedding.
+
+Requests are grouped into endpoint classes (AI parsing and job submission,
+auth, AI job polling, everything else). Each class has its own concurrency limit and a bounded wait queue, so
+a flood of slow AI parses cannot take the slots that cheap CRUD requests
+need. When a class's queue is full, or a queued request waits too long, the
+server answers 503 with ``Retry-After`` right away instead of letting latency
+grow without bound. AI parsing is also rate limited per user with a token
+bucket.
+"""
+from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.responses import JSONResponse
+from typing import Dict, Optional
+from auth_routes import verify_token, admin_only
+from cache import TTLCache
+import asyncio
+import math
+import os
+import threading
+import time
+
+admission_router = APIRouter()
+
+# Paths that bypass admission control: probes, long-lived event streams and
+# admin tooling, which must stay reachable while the server is shedding load
+EXEMPT_PATHS = {"/", "/healthz", "/readyz", "/events/stream"}
+EXEMPT_PREFIXES = ("/admin/",)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+class AdmissionGate:
+    """Concurrency limit with a bounded FIFO wait queue for one endpoint class."""
+
+    def __init__(self, name: str, limit: int, max_waiting: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        # Smoothed request duration, used to suggest a Retry-After
+        self.avg_seconds = 0.0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if needed; False means shed"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if self._semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                self.shed_queue_full += 1
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                self.shed_timeout += 1
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def release(self, elapsed: float):
+        self.in_flight -= 1
+        self.avg_seconds = elapsed if not self.avg_seconds else 0.9 * self.avg_seconds + 0.1 * elapsed
+        self._semaphore.release()
+
+    def retry_after(self) -> int:
+        # Roughly how long until the current queue has drained
+        return max(1, math.ceil(self.avg_seconds * (self.waiting + 1) / self.limit))
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "avg_seconds": round(self.avg_seconds, 4),
+        }
+
+
+def gate_from_env(name: str, limit: int, max_waiting: int, max_wait: float) -> AdmissionGate:
+    prefix = f"ADMISSION_{name.upper()}"
+    return AdmissionGate(
+        name,
+        limit=_env_int(f"{prefix}_CONCURRENCY", limit),
+        max_waiting=_env_int(f"{prefix}_QUEUE", max_waiting),
+        max_wait=_env_float(f"{prefix}_MAX_WAIT_SECONDS", max_wait),
+    )
+
+
+GATES: Dict[str, AdmissionGate] = {
+    "ai": gate_from_env("ai", limit=8, max_waiting=16, max_wait=10.0),
+    "auth": gate_from_env("auth", limit=32, max_waiting=64, max_wait=2.0),
+    "crud": gate_from_env("crud", limit=64, max_waiting=128, max_wait=2.0),
+    # Job long-polls hold their slot for up to ai_jobs.MAX_WAIT_SECONDS, so
+    # they get their own, larger pool instead of crowding out CRUD requests
+    "poll": gate_from_env("poll", limit=256, max_waiting=64, max_wait=2.0),
+}
+
+
+def endpoint_class(path: str, method: str = "GET") -> Optional[str]:
+    """Name of the gate for a request, or None if it is exempt"""
+    if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path == "/ai/parse-ingredients" or (path == "/ai/jobs" and method == "POST"):
+        return "ai"
+    if path.startswith("/ai/jobs/") and path != "/ai/jobs/stats" and method == "GET":
+        return "poll"
+    if path.startswith("/auth/"):
+        return "auth"
+    return "crud"
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that admits, queues or sheds each request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        name = endpoint_class(scope["path"], scope["method"])
+        gate = GATES.get(name)
+        if gate is None or gate.limit <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        if not await gate.acquire():
+            response = JSONResponse(
+                {"detail": "Server is busy, try again later"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(gate.retry_after())},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.perf_counter() - started)
+
+
+class TokenBucketLimiter:
+    """Per-user token buckets: ``rate`` tokens per second up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.rejected = 0
+        # Idle buckets refill completely, so they can simply expire
+        self._buckets = TTLCache(maxsize=10000, ttl=burst / rate if rate > 0 else 3600)
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> float:
+        """Spend one token; return 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key) or (float(self.burst), now)
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets.set(key, (tokens - 1, now))
+                return 0.0
+            self._buckets.set(key, (tokens, now))
+            self.rejected += 1
+            return (1 - tokens) / self.rate if self.rate > 0 else 3600.0
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_minute": round(self.rate * 60, 2),
+            "burst": self.burst,
+            "tracked_users": len(self._buckets),
+            "rejected": self.rejected,
+        }
+
+
+AI_RATE_LIMIT = TokenBucketLimiter(
+    rate=_env_float("AI_RATE_PER_MINUTE", 20.0) / 60,
+    burst=_env_int("AI_RATE_BURST", 10),
+)
+
+
+async def ai_rate_limited(token_data: dict = Depends(verify_token)) -> dict:
+    """verify_token plus the per-user AI parsing rate limit"""
+    wait = AI_RATE_LIMIT.take(token_data.get("uid") or "anonymous")
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many AI parsing requests, slow down",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+    return token_data
+
+
+@admission_router.get("")
+async def admission_stats(token_data: dict = Depends(admin_only)):
+    """Queue depth, in-flight requests and shed counts per endpoint class (admin only)"""
+    return {
+        "classes": {name: gate.stats() for name, gate in GATES.items()},
+        "ai_rate_limit": AI_RATE_LIMIT.stats(),
+    }
@@ -0,0 +1,455 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+from auth_routes import verify_token, admin_only
+from ai_parser import parse_ingredients_shared
+from admission import ai_rate_limited
+from routes import check_admin_status, get_restaurant_cached
+from collections import Counter, deque
+from itertools import count
+import asyncio
+import heapq
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+jobs_router = APIRouter()
+
+# Where jobs are persisted so queued work survives a restart
+JOBS_DB_PATH = os.getenv(
+    "AI_JOBS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_jobs.sqlite3")
+)
+
+# Longest a client may long-poll for a result
+MAX_WAIT_SECONDS = 30
+
+# Priorities below this jump ahead of normal work, so only admins may use them
+DEFAULT_PRIORITY = 5
+
+# A process holds a lease on each job it has queued or is running, renewed
+# while it lives; jobs whose lease expired are taken over by another process
+LEASE_SECONDS = float(os.getenv("AI_JOBS_LEASE_SECONDS", "60"))
+
+
+class JobSubmit(BaseModel):
+    ingredients: str
+    restaurant_id: Optional[str] = None
+    priority: int = DEFAULT_PRIORITY
+
+
+class JobStore:
+    """SQLite-backed job records.
+
+    Several processes may share one database. Each job is owned by the
+    process holding its lease, and state changes that depend on ownership
+    are conditional updates, so only one process ever claims a job.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    lane TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    ingredients TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    owner TEXT,
+                    lease_expires REAL
+                )
+                """
+            )
+            # Databases created before leases existed
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_expires", "REAL")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def insert(self, job: dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, user_id, lane, priority, status, ingredients, created_at, "
+                "owner, lease_expires) VALUES (:id, :user_id, :lane, :priority, :status, "
+                ":ingredients, :created_at, :owner, :lease_expires)",
+                job,
+            )
+
+    def claim(self, job_id: str, owner: str, started_at: float, lease_expires: float) -> bool:
+        """Mark a queued job of ``owner`` running; False if it is no longer ours to run"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, lease_expires = ? "
+                "WHERE id = ? AND status = 'queued' AND owner = ?",
+                (started_at, lease_expires, job_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def renew_leases(self, owner: str, lease_expires: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? "
+                "WHERE owner = ? AND status IN ('queued', 'running')",
+                (lease_expires, owner),
+            )
+
+    def release_leases(self, owner: str):
+        """Let other processes take over this owner's jobs right away"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET lease_expires = 0 "
+                "WHERE owner = ? AND status IN ('queued', 'running')",
+                (owner,),
+            )
+
+    def take_over_expired(self, owner: str, now: float, lease_expires: float) -> List[dict]:
+        """Requeue unfinished jobs whose lease expired under ``owner``; returns them"""
+        taken = []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') AND "
+                "(lease_expires IS NULL OR lease_expires < ?) ORDER BY created_at",
+                (now,),
+            ).fetchall()
+            for row in rows:
+                with self._conn:
+                    # Another process may have taken it since the SELECT
+                    cursor = self._conn.execute(
+                        "UPDATE jobs SET status = 'queued', started_at = NULL, owner = ?, "
+                        "lease_expires = ? WHERE id = ? AND status IN ('queued', 'running') "
+                        "AND (lease_expires IS NULL OR lease_expires < ?)",
+                        (owner, lease_expires, row["id"], now),
+                    )
+                if cursor.rowcount == 1:
+                    taken.append(dict(row))
+        return taken
+
+    def update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{name} = :{name}" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = :id", {**fields, "id": job_id}
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def status_counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def purge_finished(self, older_than: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (older_than,),
+            )
+
+
+class FairQueue:
+    """Priority queue that round-robins between lanes at the same priority.
+
+    Lower priority numbers run first. Within the best priority currently
+    waiting, lanes (one per restaurant) take turns, so one restaurant's bulk
+    onboarding cannot starve everyone else.
+    """
+
+    def __init__(self):
+        self._lanes: Dict[str, list] = {}
+        self._order = deque()
+        self._seq = count()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, lane: str, priority: int, job_id: str):
+        if lane not in self._lanes:
+            self._lanes[lane] = []
+            self._order.append(lane)
+        heapq.heappush(self._lanes[lane], (priority, next(self._seq), job_id))
+        self._size += 1
+
+    def pop(self) -> Optional[str]:
+        if not self._size:
+            return None
+        best = min(heap[0][0] for heap in self._lanes.values())
+        for lane in self._order:
+            if self._lanes[lane][0][0] == best:
+                break
+        _, _, job_id = heapq.heappop(self._lanes[lane])
+        self._size -= 1
+
+        # The served lane goes to the back of the rotation
+        self._order.remove(lane)
+        if self._lanes[lane]:
+            self._order.append(lane)
+        else:
+            del self._lanes[lane]
+        return job_id
+
+    def lane_depths(self) -> Dict[str, int]:
+        return {lane: len(heap) for lane, heap in self._lanes.items()}
+
+
+class JobQueue:
+    """Bounded background worker pool for AI parse jobs."""
+
+    def __init__(self, store_path: str, workers: int, max_queued: int, retention_seconds: float):
+        self.store_path = store_path
+        self.owner = secrets.token_hex(8)
+        self.worker_count = workers
+        self.max_queued = max_queued
+        self.retention_seconds = retention_seconds
+        self.store: Optional[JobStore] = None
+        self.queue = FairQueue()
+        self.busy_workers = 0
+        self.finished_count = 0
+        self.recent_waits = deque(maxlen=500)
+        self._finished_events: Dict[str, asyncio.Event] = {}
+        # Waiters per job, so the last one to leave drops the job's event
+        self._waiters: Counter = Counter()
+        self._ready: Optional[asyncio.Semaphore] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self):
+        self.store = JobStore(self.store_path)
+        self.store.purge_finished(time.time() - self.retention_seconds)
+        self._ready = asyncio.Semaphore(0)
+        self.queue = FairQueue()
+
+        # Requeue jobs left by processes that stopped or died
+        self.recover()
+
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.worker_count)
+        ]
+        self._workers.append(asyncio.create_task(self._lease_loop()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self.store is not None:
+            self.store.release_leases(self.owner)
+
+    def recover(self):
+        now = time.time()
+        for job in self.store.take_over_expired(self.owner, now, now + LEASE_SECONDS):
+            self._enqueue(job["lane"], job["priority"], job["id"])
+
+    async def _lease_loop(self):
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            try:
+                self.store.renew_leases(self.owner, time.time() + LEASE_SECONDS)
+                self.recover()
+            except sqlite3.Error as e:
+                print(f"AI job lease renewal failed: {str(e)}")
+
+    def _enqueue(self, lane: str, priority: int, job_id: str):
+        self.queue.push(lane, priority, job_id)
+        self._ready.release()
+
+    def submit(self, user_id: str, lane: str, priority: int, ingredients: str) -> dict:
+        if len(self.queue) >= self.max_queued:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="AI job queue is full, try again later",
+                headers={"Retry-After": "30"},
+            )
+        job = {
+            "id": secrets.token_hex(12),
+            "user_id": user_id,
+            "lane": lane,
+            "priority": priority,
+            "status": "queued",
+            "ingredients": ingredients,
+            "created_at": time.time(),
+            "owner": self.owner,
+            "lease_expires": time.time() + LEASE_SECONDS,
+        }
+        self.store.insert(job)
+        self._enqueue(lane, priority, job["id"])
+        return job
+
+    async def wait(self, job_id: str, timeout: float):
+        """Block until the job finishes or the timeout passes"""
+        event = self._finished_events.setdefault(job_id, asyncio.Event())
+        self._waiters[job_id] += 1
+        try:
+            job = self.store.get(job_id)
+            if job is None or job["status"] in ("done", "failed"):
+                return
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # A job that times out, or that another process finishes, never
+            # has its event popped by a worker here
+            self._waiters[job_id] -= 1
+            if not self._waiters[job_id]:
+                del self._waiters[job_id]
+                self._finished_events.pop(job_id, None)
+
+    async def _worker(self):
+        while True:
+            await self._ready.acquire()
+            job_id = self.queue.pop()
+            if job_id is None:
+                continue
+            job = self.store.get(job_id)
+            if job is None:
+                continue
+
+            started_at = time.time()
+            if not self.store.claim(job_id, self.owner, started_at, started_at + LEASE_SECONDS):
+                # Its lease lapsed and another process took it over
+                continue
+            self.recent_waits.append(started_at - job["created_at"])
+            self.busy_workers += 1
+            try:
+                result = await parse_ingredients_shared(job["ingredients"])
+                self.store.update(
+                    job_id, status="done", result=json.dumps(result), finished_at=time.time()
+                )
+            except asyncio.CancelledError:
+                # Shutting down; stop() releases the lease so the job is requeued
+                raise
+            except HTTPException as e:
+                self.store.update(job_id, status="failed", error=str(e.detail), finished_at=time.time())
+            except Exception as e:
+                print(f"AI job {job_id} failed: {str(e)}")
+                self.store.update(
+                    job_id, status="failed", error="Failed to parse ingredients with AI",
+                    finished_at=time.time(),
+                )
+            finally:
+                self.busy_workers -= 1
+
+            event = self._finished_events.pop(job_id, None)
+            if event:
+                event.set()
+
+            # Drop old finished jobs now and then so the store stays small
+            self.finished_count += 1
+            if self.finished_count % 100 == 0:
+                self.store.purge_finished(time.time() - self.retention_seconds)
+
+    def stats(self) -> dict:
+        waits = sorted(self.recent_waits)
+        return {
+            "queue_depth": len(self.queue),
+            "max_queued": self.max_queued,
+            "workers": self.worker_count,
+            "busy_workers": self.busy_workers,
+            "lanes": self.queue.lane_depths(),
+            "jobs_by_status": self.store.status_counts() if self.store else {},
+            "wait_seconds": {
+                "samples": len(waits),
+                "avg": round(sum(waits) / len(waits), 3) if waits else None,
+                "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else None,
+                "max": round(waits[-1], 3) if waits else None,
+            },
+        }
+
+
+AI_JOBS = JobQueue(
+    JOBS_DB_PATH,
+    workers=int(os.getenv("AI_JOBS_WORKERS", "4")),
+    max_queued=int(os.getenv("AI_JOBS_MAX_QUEUED", "1000")),
+    retention_seconds=float(os.getenv("AI_JOBS_RETENTION_SECONDS", "86400")),
+)
+
+
+def job_response(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "result": json.loads(job["result"]) if job.get("result") else None,
+        "error": job.get("error"),
+        "created_at": job["created_at"],
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+    }
+
+
+@jobs_router.post("", status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(payload: JobSubmit, token_data: dict = Depends(ai_rate_limited)):
+    """Queue an ingredient list for AI parsing and return its job id"""
+    user_id = token_data.get("uid")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user token")
+    if not 0 <= payload.priority <= 9:
+        raise HTTPException(status_code=400, detail="priority must be between 0 and 9")
+
+    is_admin = None
+    if payload.priority < DEFAULT_PRIORITY:
+        is_admin = await check_admin_status(token_data)
+        if not is_admin:
+            raise HTTPException(
+                status_code=403,
+                detail=f"Only admins can use priorities below {DEFAULT_PRIORITY}",
+            )
+
+    if payload.restaurant_id:
+        # A restaurant's lane is shared by its owner's jobs, so only they may use it
+        restaurant_data = get_restaurant_cached(payload.restaurant_id)
+        if not restaurant_data:
+            raise HTTPException(
+                status_code=404, detail=f"Restaurant {payload.restaurant_id} not found"
+            )
+        if restaurant_data.get("owner_uid") != user_id:
+            if is_admin is None:
+                is_admin = await check_admin_status(token_data)
+            if not is_admin:
+                raise HTTPException(
+                    status_code=403,
+                    detail="You don't have permission to submit jobs for this restaurant",
+                )
+
+    # Fairness is per restaurant, falling back to per user
+    lane = f"restaurant:{payload.restaurant_id}" if payload.restaurant_id else f"user:{user_id}"
+    job = AI_JOBS.submit(user_id, lane, payload.priority, payload.ingredients)
+    return {**job_response(job), "queue_depth": len(AI_JOBS.queue)}
+
+
+@jobs_router.get("/stats")
+async def job_stats(token_data: dict = Depends(admin_only)):
+    """Queue depth, worker usage and wait times (admin only)"""
+    return AI_JOBS.stats()
+
+
+@jobs_router.get("/{job_id}")
+async def get_job(job_id: str, wait: float = 0, token_data: dict = Depends(verify_token)):
+    """Get a job's status; with ?wait=N, long-poll up to N seconds for the result"""
+    job = AI_JOBS.store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job["user_id"] != token_data.get("uid") and not token_data.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="You don't have permission to view this job")
+
+    if wait > 0 and job["status"] in ("queued", "running"):
+        await AI_JOBS.wait(job_id, min(wait, MAX_WAIT_SECONDS))
+        job = AI_JOBS.store.get(job_id)
+
+    return job_response(job)
@@ -0,0 +1,128 @@
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from functools import lru_cache
+from gemini_client import GeminiClient
+from singleflight import SingleFlight
+from ingredient_similarity import SimilarParseIndex
+from taxonomy import ALLERGENS, DIETARY_CATEGORIES, normalize_allergens, normalize_dietary
+import hashlib
+import json
+import os
+
+
+@lru_cache(maxsize=None)
+def get_genai():
+    """Import google-generativeai on first use; it is large and only needed for AI parsing"""
+    fake_models = os.getenv("GEMINI_FAKE_MODELS")
+    if fake_models:
+        from fake_gemini import FakeGenAI, parse_behaviors
+
+        return FakeGenAI(parse_behaviors(fake_models))
+    try:
+        import google.generativeai as genai
+    except Exception:
+        return None
+    return genai
+
+
+def ingredients_key(ingredients: str) -> str:
+    """Hash ingredient text after normalizing case and whitespace"""
+    normalized = " ".join((ingredients or "").lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+# Coalesce identical concurrent AI parses
+AI_PARSES = SingleFlight()
+
+# Earlier results, reused for the same or near-duplicate ingredient lists
+SIMILAR_PARSES = SimilarParseIndex.from_env()
+
+
+@lru_cache(maxsize=None)
+def get_gemini_client() -> GeminiClient:
+    """Build the shared Gemini client; raises HTTPException if AI is not configured"""
+    api_key = os.getenv("GOOGLE_AI_API_KEY")
+    if not api_key and not os.getenv("GEMINI_FAKE_MODELS"):
+        raise HTTPException(
+            status_code=500,
+            detail="GOOGLE_AI_API_KEY env var is not set on the server",
+        )
+
+    genai = get_genai()
+    if genai is None:
+        raise HTTPException(
+            status_code=500,
+            detail="google-generativeai library is not installed on the server",
+        )
+
+    genai.configure(api_key=api_key)
+    return GeminiClient.from_env(genai)
+
+
+def build_prompt(ingredients: str) -> str:
+    return (
+        "You are extracting food safety attributes from free-text ingredient lists.\n"
+        "Given the text, return a strict JSON object with keys: allergens (array of strings), "
+        "dietaryCategories (array of strings), and extractedIngredients (array of strings).\n"
+        f"The allowed allergen ids are: {', '.join(ALLERGENS)}.\n"
+        f"The allowed dietary category ids are: {', '.join(DIETARY_CATEGORIES)}.\n"
+        "Normalize synonyms to these ids (e.g., 'tree nuts' -> 'tree_nuts').\n"
+        "Only output valid ids. If none, output empty arrays.\n"
+        f"Text: {ingredients}"
+    )
+
+
+def normalize_model_output(raw_text: str) -> dict:
+    """Parse the model's JSON and keep only known allergen and dietary ids"""
+    try:
+        parsed = json.loads(raw_text)
+    except Exception:
+        # Fallback: try to locate a JSON object in the text
+        start = raw_text.find("{")
+        end = raw_text.rfind("}")
+        if start != -1 and end != -1 and end > start:
+            parsed = json.loads(raw_text[start : end + 1])
+        else:
+            raise
+
+    # Keep only ids the parsers know, mapping synonyms to our ids
+    allergens = normalize_allergens(parsed.get("allergens", []), allowed=set(ALLERGENS))
+    dietary = normalize_dietary(parsed.get("dietaryCategories", []))
+
+    extracted_ingredients = parsed.get("extractedIngredients", []) or []
+
+    return {
+        "allergens": allergens,
+        "dietaryCategories": dietary,
+        "extractedIngredients": extracted_ingredients,
+    }
+
+
+async def parse_ingredients(ingredients: str) -> dict:
+    """Extract allergens and dietary categories from ingredient text with Gemini.
+
+    Raises HTTPException when AI is not configured, when every candidate model
+    fails, or when the request deadline passes.
+    """
+    raw_text = await get_gemini_client().generate(build_prompt(ingredients))
+    return normalize_model_output(raw_text)
+
+
+async def parse_and_remember(ingredients: str) -> dict:
+    """parse_ingredients, adding the result to the reuse index"""
+    result = await parse_ingredients(ingredients)
+    tokens = SIMILAR_PARSES.add(ingredients, result)
+    if tokens:
+        await run_in_threadpool(SIMILAR_PARSES.persist, tokens, result)
+    return result
+
+
+async def parse_ingredients_shared(ingredients: str) -> dict:
+    """parse_ingredients, reusing results for near-duplicate lists parsed before
+    and sharing one model call between identical concurrent texts"""
+    reused = SIMILAR_PARSES.lookup(ingredients)
+    if reused is not None:
+        return reused
+    return await AI_PARSES.do(
+        ingredients_key(ingredients), lambda: parse_and_remember(ingredients)
+    )
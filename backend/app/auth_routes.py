@@ -5,6 +5,9 @@ from firebase_admin import auth, db
 import json
 import time
 import secrets  # For generating session tokens
+from session_tokens import SIGNER, REVOCATIONS, InvalidToken, is_signed_token
+from taxonomy import VALID_ALLERGENS, VALID_DIETARY_CATEGORIES
+from cache import TTLCache
 
 auth_router = APIRouter()
 
@@ -12,6 +15,12 @@ auth_router = APIRouter()
 # In production, you should use Redis or a database
 SESSION_TOKENS = {}
 
+# Lifetime of single-purpose tokens such as event stream tickets
+SCOPED_TOKEN_SECONDS = 30
+
+# In-memory scoped tokens: token -> (scope, session token); each is used once
+SCOPED_TOKENS = TTLCache(maxsize=10000, ttl=SCOPED_TOKEN_SECONDS)
+
 class UserRegister(BaseModel):
     email: str
     password: str
@@ -33,6 +42,12 @@ class UserResponse(BaseModel):
     name: Optional[str] = None
     restaurantId: Optional[str] = None
     is_admin: bool = False
+    expires_at: Optional[int] = None
+
+class AllergenProfile(BaseModel):
+    name: str
+    allergen_free: List[str] = []
+    dietaryCategories: List[str] = []
 
 class UserListItem(BaseModel):
     uid: str
@@ -42,8 +57,102 @@ class UserListItem(BaseModel):
     restaurant_name: Optional[str] = None
     created_at: Optional[int] = None
 
-# Middleware to verify token
-async def verify_token(request: Request):
+def create_session(uid: str, email: str, name: Optional[str], is_admin: bool):
+    """Issue a session token; signed when SESSION_SIGNING_KEYS is set.
+
+    Returns (token, expires_at); expires_at is None for in-memory sessions.
+    """
+    if SIGNER is not None:
+        token, claims = SIGNER.issue(uid, email, name, is_admin)
+        return token, claims["exp"]
+
+    session_token = secrets.token_hex(32)
+    SESSION_TOKENS[session_token] = {
+        "uid": uid,
+        "email": email,
+        "name": name,
+        "is_admin": is_admin
+    }
+    return session_token, None
+
+def resolve_token(token: str) -> dict:
+    """Return the session data for a token or raise 401"""
+    if is_signed_token(token) and SIGNER is not None:
+        try:
+            claims = SIGNER.verify(token)
+        except InvalidToken:
+            claims = None
+        # Scoped tokens (e.g. event stream tickets) are not sessions
+        if claims and "scp" not in claims and not REVOCATIONS.is_revoked(claims["jti"]):
+            return {
+                "uid": claims["uid"],
+                "email": claims.get("email"),
+                "name": claims.get("name"),
+                "is_admin": claims.get("adm", False),
+                "auth_time": claims.get("auth_time", claims.get("iat")),
+                "exp": claims["exp"],
+                "jti": claims["jti"],
+                "token_type": "signed"
+            }
+    elif token in SESSION_TOKENS:
+        # Check if token exists in our session store
+        return SESSION_TOKENS[token]
+
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired token"
+    )
+
+def issue_scoped_token(session_token: str, token_data: dict, scope: str) -> str:
+    """A short-lived token that only works for ``scope``, for places where the
+    session token would leak, such as URLs"""
+    if token_data.get("token_type") == "signed":
+        claims = {
+            "uid": token_data["uid"],
+            "email": token_data.get("email"),
+            "name": token_data.get("name"),
+            "adm": token_data.get("is_admin", False),
+            "scp": scope,
+            "exp": min(int(time.time()) + SCOPED_TOKEN_SECONDS, token_data["exp"]),
+            # The session's expiry and id, so logout still applies
+            "sxp": token_data["exp"],
+            "jti": token_data["jti"],
+        }
+        return SIGNER.sign_claims(claims)
+
+    scoped_token = secrets.token_urlsafe(24)
+    SCOPED_TOKENS.set(scoped_token, (scope, session_token))
+    return scoped_token
+
+def resolve_scoped_token(token: str, scope: str) -> dict:
+    """Session data for a token from issue_scoped_token, or raise 401"""
+    if is_signed_token(token) and SIGNER is not None:
+        try:
+            claims = SIGNER.verify(token)
+        except InvalidToken:
+            claims = None
+        if claims and claims.get("scp") == scope and not REVOCATIONS.is_revoked(claims["jti"]):
+            return {
+                "uid": claims["uid"],
+                "email": claims.get("email"),
+                "name": claims.get("name"),
+                "is_admin": claims.get("adm", False),
+                "exp": claims["sxp"],
+                "jti": claims["jti"],
+                "token_type": "signed"
+            }
+    else:
+        entry = SCOPED_TOKENS.get(token)
+        SCOPED_TOKENS.pop(token)
+        if entry is not None and entry[0] == scope:
+            return resolve_token(entry[1])
+
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired token"
+    )
+
+def get_bearer_token(request: Request) -> str:
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
         raise HTTPException(
@@ -51,17 +160,74 @@ async def verify_token(request: Request):
             detail="Missing or invalid authorization header"
         )
     
-    token = auth_header.split('Bearer ')[1]
-    
-    # Check if token exists in our session store
-    if token in SESSION_TOKENS:
-        return SESSION_TOKENS[token]
-    else:
+    return auth_header.split('Bearer ')[1]
+
+# Middleware to verify token
+async def verify_token(request: Request):
+    return resolve_token(get_bearer_token(request))
+
+def find_restaurant_ids(uid: str) -> List[str]:
+    """Ids of the restaurants owned by a user"""
+    restaurant_ref = db.reference('restaurants')
+    restaurants = restaurant_ref.order_by_child('owner_uid').equal_to(uid).get()
+    return list(restaurants.keys()) if restaurants else []
+
+def user_stat_updates(old_user: Optional[dict], new_user: Optional[dict]) -> dict:
+    """Counter increments to write together with a user record change"""
+    # Imported here because catalog_stats depends on this module
+    from catalog_stats import count_deltas, stat_updates, user_counts
+    return stat_updates(count_deltas(user_counts(old_user), user_counts(new_user)))
+
+def set_admin_flag(uid: str, is_admin: bool):
+    """Update a user's admin flag and the per-role counters"""
+    was_admin = bool(db.reference(f'users/{uid}/is_admin').get())
+    db.reference('/').update({
+        f'users/{uid}/is_admin': is_admin,
+        **user_stat_updates({"is_admin": was_admin}, {"is_admin": is_admin}),
+    })
+
+# Most users Firebase Auth returns from one get_users call
+AUTH_LOOKUP_BATCH = 100
+
+# Most profiles one user can save
+MAX_PROFILES = 20
+
+def get_profile(uid: str, profile_id: str) -> Optional[dict]:
+    """A user's saved allergen profile.
+
+    Read fresh every time (one small read): it decides which allergens a
+    menu hides, so an edit on any worker must apply to the next request.
+    """
+    return db.reference(f'users/{uid}/allergen_profiles/{profile_id}').get()
+
+def validate_profile(profile: AllergenProfile):
+    """Raise a 400 if a profile is unnamed or uses unknown ids"""
+    if not profile.name.strip():
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Profile name is required"
+        )
+    invalid_allergens = set(profile.allergen_free) - VALID_ALLERGENS
+    if invalid_allergens:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid allergens: {', '.join(invalid_allergens)}"
+        )
+    invalid_categories = set(profile.dietaryCategories) - VALID_DIETARY_CATEGORIES
+    if invalid_categories:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid dietary categories: {', '.join(invalid_categories)}"
         )
 
+def profile_record(profile: AllergenProfile) -> dict:
+    return {
+        "name": profile.name.strip(),
+        "allergen_free": sorted(set(profile.allergen_free)),
+        "dietaryCategories": sorted(set(profile.dietaryCategories)),
+        "updated_at": int(time.time())
+    }
+
 # Admin-only middleware
 async def admin_only(request: Request):
     token_data = await verify_token(request)
@@ -86,37 +252,29 @@ async def register_user(user_data: UserRegister):
             display_name=user_data.name
         )
         
-        # Generate a session token
-        session_token = secrets.token_hex(32)
-        
         # Determine if user should be admin
         is_admin = user_data.is_admin
         
-        # Save session data with admin status and name
-        SESSION_TOKENS[session_token] = {
-            "uid": user_record.uid,
-            "email": user_record.email,
-            "name": user_data.name,
-            "is_admin": is_admin
-        }
-        
-        # Save additional user data
-        user_ref = db.reference(f'users/{user_record.uid}')
-        user_ref.set({
-            "email": user_data.email,
-            "name": user_data.name,
-            "restaurantName": user_data.restaurantName,
-            "is_admin": is_admin,
-            "created_at": int(time.time())
+        # Save additional user data together with the user counters
+        db.reference('/').update({
+            f'users/{user_record.uid}': {
+                "email": user_data.email,
+                "name": user_data.name,
+                "restaurantName": user_data.restaurantName,
+                "is_admin": is_admin,
+                "created_at": int(time.time())
+            },
+            **user_stat_updates(None, {"is_admin": is_admin}),
         })
         
         # Try to find existing restaurant for this user
-        restaurant_ref = db.reference('restaurants')
-        restaurants = restaurant_ref.order_by_child('owner_uid').equal_to(user_record.uid).get()
+        restaurant_ids = find_restaurant_ids(user_record.uid)
+        restaurant_id = restaurant_ids[0] if restaurant_ids else None
         
-        restaurant_id = None
-        if restaurants:
-            restaurant_id = list(restaurants.keys())[0]
+        # Generate a session token carrying admin status and name
+        session_token, expires_at = create_session(
+            user_record.uid, user_record.email, user_data.name, is_admin
+        )
         
         return {
             "uid": user_record.uid,
@@ -124,7 +282,8 @@ async def register_user(user_data: UserRegister):
             "token": session_token,
             "name": user_data.name,
             "restaurantId": restaurant_id,
-            "is_admin": is_admin
+            "is_admin": is_admin,
+            "expires_at": expires_at
         }
     except auth.EmailAlreadyExistsError:
         raise HTTPException(
@@ -151,24 +310,14 @@ async def login_user(login_data: LoginData):
         is_admin = user_data.get('is_admin', False) if user_data else False
         name = user_data.get('name') if user_data else user.display_name
         
-        # Generate a session token
-        session_token = secrets.token_hex(32)
-        
-        # Store session data with admin status and name
-        SESSION_TOKENS[session_token] = {
-            "uid": user.uid,
-            "email": user.email,
-            "name": name,
-            "is_admin": is_admin
-        }
-        
         # Get restaurant ID if exists
-        restaurant_ref = db.reference('restaurants')
-        restaurants = restaurant_ref.order_by_child('owner_uid').equal_to(user.uid).get()
+        restaurant_ids = find_restaurant_ids(user.uid)
+        restaurant_id = restaurant_ids[0] if restaurant_ids else None
         
-        restaurant_id = None
-        if restaurants:
-            restaurant_id = list(restaurants.keys())[0]
+        # Generate a session token carrying admin status and name
+        session_token, expires_at = create_session(
+            user.uid, user.email, name, is_admin
+        )
         
         return {
             "uid": user.uid,
@@ -176,7 +325,8 @@ async def login_user(login_data: LoginData):
             "token": session_token,
             "name": name,
             "restaurantId": restaurant_id,
-            "is_admin": is_admin
+            "is_admin": is_admin,
+            "expires_at": expires_at
         }
     except auth.UserNotFoundError:
         raise HTTPException(
@@ -248,14 +398,22 @@ async def get_all_users(token_data: dict = Depends(admin_only)):
             if owner_uid:
                 restaurant_map[owner_uid] = r_data.get('name', 'Unnamed Restaurant')
         
+        # Look up emails in Firebase Auth, up to 100 users per call
+        auth_emails = {}
+        uids = list(all_users.keys())
+        for start in range(0, len(uids), AUTH_LOOKUP_BATCH):
+            try:
+                result = auth.get_users([auth.UidIdentifier(uid) for uid in uids[start:start + AUTH_LOOKUP_BATCH]])
+                auth_emails.update({auth_user.uid: auth_user.email for auth_user in result.users})
+            except Exception as e:
+                print(f"Error looking up users in Firebase Auth: {str(e)}")
+        
         # Format user data for response
         user_list = []
         for uid, user_data in all_users.items():
-            # Get additional user info from Firebase Auth if needed
-            try:
-                auth_user = auth.get_user(uid)
-                email = auth_user.email
-            except:
+            if uid in auth_emails:
+                email = auth_emails[uid]
+            else:
                 # Fallback to stored email if Firebase Auth lookup fails
                 email = user_data.get('email', 'Unknown')
             
@@ -289,12 +447,10 @@ async def make_user_admin_by_email(admin_data: MakeAdminData, token_data: dict =
         user = auth.get_user_by_email(admin_data.email)
         
         # Update user record in database
-        user_ref = db.reference(f'users/{user.uid}')
-        user_ref.update({
-            "is_admin": True
-        })
+        set_admin_flag(user.uid, True)
         
         # Update session token if the user is currently logged in
+        # (signed tokens pick up the change on their next refresh)
         for token, data in list(SESSION_TOKENS.items()):
             if data.get("email") == admin_data.email:
                 SESSION_TOKENS[token]["is_admin"] = True
@@ -320,10 +476,7 @@ async def make_user_admin(user_id: str, token_data: dict = Depends(admin_only)):
         user = auth.get_user(user_id)
         
         # Update user record in database
-        user_ref = db.reference(f'users/{user_id}')
-        user_ref.update({
-            "is_admin": True
-        })
+        set_admin_flag(user_id, True)
         
         # Update session token if the user is currently logged in
         for token, data in list(SESSION_TOKENS.items()):
@@ -344,17 +497,15 @@ async def make_user_admin(user_id: str, token_data: dict = Depends(admin_only)):
         
 # Add a logout endpoint
 @auth_router.post("/logout")
-async def logout_user(token_data: dict = Depends(verify_token)):
+async def logout_user(request: Request, token_data: dict = Depends(verify_token)):
     """Logout a user by invalidating their token"""
     try:
-        # Get the token from the authorization header
-        auth_header = token_data.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split('Bearer ')[1]
-            
+        if token_data.get("token_type") == "signed":
+            # Signed tokens stay valid until expiry unless denied everywhere
+            REVOCATIONS.revoke(token_data["jti"], token_data["exp"])
+        else:
             # Remove the token from the session store
-            if token in SESSION_TOKENS:
-                del SESSION_TOKENS[token]
+            SESSION_TOKENS.pop(get_bearer_token(request), None)
                 
         return {"message": "Logged out successfully"}
     except Exception as e:
@@ -363,6 +514,44 @@ async def logout_user(token_data: dict = Depends(verify_token)):
             detail=f"Logout error: {str(e)}"
         )
     
+@auth_router.post("/refresh")
+async def refresh_token(token_data: dict = Depends(verify_token)):
+    """Exchange a valid signed token for a new one with up-to-date claims.
+
+    The presented token is revoked, and sessions older than
+    SESSION_MAX_AGE_SECONDS must log in again.
+    """
+    if token_data.get("token_type") != "signed":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only signed session tokens can be refreshed"
+        )
+    auth_time = token_data["auth_time"]
+    if time.time() >= auth_time + SIGNER.max_age_seconds:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session too old, please log in again"
+        )
+    try:
+        uid = token_data["uid"]
+        
+        # Re-read admin status so promotions and demotions take effect
+        user_data = db.reference(f'users/{uid}').get() or {}
+        is_admin = user_data.get('is_admin', False)
+        name = user_data.get('name', token_data.get("name"))
+        
+        token, claims = SIGNER.issue(
+            uid, token_data.get("email"), name, is_admin, auth_time=auth_time
+        )
+        # The old token must not stay usable alongside the new one
+        REVOCATIONS.revoke(token_data["jti"], token_data["exp"])
+        return {"token": token, "expires_at": claims["exp"], "is_admin": is_admin}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Refresh error: {str(e)}"
+        )
+
 @auth_router.post("/remove-admin-by-email")
 async def remove_user_admin_by_email(admin_data: MakeAdminData, token_data: dict = Depends(admin_only)):
     """Remove admin privileges from a user by email (requires admin privileges)"""
@@ -378,10 +567,7 @@ async def remove_user_admin_by_email(admin_data: MakeAdminData, token_data: dict
         user = auth.get_user_by_email(admin_data.email)
         
         # Update user record in database
-        user_ref = db.reference(f'users/{user.uid}')
-        user_ref.update({
-            "is_admin": False
-        })
+        set_admin_flag(user.uid, False)
         
         # Update session token if the user is currently logged in
         for token, data in list(SESSION_TOKENS.items()):
@@ -398,4 +584,93 @@ async def remove_user_admin_by_email(admin_data: MakeAdminData, token_data: dict
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error updating user: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+# Saved allergen profiles, applied with GET /restaurants/{id}/menu?profile=<id>
+@auth_router.get("/profiles")
+async def list_profiles(token_data: dict = Depends(verify_token)):
+    """List the current user's saved allergen profiles"""
+    try:
+        profiles = db.reference(f'users/{token_data["uid"]}/allergen_profiles').get() or {}
+        return [{"id": profile_id, **profile} for profile_id, profile in profiles.items()]
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error getting profiles: {str(e)}"
+        )
+
+@auth_router.post("/profiles", status_code=status.HTTP_201_CREATED)
+async def create_profile(profile: AllergenProfile, token_data: dict = Depends(verify_token)):
+    """Save a named allergen/dietary profile for the current user"""
+    validate_profile(profile)
+    try:
+        uid = token_data["uid"]
+        profiles_ref = db.reference(f'users/{uid}/allergen_profiles')
+        
+        # Only the ids are needed to enforce the limit
+        existing = profiles_ref.get(shallow=True) or {}
+        if len(existing) >= MAX_PROFILES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {MAX_PROFILES} profiles can be saved"
+            )
+        
+        profile_id = secrets.token_hex(4)
+        while profile_id in existing:
+            profile_id = secrets.token_hex(4)
+        record = profile_record(profile)
+        profiles_ref.child(profile_id).set(record)
+        return {"id": profile_id, **record}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error saving profile: {str(e)}"
+        )
+
+@auth_router.put("/profiles/{profile_id}")
+async def update_profile(profile_id: str, profile: AllergenProfile, token_data: dict = Depends(verify_token)):
+    """Replace one of the current user's allergen profiles"""
+    validate_profile(profile)
+    try:
+        uid = token_data["uid"]
+        profile_ref = db.reference(f'users/{uid}/allergen_profiles/{profile_id}')
+        if profile_ref.get(shallow=True) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Profile not found"
+            )
+        
+        record = profile_record(profile)
+        profile_ref.set(record)
+        return {"id": profile_id, **record}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error saving profile: {str(e)}"
+        )
+
+@auth_router.delete("/profiles/{profile_id}")
+async def delete_profile(profile_id: str, token_data: dict = Depends(verify_token)):
+    """Delete one of the current user's allergen profiles"""
+    try:
+        uid = token_data["uid"]
+        profile_ref = db.reference(f'users/{uid}/allergen_profiles/{profile_id}')
+        if profile_ref.get(shallow=True) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Profile not found"
+            )
+        
+        profile_ref.delete()
+        return {"message": "Profile deleted"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error deleting profile: {str(e)}"
+        )
@@ -0,0 +1,228 @@
+"""Catalog aggregate counters for the admin dashboard.
+
+Counts live under ``stats/catalog`` as a small nested tree, e.g.
+``restaurants/by_cuisine/italian`` or ``menu_items/by_allergen/milk``. Write
+paths compute how a document's contribution changed (old vs new) and add the
+difference as server-side increments in the same multi-path update that
+writes the document. So counters and data change together, and there is no
+transaction to contend on. Reading the dashboard is a single small read
+instead of downloading whole trees. A reconciliation job recomputes
+everything in a paged pass and reports any drift.
+"""
+from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.concurrency import run_in_threadpool
+from firebase_admin import db
+from collections import Counter
+from typing import Dict, Optional
+from auth_routes import admin_only
+from paging import iter_children
+import asyncio
+import os
+import re
+import time
+
+stats_router = APIRouter()
+
+STATS_PATH = "stats/catalog"
+
+# Bumped by every counter change, so reconciliation can tell whether writes
+# happened while it was scanning
+WRITES_PATH = "stats/catalog_writes"
+
+# Children read per query during reconciliation
+RECONCILE_PAGE_SIZE = int(os.getenv("STATS_RECONCILE_PAGE_SIZE", "500"))
+
+# Characters Firebase does not allow in keys
+INVALID_KEY_CHARS = re.compile(r"[.$#\[\]/]")
+
+
+def stat_key(value) -> str:
+    key = INVALID_KEY_CHARS.sub("_", str(value or "").strip().lower())
+    return key or "unknown"
+
+
+def restaurant_counts(restaurant: Optional[dict]) -> Counter:
+    if not restaurant:
+        return Counter()
+    return Counter({
+        "restaurants/total": 1,
+        f"restaurants/by_cuisine/{stat_key(restaurant.get('cuisine_type'))}": 1,
+    })
+
+
+def menu_item_counts(item: Optional[dict]) -> Counter:
+    if not item:
+        return Counter()
+    counts = Counter({"menu_items/total": 1})
+    allergens = set(item.get("allergens") or [])
+    if not allergens:
+        counts["menu_items/no_allergens"] = 1
+    for allergen in allergens:
+        counts[f"menu_items/by_allergen/{stat_key(allergen)}"] = 1
+    for category in set(item.get("dietaryCategories") or []):
+        counts[f"menu_items/by_dietary/{stat_key(category)}"] = 1
+    return counts
+
+
+def user_counts(user: Optional[dict]) -> Counter:
+    if not user:
+        return Counter()
+    role = "admin" if user.get("is_admin") else "user"
+    return Counter({"users/total": 1, f"users/by_role/{role}": 1})
+
+
+def count_deltas(old: Counter, new: Counter) -> Dict[str, int]:
+    """Non-zero counter changes going from ``old`` to ``new``"""
+    deltas = {}
+    for path in set(old) | set(new):
+        delta = new[path] - old[path]
+        if delta:
+            deltas[path] = delta
+    return deltas
+
+
+def increment(delta: int) -> dict:
+    """Firebase server value that adds ``delta`` to the stored number"""
+    return {".sv": {"increment": delta}}
+
+
+def stat_updates(deltas: Dict[str, int]) -> Dict[str, dict]:
+    """Multi-path update entries that add ``deltas`` to the stored counters.
+
+    Add them to the update that writes the data they describe.
+    """
+    updates = {
+        f"{STATS_PATH}/{path}": increment(delta) for path, delta in deltas.items() if delta
+    }
+    if updates:
+        updates[WRITES_PATH] = increment(1)
+    return updates
+
+
+def apply_deltas(deltas: Dict[str, int]):
+    """Add ``deltas`` to the stored counters in one update"""
+    updates = stat_updates(deltas)
+    if updates:
+        db.reference("/").update(updates)
+
+
+def flatten(tree: Optional[dict], prefix: str = "") -> Dict[str, int]:
+    flat = {}
+    for key, value in (tree or {}).items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "/"))
+        else:
+            flat[path] = value
+    return flat
+
+
+class StatsReconciler:
+    """Recomputes the counters from the source trees and reports drift."""
+
+    def __init__(self):
+        self.running = False
+        self.progress: Dict[str, int] = {}
+        self.report: Optional[dict] = None
+        # Held so the running scan isn't garbage collected mid-run
+        self.task: Optional[asyncio.Task] = None
+
+    def run(self, fix: bool) -> dict:
+        """Recount everything; with ``fix``, correct the drift if no counter
+        changed during the scan"""
+        started = time.time()
+        self.progress = {"restaurants": 0, "menu_items": 0, "users": 0}
+        writes_before = db.reference(WRITES_PATH).get() or 0
+        actual = Counter()
+        for tree, counts in (
+            ("restaurants", restaurant_counts),
+            ("menu_items", menu_item_counts),
+            ("users", user_counts),
+        ):
+            for _, value in iter_children(tree, RECONCILE_PAGE_SIZE):
+                actual.update(counts(value if isinstance(value, dict) else None))
+                self.progress[tree] += 1
+
+        stored = flatten(db.reference(STATS_PATH).get())
+        writes_during_scan = (db.reference(WRITES_PATH).get() or 0) - writes_before
+        drift = {
+            path: {"stored": stored.get(path, 0), "actual": actual[path]}
+            for path in set(stored) | set(actual)
+            if stored.get(path, 0) != actual[path]
+        }
+
+        # The scan takes a while, so a write during it may or may not be in
+        # ``actual``. Only when no counter changed do the scan and the stored
+        # counters describe the same data. The correction is then applied as
+        # increments, so writes made after the check are kept.
+        fixed = False
+        if fix and drift:
+            if writes_during_scan:
+                print(f"Not fixing stats drift: {writes_during_scan} writes during the scan")
+            else:
+                apply_deltas({path: d["actual"] - d["stored"] for path, d in drift.items()})
+                fixed = True
+
+        return {
+            "started_at": started,
+            "finished_at": time.time(),
+            "scanned": dict(self.progress),
+            "drift": drift,
+            "writes_during_scan": writes_during_scan,
+            "fixed": fixed,
+        }
+
+    def start(self, fix: bool):
+        """Run a scan on the event loop; the caller checks ``running`` first"""
+        self.running = True
+        self.task = asyncio.create_task(self.run_in_background(fix))
+        self.task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        if self.task is task:
+            self.task = None
+
+    async def run_in_background(self, fix: bool):
+        self.running = True
+        try:
+            self.report = await run_in_threadpool(self.run, fix)
+        except Exception as e:
+            print(f"Stats reconciliation failed: {str(e)}")
+            self.report = {"error": str(e), "finished_at": time.time()}
+        finally:
+            self.running = False
+
+
+RECONCILER = StatsReconciler()
+
+
+@stats_router.get("")
+async def get_catalog_stats(token_data: dict = Depends(admin_only)):
+    """Restaurant, menu item and user counts (admin only)"""
+    return db.reference(STATS_PATH).get() or {}
+
+
+@stats_router.post("/reconcile", status_code=status.HTTP_202_ACCEPTED)
+async def start_reconcile(fix: bool = False, token_data: dict = Depends(admin_only)):
+    """Recompute the counters from scratch in the background (admin only).
+
+    With ``fix=true`` any drift found is corrected, unless counters changed
+    while the scan ran (see ``writes_during_scan`` in the report).
+    """
+    if RECONCILER.running:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Reconciliation is already running",
+        )
+    RECONCILER.start(fix)
+    return {"message": "Reconciliation started"}
+
+
+@stats_router.get("/reconcile")
+async def reconcile_status(token_data: dict = Depends(admin_only)):
+    """Progress of the running reconciliation and the last report (admin only)"""
+    return {
+        "running": RECONCILER.running,
+        "progress": RECONCILER.progress,
+        "report": RECONCILER.report,
+    }
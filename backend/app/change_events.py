@@ -0,0 +1,221 @@
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+from fastapi.responses import StreamingResponse
+from typing import Optional, Set
+from auth_routes import (
+    admin_only,
+    get_bearer_token,
+    issue_scoped_token,
+    resolve_scoped_token,
+    resolve_token,
+)
+import asyncio
+import json
+import os
+import time
+
+events_router = APIRouter()
+
+# Events buffered per connection before the client is told to resync
+BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "100"))
+
+# Concurrent event streams per worker
+MAX_CONNECTIONS = int(os.getenv("EVENTS_MAX_CONNECTIONS", "1000"))
+
+# Comment line sent on idle streams so proxies keep them open
+HEARTBEAT_SECONDS = 15
+
+# Scope of the tickets EventSource passes in the URL instead of the session token
+STREAM_SCOPE = "events"
+
+
+class Subscriber:
+    """One connected client with a bounded event buffer."""
+
+    def __init__(self, uid: str, is_admin: bool, restaurant_id: Optional[str]):
+        self.uid = uid
+        self.is_admin = is_admin
+        self.restaurant_id = restaurant_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=BUFFER_SIZE)
+        self.overflows = 0
+
+    def wants(self, event: dict) -> bool:
+        # Same rule as the REST routes: owners see their restaurants, admins see all
+        if not self.is_admin and event.get("owner_uid") != self.uid:
+            return False
+        return self.restaurant_id is None or event.get("restaurant_id") == self.restaurant_id
+
+    def offer(self, event: dict):
+        if self.queue.full():
+            # Slow consumer: drop what it has not read and ask it to refetch
+            self.overflows += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+            return
+        self.queue.put_nowait(event)
+
+
+class EventBroker:
+    """Fans change events out to connected clients on this worker."""
+
+    def __init__(self):
+        self._subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+
+    def subscribe(self, uid: str, is_admin: bool, restaurant_id: Optional[str]) -> Subscriber:
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(uid, is_admin, restaurant_id)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def publish(self, event: dict):
+        """Deliver an event to every interested subscriber; never blocks"""
+        if not self._subscribers or self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(event)
+        elif not self._loop.is_closed():
+            # Called from a threadpool worker (sync route or DB helper)
+            self._loop.call_soon_threadsafe(self._deliver, event)
+
+    def _deliver(self, event: dict):
+        self.published += 1
+        for subscriber in list(self._subscribers):
+            if subscriber.wants(event):
+                subscriber.offer(event)
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._subscribers),
+            "published": self.published,
+            "overflows": sum(s.overflows for s in self._subscribers),
+        }
+
+
+BROKER = EventBroker()
+
+
+def publish_menu_event(
+    restaurant_id: str,
+    owner_uid: Optional[str],
+    op: str,
+    menu_item_id: str,
+    item: Optional[dict] = None,
+    seq: Optional[int] = None,
+):
+    event = {
+        "type": "menu",
+        "op": op,
+        "restaurant_id": restaurant_id,
+        "owner_uid": owner_uid,
+        "item_id": menu_item_id,
+        "seq": seq,
+    }
+    if item is not None:
+        event["item"] = item
+    BROKER.publish(event)
+
+
+def publish_restaurant_event(
+    restaurant_id: str, owner_uid: Optional[str], op: str, restaurant: Optional[dict] = None
+):
+    event = {
+        "type": "restaurant",
+        "op": op,
+        "restaurant_id": restaurant_id,
+        "owner_uid": owner_uid,
+    }
+    if restaurant is not None:
+        event["restaurant"] = restaurant
+    BROKER.publish(event)
+
+
+def format_sse(event: dict) -> str:
+    # owner_uid is only used for routing
+    payload = {k: v for k, v in event.items() if k != "owner_uid"}
+    return f"event: {event['type']}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+@events_router.post("/ticket")
+async def stream_ticket(request: Request):
+    """A ticket for opening an event stream, valid for a few seconds"""
+    session_token = get_bearer_token(request)
+    token_data = resolve_token(session_token)
+    return {"ticket": issue_scoped_token(session_token, token_data, STREAM_SCOPE)}
+
+
+@events_router.get("/stream")
+async def stream_events(
+    request: Request,
+    restaurant_id: Optional[str] = None,
+    ticket: Optional[str] = None,
+):
+    """Server-Sent Events stream of menu and restaurant changes.
+
+    EventSource cannot set headers, so it passes ``?ticket=`` from
+    ``POST /events/ticket`` instead. URLs end up in access logs, which is why
+    the session token itself is not accepted there.
+    """
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        token_data = resolve_token(auth_header.split("Bearer ")[1])
+    elif ticket:
+        token_data = resolve_scoped_token(ticket, STREAM_SCOPE)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing or invalid authorization header",
+        )
+
+    if len(BROKER._subscribers) >= MAX_CONNECTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many event streams, try again later",
+            headers={"Retry-After": "30"},
+        )
+
+    subscriber = BROKER.subscribe(
+        token_data["uid"], bool(token_data.get("is_admin", False)), restaurant_id
+    )
+    # Signed tokens expire; the client reconnects with a refreshed one
+    expires_at = token_data.get("exp")
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if await request.is_disconnected():
+                    break
+                if expires_at and time.time() >= expires_at:
+                    yield format_sse({"type": "expired"})
+                    break
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.queue.get(), HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            BROKER.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@events_router.get("/stats")
+async def event_stats(token_data: dict = Depends(admin_only)):
+    """Open streams and delivery counters for this worker (admin only)"""
+    return BROKER.stats()
@@ -0,0 +1,100 @@
+"""Local stand-in for the google-generativeai SDK.
+
+Set ``GEMINI_FAKE_MODELS`` to use it instead of the real SDK, e.g.::
+
+    GEMINI_FAKE_MODELS="fast-model=ok,slow-model=slow:8,broken-model=fail"
+
+Each model is ``ok`` (answers immediately), ``slow:<seconds>`` (answers after
+the delay) or ``fail`` (raises). Models are listed in the given order and any
+other model name fails as unknown. Responses flag every allergen id that
+appears in the ingredient text.
+"""
+from types import SimpleNamespace
+from typing import Dict, Optional
+import json
+import re
+import time
+
+ALLERGEN_WORDS = {
+    "milk": "milk",
+    "butter": "milk",
+    "cheese": "milk",
+    "cream": "milk",
+    "egg": "eggs",
+    "eggs": "eggs",
+    "fish": "fish",
+    "almond": "tree_nuts",
+    "walnut": "tree_nuts",
+    "wheat": "wheat",
+    "flour": "wheat",
+    "shrimp": "shellfish",
+    "peanut": "peanuts",
+    "peanuts": "peanuts",
+    "soy": "soybeans",
+    "sesame": "sesame",
+}
+
+
+def parse_behaviors(spec: str) -> Dict[str, str]:
+    behaviors = {}
+    for entry in spec.split(","):
+        if "=" in entry:
+            name, behavior = entry.split("=", 1)
+            behaviors[name.strip()] = behavior.strip()
+    return behaviors
+
+
+class FakeGenAI:
+    """Module-like object exposing the subset of the SDK the backend uses"""
+
+    def __init__(self, behaviors: Dict[str, str]):
+        self.behaviors = behaviors
+        self.calls = []
+
+    def configure(self, api_key: Optional[str] = None):
+        pass
+
+    def list_models(self):
+        return [
+            SimpleNamespace(name=name, supported_generation_methods=["generateContent"])
+            for name in self.behaviors
+        ]
+
+    def GenerativeModel(self, model_name: str, generation_config=None):
+        return FakeModel(self, model_name)
+
+
+class FakeModel:
+    def __init__(self, genai: FakeGenAI, model_name: str):
+        self.genai = genai
+        self.model_name = model_name
+
+    def generate_content(self, prompt: str, request_options=None):
+        self.genai.calls.append(self.model_name)
+        behavior = self.genai.behaviors.get(self.model_name)
+        if behavior is None:
+            raise ValueError(f"404 Model {self.model_name} not found")
+        if behavior == "fail":
+            raise RuntimeError(f"500 Model {self.model_name} failed")
+        if behavior.startswith("slow:"):
+            delay = float(behavior.split(":", 1)[1])
+            timeout = (request_options or {}).get("timeout")
+            if timeout is not None and delay > timeout:
+                time.sleep(timeout)
+                raise TimeoutError(f"Model {self.model_name} timed out")
+            time.sleep(delay)
+
+        text = prompt.rsplit("Text:", 1)[-1].lower()
+        words = set(re.findall(r"[a-z]+", text))
+        allergens = sorted({a for word, a in ALLERGEN_WORDS.items() if word in words})
+        return SimpleNamespace(
+            text=json.dumps(
+                {
+                    "allergens": allergens,
+                    "dietaryCategories": [],
+                    "extractedIngredients": [
+                        part.strip() for part in text.split(",") if part.strip()
+                    ],
+                }
+            )
+        )
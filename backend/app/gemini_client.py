@@ -0,0 +1,265 @@
+from fastapi import HTTPException
+from typing import Dict, List, Optional
+import asyncio
+import os
+import time
+
+# Fallback models in case discovery fails
+FALLBACK_MODELS = [
+    "gemini-1.5-flash-001",
+    "gemini-1.5-flash",
+    "gemini-1.5-flash-latest",
+    "gemini-1.5-flash-002",
+    "gemini-1.5-pro",
+    "gemini-1.0-pro",
+    "gemini-pro",
+]
+
+# How long a successful model discovery is reused
+DISCOVERY_TTL_SECONDS = 600
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+class CircuitBreaker:
+    """Stops sending traffic to a model after repeated failures.
+
+    After ``threshold`` consecutive failures the breaker opens for
+    ``cooldown`` seconds, then lets a single trial request through
+    (half-open). A success closes it again; a failed trial reopens it.
+
+    ``allow`` returns a ticket that is passed back with the outcome, so only
+    the call that holds the trial can end it. Calls let through before the
+    breaker opened can still finish or be cancelled during the trial.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # Ticket of the half-open trial call, if one is in flight
+        self.trial: Optional[object] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> Optional[object]:
+        """A ticket for a call that may go ahead, or None if it is blocked"""
+        state = self.state
+        if state == "closed":
+            return object()
+        if state == "half_open" and self.trial is None:
+            self.trial = object()
+            return self.trial
+        return None
+
+    def record_success(self, ticket: object):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = None
+
+    def record_failure(self, ticket: object):
+        self.failures += 1
+        if ticket is self.trial:
+            # A failed trial reopens the breaker for another cooldown
+            self.trial = None
+            self.opened_at = time.monotonic()
+        elif self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+    def release(self, ticket: object):
+        """Forget a call that was cancelled before it finished"""
+        if ticket is self.trial:
+            self.trial = None
+
+
+class GeminiClient:
+    """Calls Gemini models under a total deadline with hedged attempts.
+
+    Each attempt gets its own timeout. If the first attempt has not finished
+    after ``hedge_delay`` seconds, the next-best model is tried in parallel and
+    the first success wins; the slower attempt is abandoned. A per-model
+    circuit breaker skips models that keep failing.
+    """
+
+    def __init__(
+        self,
+        genai,
+        preferred_model: Optional[str] = None,
+        deadline: float = 30.0,
+        attempt_timeout: float = 15.0,
+        hedge_delay: float = 4.0,
+        breaker_threshold: int = 3,
+        breaker_cooldown: float = 60.0,
+    ):
+        self.genai = genai
+        self.preferred_model = preferred_model
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.hedge_delay = hedge_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._discovered: Optional[List[str]] = None
+        self._discovered_at = 0.0
+
+    @classmethod
+    def from_env(cls, genai) -> "GeminiClient":
+        return cls(
+            genai,
+            preferred_model=os.getenv("GEMINI_MODEL"),
+            deadline=_env_float("GEMINI_DEADLINE_SECONDS", 30.0),
+            attempt_timeout=_env_float("GEMINI_ATTEMPT_TIMEOUT_SECONDS", 15.0),
+            hedge_delay=_env_float("GEMINI_HEDGE_DELAY_SECONDS", 4.0),
+            breaker_threshold=int(_env_float("GEMINI_BREAKER_THRESHOLD", 3)),
+            breaker_cooldown=_env_float("GEMINI_BREAKER_COOLDOWN_SECONDS", 60.0),
+        )
+
+    def breaker(self, model_name: str) -> CircuitBreaker:
+        if model_name not in self.breakers:
+            self.breakers[model_name] = CircuitBreaker(
+                self.breaker_threshold, self.breaker_cooldown
+            )
+        return self.breakers[model_name]
+
+    def breaker_states(self) -> Dict[str, str]:
+        return {name: breaker.state for name, breaker in self.breakers.items()}
+
+    def _discover_models(self) -> List[str]:
+        discovered = [
+            m.name
+            for m in self.genai.list_models()
+            if getattr(m, "supported_generation_methods", None)
+            and "generateContent" in m.supported_generation_methods
+        ]
+        # Simple preference ordering: flash/pro, 1.5 > 1.0 > others
+        preference = ["1.5", "flash", "pro"]
+        return sorted(
+            discovered,
+            key=lambda n: (0 if any(p in n for p in preference) else 1, n),
+        )
+
+    async def candidate_models(self) -> List[str]:
+        """Env override first, then discovered models, then fallbacks"""
+        now = time.monotonic()
+        if self._discovered is None or now - self._discovered_at > DISCOVERY_TTL_SECONDS:
+            loop = asyncio.get_running_loop()
+            try:
+                self._discovered = await asyncio.wait_for(
+                    loop.run_in_executor(None, self._discover_models),
+                    self.attempt_timeout,
+                )
+                self._discovered_at = now
+            except Exception:
+                self._discovered = self._discovered or []
+
+        candidates: List[str] = []
+        for name in [self.preferred_model, *self._discovered, *FALLBACK_MODELS]:
+            if name and name not in candidates:
+                candidates.append(name)
+        return candidates
+
+    def _generate(self, model_name: str, prompt: str, timeout: float) -> str:
+        """Blocking SDK call; runs in a worker thread"""
+        model = self.genai.GenerativeModel(
+            model_name=model_name,
+            generation_config={
+                "temperature": 0,
+                "response_mime_type": "application/json",
+            },
+        )
+        response = model.generate_content(prompt, request_options={"timeout": timeout})
+        text = getattr(response, "text", None) if response else None
+        if not text:
+            raise ValueError(f"Model {model_name} returned an empty response")
+        return text
+
+    async def generate(self, prompt: str) -> str:
+        """Return the text of the first successful model response"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        candidates = iter(await self.candidate_models())
+        # attempt -> (model name, breaker ticket)
+        attempts: Dict[asyncio.Future, tuple] = {}
+        last_error: Optional[Exception] = None
+
+        def launch() -> bool:
+            # Start the next candidate whose breaker allows traffic
+            for model_name in candidates:
+                ticket = self.breaker(model_name).allow()
+                if ticket is None:
+                    continue
+                timeout = min(self.attempt_timeout, deadline - loop.time())
+                attempt = asyncio.ensure_future(
+                    asyncio.wait_for(
+                        loop.run_in_executor(
+                            None, self._generate, model_name, prompt, timeout
+                        ),
+                        timeout,
+                    )
+                )
+                # Abandoned attempts may still fail; don't log them as unretrieved
+                attempt.add_done_callback(
+                    lambda done: done.cancelled() or done.exception()
+                )
+                attempts[attempt] = (model_name, ticket)
+                return True
+            return False
+
+        try:
+            launch()
+            while attempts:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+
+                # With a single attempt in flight, wait at most the hedge delay
+                wait = min(remaining, self.hedge_delay) if len(attempts) == 1 else remaining
+                done, _ = await asyncio.wait(
+                    attempts, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Hedge: send the same prompt to the next-best model
+                    if len(attempts) == 1:
+                        launch()
+                    continue
+
+                for attempt in done:
+                    model_name, ticket = attempts.pop(attempt)
+                    try:
+                        text = attempt.result()
+                    except Exception as e:
+                        self.breaker(model_name).record_failure(ticket)
+                        last_error = e
+                        continue
+                    self.breaker(model_name).record_success(ticket)
+                    return text
+
+                # A failed attempt frees its slot for the next candidate
+                if not attempts and not launch():
+                    break
+        finally:
+            # Abandon attempts that lost the race or ran out of time
+            for attempt, (model_name, ticket) in attempts.items():
+                attempt.cancel()
+                self.breaker(model_name).release(ticket)
+
+        if loop.time() >= deadline:
+            raise HTTPException(
+                status_code=504, detail="AI model did not respond in time"
+            )
+        err_msg = "Model not available or failed to generate. "
+        if last_error:
+            err_msg += str(last_error)
+        else:
+            err_msg += "All models are temporarily disabled after repeated failures."
+        raise HTTPException(status_code=503, detail=err_msg)
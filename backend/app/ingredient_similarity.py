@@ -0,0 +1,313 @@
+"""Reuse AI parse results for near-duplicate ingredient lists.
+
+Franchise and chain menus repeat the same ingredient lists with small
+differences: reordered items, different punctuation or case, an "organic"
+prefix, one ingredient dropped. Each list is canonicalized into a set of
+ingredient phrases. A MinHash signature with LSH banding finds earlier
+lists with a Jaccard similarity of at least the threshold, and exact
+similarity is then checked on the candidates.
+
+Reuse is conservative. A result is only reused when the matching lists
+together contain every phrase of the new list. Allergens from all matches
+are combined (union) and dietary categories must hold for all of them
+(intersection), so a merged result can over-report an allergen but never
+drops one that a match reported.
+
+Persisted lists expire after ``AI_REUSE_PERSIST_TTL_DAYS``. Expired lists
+are deleted when a worker loads the index and then periodically, so
+``ai_parse_results`` does not grow without bound. The purge queries by
+``ts``, which needs ``".indexOn": "ts"`` in the database rules.
+"""
+from firebase_admin import db
+from fastapi.concurrency import run_in_threadpool
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional
+from paging import iter_children
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+
+# Firebase path holding parsed lists (canonical phrases and result)
+RESULTS_PATH = "ai_parse_results"
+
+NUM_PERMUTATIONS = 64
+BANDS = 16  # 4 rows per band: lists at 0.9 similarity collide with near certainty
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+# Parentheses split sub-ingredient lists: "flour (wheat flour, niacin)"
+SEPARATORS = re.compile(r"[,;:()\[\]{}\n]|\.(?!\d)|\band\b|\bwith\b")
+PERCENTAGES = re.compile(r"(less than\s*)?\d+(\.\d+)?\s*%(\s*or less)?(\s*of)?")
+WORDS = re.compile(r"[^\W_]+")
+
+# Words that do not change what an ingredient is
+IGNORED_WORDS = {"organic", "the", "a", "an"}
+
+# Phrases that only introduce a list
+IGNORED_PHRASES = {"ingredients", "ingredient", "contains", "contains less than", ""}
+
+
+def canonical_tokens(ingredients: str) -> FrozenSet[str]:
+    """Set of normalized ingredient phrases, ignoring order, case and punctuation"""
+    text = PERCENTAGES.sub(" ", (ingredients or "").lower())
+    tokens = set()
+    for part in SEPARATORS.split(text):
+        words = [w for w in WORDS.findall(part) if w not in IGNORED_WORDS]
+        phrase = " ".join(words)
+        if phrase not in IGNORED_PHRASES:
+            tokens.add(phrase)
+    return frozenset(tokens)
+
+
+def tokens_key(tokens: FrozenSet[str]) -> str:
+    return hashlib.sha256("\n".join(sorted(tokens)).encode("utf-8")).hexdigest()
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _permutations(count: int) -> List[tuple]:
+    # Fixed seed so signatures are comparable across workers and restarts
+    seeds = []
+    for i in range(count):
+        digest = hashlib.sha256(f"minhash-{i}".encode("ascii")).digest()
+        a = int.from_bytes(digest[:8], "big") % (MERSENNE_PRIME - 1) + 1
+        b = int.from_bytes(digest[8:16], "big") % MERSENNE_PRIME
+        seeds.append((a, b))
+    return seeds
+
+
+PERMUTATIONS = _permutations(NUM_PERMUTATIONS)
+
+
+def minhash(tokens: FrozenSet[str]) -> tuple:
+    hashes = [_token_hash(t) for t in tokens]
+    return tuple(
+        min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in PERMUTATIONS
+    )
+
+
+def merge_results(results: List[dict], tokens: FrozenSet[str]) -> dict:
+    """Combine results of lists that together cover ``tokens``"""
+    allergens: List[str] = []
+    for result in results:
+        for allergen in result.get("allergens", []):
+            if allergen not in allergens:
+                allergens.append(allergen)
+
+    dietary = [
+        category
+        for category in results[0].get("dietaryCategories", [])
+        if all(category in r.get("dietaryCategories", []) for r in results[1:])
+    ]
+
+    # Keep extracted ingredients that appear in the new list
+    extracted: List[str] = []
+    seen = set()
+    for result in results:
+        for ingredient in result.get("extractedIngredients", []) or []:
+            phrases = canonical_tokens(str(ingredient))
+            if phrases and phrases <= tokens and not phrases <= seen:
+                seen |= phrases
+                extracted.append(ingredient)
+
+    return {
+        "allergens": allergens,
+        "dietaryCategories": dietary,
+        "extractedIngredients": extracted or sorted(tokens),
+    }
+
+
+class SimilarParseIndex:
+    """In-memory LSH index of parsed ingredient lists, with LRU eviction."""
+
+    def __init__(self, threshold: float, max_entries: int, persist_ttl_seconds: int = 0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.persist_ttl_seconds = persist_ttl_seconds  # 0 keeps persisted lists forever
+        self.rows = NUM_PERMUTATIONS // BANDS
+        self.exact_hits = 0
+        self.merged_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._buckets: List[Dict[tuple, set]] = [{} for _ in range(BANDS)]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SimilarParseIndex":
+        return cls(
+            threshold=float(os.getenv("AI_REUSE_THRESHOLD", "0.9")),
+            max_entries=int(os.getenv("AI_REUSE_MAX_ENTRIES", "5000")),
+            persist_ttl_seconds=int(float(os.getenv("AI_REUSE_PERSIST_TTL_DAYS", "90")) * 86400),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold <= 1.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _bands(self, signature: tuple) -> List[tuple]:
+        return [
+            signature[i * self.rows : (i + 1) * self.rows] for i in range(BANDS)
+        ]
+
+    def _insert(self, tokens: FrozenSet[str], result: dict):
+        key = tokens_key(tokens)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        signature = minhash(tokens)
+        self._entries[key] = (tokens, result, signature)
+        for buckets, band in zip(self._buckets, self._bands(signature)):
+            buckets.setdefault(band, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            old_key, (_, _, old_signature) = self._entries.popitem(last=False)
+            for buckets, band in zip(self._buckets, self._bands(old_signature)):
+                bucket = buckets.get(band)
+                if bucket is not None:
+                    bucket.discard(old_key)
+                    if not bucket:
+                        del buckets[band]
+
+    def add(self, ingredients: str, result: dict) -> Optional[FrozenSet[str]]:
+        """Remember a validated parse result; returns the canonical tokens"""
+        tokens = canonical_tokens(ingredients)
+        if not self.enabled or not tokens:
+            return None
+        with self._lock:
+            self._insert(tokens, result)
+        return tokens
+
+    def lookup(self, ingredients: str) -> Optional[dict]:
+        """A reusable result for this list, or None if the model must be asked"""
+        if not self.enabled:
+            return None
+        tokens = canonical_tokens(ingredients)
+        if not tokens:
+            return None
+
+        key = tokens_key(tokens)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return dict(entry[1])
+
+            candidates = set()
+            for buckets, band in zip(self._buckets, self._bands(minhash(tokens))):
+                candidates |= buckets.get(band, set())
+            scored = sorted(
+                (
+                    (jaccard(tokens, self._entries[key][0]), key)
+                    for key in candidates
+                ),
+                reverse=True,
+            )
+
+            # Take the closest matches until they cover every phrase
+            covered = set()
+            used = []
+            for similarity, key in scored:
+                if similarity < self.threshold:
+                    break
+                match_tokens = self._entries[key][0]
+                if match_tokens & (tokens - covered):
+                    used.append(self._entries[key][1])
+                    covered |= match_tokens
+                if tokens <= covered:
+                    break
+
+            if not used or not tokens <= covered:
+                self.misses += 1
+                return None
+            self.merged_hits += 1
+        return merge_results(used, tokens)
+
+    def persist(self, tokens: FrozenSet[str], result: dict):
+        """Store a parsed list so other workers can load it"""
+        try:
+            db.reference(f"{RESULTS_PATH}/{tokens_key(tokens)}").set(
+                {"tokens": sorted(tokens), "result": result, "ts": int(time.time())}
+            )
+        except Exception as e:
+            print(f"Error saving AI parse result: {str(e)}")
+
+    def _expiry_cutoff(self) -> Optional[int]:
+        """Lists persisted before this time have expired, or None if they never do"""
+        if self.persist_ttl_seconds <= 0:
+            return None
+        return int(time.time()) - self.persist_ttl_seconds
+
+    def purge_persisted(self, page_size: int = 500) -> int:
+        """Delete expired persisted lists; returns how many were deleted"""
+        cutoff = self._expiry_cutoff()
+        if cutoff is None:
+            return 0
+        ref = db.reference(RESULTS_PATH)
+        purged = 0
+        while True:
+            # Entries without ts sort first, so old entries are purged too
+            expired = ref.order_by_child("ts").end_at(cutoff - 1).limit_to_first(page_size).get() or {}
+            if not expired:
+                break
+            ref.update({key: None for key in expired})
+            purged += len(expired)
+            if len(expired) < page_size:
+                break
+        if purged:
+            print(f"Purged {purged} expired parsed ingredient lists")
+        return purged
+
+    async def run_purge_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await run_in_threadpool(self.purge_persisted)
+            except Exception as e:
+                print(f"Error purging parsed ingredient lists: {e}")
+
+    def load_persisted(self, page_size: int = 500):
+        """Fill the index from lists parsed earlier by any worker"""
+        try:
+            self.purge_persisted(page_size)
+        except Exception as e:
+            print(f"Error purging parsed ingredient lists: {e}")
+        cutoff = self._expiry_cutoff()
+        loaded = 0
+        for _, entry in iter_children(RESULTS_PATH, page_size):
+            if loaded >= self.max_entries:
+                break
+            if not isinstance(entry, dict) or not entry.get("tokens"):
+                continue
+            if cutoff is not None and entry.get("ts", 0) < cutoff:
+                continue
+            # Firebase drops empty lists, so restore the fields a parse result always has
+            result = {"allergens": [], "dietaryCategories": [], "extractedIngredients": []}
+            result.update(entry.get("result") or {})
+            with self._lock:
+                self._insert(frozenset(entry["tokens"]), result)
+            loaded += 1
+        print(f"Loaded {loaded} parsed ingredient lists for reuse")
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.merged_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "exact_hits": self.exact_hits,
+            "merged_hits": self.merged_hits,
+            "misses": self.misses,
+            "reuse_rate": round((self.exact_hits + self.merged_hits) / lookups, 4) if lookups else None,
+        }
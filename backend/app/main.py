@@ -1,36 +1,34 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 import firebase_admin
-from firebase_admin import credentials, db
+from firebase_admin import credentials
+from dotenv import load_dotenv
+import asyncio
+import json
 import os
-from auth_routes import auth_router
+import time
 
-app = FastAPI()
-app.include_router(auth_router, prefix="/auth")
-
-origins = [
-    "http://localhost:3000",    # React app
-    "http://localhost:8000",    # FastAPI backend
-    "https://restaurant-allergy-manager.onrender.com" # Render app
-]
+# Local modules read their configuration from the environment at import time
+load_dotenv()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
-    expose_headers=["*"],
-    max_age=600,
-)
+from auth_routes import auth_router
+from profiling import profiling_router, ProfilingMiddleware
+from ai_jobs import jobs_router, AI_JOBS
+from change_events import events_router
+from admission import admission_router, AdmissionMiddleware
+from write_behind import write_behind_router, WRITE_BEHIND
+from catalog_stats import stats_router
+from reclassify import reclassify_router
+from menu_views import menu_views_router
+from ai_parser import SIMILAR_PARSES
+from session_tokens import SIGNER, REVOCATIONS
 
-import os
-import json
-from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials
+# Firebase readiness, reported by /readyz
+FIREBASE_STATE = {"ready": False, "error": None, "init_seconds": None}
 
-load_dotenv()
 
 def initialize_firebase():
     try:
@@ -38,26 +36,103 @@ def initialize_firebase():
         cred_json = os.getenv('FIREBASE_CREDENTIALS')
         if not cred_json:
             raise ValueError("FIREBASE_CREDENTIALS not found in environment")
-            
+
         # Parse the JSON string into a dictionary
         cred_dict = json.loads(cred_json)
-        
+
         # Get database URL from environment
         database_url = os.getenv('DATABASE_URL')
         if not database_url:
             raise ValueError("DATABASE_URL not found in environment")
-            
+
         # Initialize Firebase
         firebase_admin.initialize_app(credentials.Certificate(cred_dict), {
             'databaseURL': database_url
         })
+        FIREBASE_STATE["ready"] = True
+        FIREBASE_STATE["error"] = None
         print("Firebase initialized successfully")
     except Exception as e:
+        FIREBASE_STATE["error"] = str(e)
         print(f"Firebase initialization error: {e}")
         import traceback
         traceback.print_exc()
 
-initialize_firebase()
+
+async def initialize_firebase_in_background():
+    """Initialize Firebase off the event loop so liveness checks answer immediately"""
+    started = time.perf_counter()
+    await run_in_threadpool(initialize_firebase)
+    FIREBASE_STATE["init_seconds"] = round(time.perf_counter() - started, 3)
+
+    if FIREBASE_STATE["ready"] and SIMILAR_PARSES.enabled:
+        # Reuse ingredient lists parsed by earlier runs and other workers
+        try:
+            await run_in_threadpool(SIMILAR_PARSES.load_persisted)
+        except Exception as e:
+            print(f"Error loading parsed ingredient lists: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_task = asyncio.create_task(initialize_firebase_in_background())
+    await AI_JOBS.start()
+    if WRITE_BEHIND.enabled:
+        # Adopts journals of exited workers; their writes are replayed before the first flush
+        await WRITE_BEHIND.start()
+    background_tasks = []
+    if SIGNER is not None:
+        # Keep the signed-token deny-list in sync with other workers
+        interval = float(os.getenv("SESSION_REVOCATION_SYNC_SECONDS", "15"))
+        background_tasks.append(asyncio.create_task(REVOCATIONS.run_sync_loop(interval)))
+    if SIMILAR_PARSES.enabled and SIMILAR_PARSES.persist_ttl_seconds > 0:
+        # Delete expired parse results; each worker also purges when it loads them
+        interval = float(os.getenv("AI_REUSE_PURGE_INTERVAL_SECONDS", "86400"))
+        background_tasks.append(asyncio.create_task(SIMILAR_PARSES.run_purge_loop(interval)))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await AI_JOBS.stop()
+    if WRITE_BEHIND.enabled:
+        await WRITE_BEHIND.stop()
+    if not init_task.done():
+        init_task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(auth_router, prefix="/auth")
+app.include_router(profiling_router, prefix="/admin/profiling")
+app.include_router(admission_router, prefix="/admin/admission")
+app.include_router(write_behind_router, prefix="/admin/write-behind")
+app.include_router(stats_router, prefix="/admin/stats")
+app.include_router(reclassify_router, prefix="/admin/reclassify")
+app.include_router(menu_views_router, prefix="/admin/menu-views")
+app.include_router(jobs_router, prefix="/ai/jobs")
+app.include_router(events_router, prefix="/events")
+
+origins = [
+    "http://localhost:3000",    # React app
+    "http://localhost:8000",    # FastAPI backend
+    "https://restaurant-allergy-manager.onrender.com" # Render app
+]
+
+# Per-class concurrency limits; added before CORS so shed responses still
+# carry CORS headers
+app.add_middleware(AdmissionMiddleware)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+    allow_headers=["*"],
+    expose_headers=["*"],
+    max_age=600,
+)
+
+# On-demand request profiling; a no-op unless an admin starts a window
+app.add_middleware(ProfilingMiddleware)
+
 # Import and include your router
 from routes import router
 app.include_router(router)
@@ -66,7 +141,29 @@ app.include_router(router)
 async def root():
     return {"message": "Restaurant Allergy Manager API"}
 
+@app.get("/healthz")
+async def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness probe: Firebase is initialized and requests can be served"""
+    if not FIREBASE_STATE["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "error": FIREBASE_STATE["error"]},
+        )
+    # A worker that can't sync revocations would accept logged-out tokens
+    revocation_problem = REVOCATIONS.problem() if SIGNER is not None else None
+    if revocation_problem is not None:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "degraded", "error": revocation_problem},
+        )
+    return {"status": "ready", "init_seconds": FIREBASE_STATE["init_seconds"]}
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 10000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=port)
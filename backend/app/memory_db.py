@@ -0,0 +1,295 @@
+"""In-memory stand-in for the Firebase Realtime Database.
+
+Implements the part of ``firebase_admin.db`` this backend uses: references,
+get (including shallow), set, update (multi-path), delete, transaction,
+the ``increment`` and ``timestamp`` server values, and ordered queries with
+equal_to/start_at/end_at/limit_to_first/limit_to_last.
+Ordering follows Firebase: by key, 32-bit integer keys first; by child or
+value, null < false < true < numbers < strings < objects, ties by key.
+
+Every operation is one round trip, except a transaction, which is two (a
+read with its ETag, then a conditional write) as with Firebase. The number of nodes each read downloads
+is counted as well, which is what the round-trip budget tests and the
+snapshot tool's ``--memory`` mode rely on. ``install()`` points
+``firebase_admin.db.reference`` at a database.
+"""
+from firebase_admin import db
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from paging import key_order
+import copy
+import threading
+import time
+
+
+def split_path(path: str) -> List[str]:
+    return [part for part in (path or "").strip("/").split("/") if part]
+
+
+def count_nodes(value: Any) -> int:
+    """Nodes in a JSON tree: every child at any depth, or 1 for a scalar"""
+    if value is None:
+        return 0
+    if isinstance(value, dict):
+        return sum(1 + (count_nodes(v) if isinstance(v, (dict, list)) else 0) for v in value.values())
+    if isinstance(value, list):
+        return sum(1 + (count_nodes(v) if isinstance(v, (dict, list)) else 0) for v in value)
+    return 1
+
+
+def value_order(value: Any) -> tuple:
+    """Sort key for child/value ordering"""
+    if value is None:
+        return (0, 0)
+    if value is False:
+        return (1, 0)
+    if value is True:
+        return (2, 0)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, 0)
+
+
+def prune(value: Any) -> Any:
+    """Drop empty containers and nulls, as Firebase does when storing"""
+    if isinstance(value, list):
+        value = {str(i): v for i, v in enumerate(value)}
+    if isinstance(value, dict):
+        pruned = {}
+        for key, child in value.items():
+            child = prune(child)
+            if child is not None:
+                pruned[str(key)] = child
+        return pruned or None
+    return value
+
+
+def resolve_server_values(value: Any, current: Any) -> Any:
+    """Replace ``{".sv": ...}`` placeholders in ``value``, given the stored ``current``"""
+    if not isinstance(value, dict):
+        return value
+    server_value = value.get(".sv")
+    if isinstance(server_value, dict) and "increment" in server_value:
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + server_value["increment"]
+    if server_value == "timestamp":
+        return int(time.time() * 1000)
+    current = current if isinstance(current, dict) else {}
+    return {key: resolve_server_values(child, current.get(key)) for key, child in value.items()}
+
+
+def restore_lists(value: Any) -> Any:
+    """Return dicts keyed 0..n-1 as lists, as the Firebase SDK does"""
+    if isinstance(value, dict):
+        value = {k: restore_lists(v) for k, v in value.items()}
+        keys = list(value)
+        if keys and all(k.isdigit() for k in keys) and sorted(int(k) for k in keys) == list(range(len(keys))):
+            return [value[str(i)] for i in range(len(keys))]
+    return value
+
+
+class MemoryDatabase:
+    """A JSON tree with Firebase-like references and per-operation counters."""
+
+    def __init__(self, data: Optional[dict] = None):
+        self.data: dict = prune(copy.deepcopy(data)) or {}
+        self.calls: List[Tuple[str, str, int]] = []  # (operation, path, nodes downloaded)
+        self._lock = threading.RLock()
+
+    # Counters
+
+    @property
+    def round_trips(self) -> int:
+        return len(self.calls)
+
+    @property
+    def nodes_downloaded(self) -> int:
+        return sum(nodes for _, _, nodes in self.calls)
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls = []
+
+    def _record(self, operation: str, path: str, value: Any = None):
+        self.calls.append((operation, "/" + "/".join(split_path(path)), count_nodes(value)))
+
+    # Tree access
+
+    def _read(self, parts: List[str]) -> Any:
+        node = self.data
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _write(self, parts: List[str], value: Any):
+        value = prune(copy.deepcopy(value))
+        if not parts:
+            self.data = value if isinstance(value, dict) else {}
+            return
+        # Walk down, remembering parents so emptied nodes can be removed
+        node = self.data
+        trail = []
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[part] = {}
+            trail.append((node, part))
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+        for parent, part in reversed(trail):
+            if parent[part]:
+                break
+            del parent[part]
+
+    def reference(self, path: str = "/") -> "MemoryReference":
+        return MemoryReference(self, split_path(path))
+
+
+class MemoryQuery:
+    def __init__(self, ref: "MemoryReference", order_by: str):
+        self._ref = ref
+        self._order_by = order_by
+        self._equal = self._start = self._end = None
+        self._has_equal = self._has_start = self._has_end = False
+        self._first: Optional[int] = None
+        self._last: Optional[int] = None
+
+    def equal_to(self, value) -> "MemoryQuery":
+        self._equal, self._has_equal = value, True
+        return self
+
+    def start_at(self, value) -> "MemoryQuery":
+        self._start, self._has_start = value, True
+        return self
+
+    def end_at(self, value) -> "MemoryQuery":
+        self._end, self._has_end = value, True
+        return self
+
+    def limit_to_first(self, limit: int) -> "MemoryQuery":
+        self._first = limit
+        return self
+
+    def limit_to_last(self, limit: int) -> "MemoryQuery":
+        self._last = limit
+        return self
+
+    def _sort_key(self, key: str, value: Any) -> tuple:
+        if self._order_by == "$key":
+            return key_order(key)
+        if self._order_by == "$value":
+            return value_order(value) + key_order(key)
+        child = value
+        for part in split_path(self._order_by):
+            child = child.get(part) if isinstance(child, dict) else None
+        return value_order(child) + key_order(key)
+
+    def _bound(self, value) -> tuple:
+        return key_order(str(value)) if self._order_by == "$key" else value_order(value)
+
+    def get(self) -> dict:
+        database = self._ref._db
+        with database._lock:
+            children = database._read(self._ref._parts)
+            children = children if isinstance(children, dict) else {}
+            keyed = sorted(
+                ((self._sort_key(k, v), k, v) for k, v in children.items()),
+                key=lambda entry: entry[0],
+            )
+            selected = []
+            for sort_key, key, value in keyed:
+                ordered = sort_key[:2] if self._order_by != "$key" else sort_key
+                if self._has_equal and ordered != self._bound(self._equal):
+                    continue
+                if self._has_start and ordered < self._bound(self._start):
+                    continue
+                if self._has_end and ordered > self._bound(self._end):
+                    continue
+                selected.append((key, value))
+            if self._first is not None:
+                selected = selected[: self._first]
+            if self._last is not None:
+                selected = selected[-self._last :] if self._last else []
+            result = {key: restore_lists(copy.deepcopy(value)) for key, value in selected}
+            database._record("query", self._ref.path, result)
+            return result
+
+
+class MemoryReference:
+    def __init__(self, database: MemoryDatabase, parts: List[str]):
+        self._db = database
+        self._parts = parts
+
+    @property
+    def path(self) -> str:
+        return "/" + "/".join(self._parts)
+
+    @property
+    def key(self) -> Optional[str]:
+        return self._parts[-1] if self._parts else None
+
+    def child(self, path: str) -> "MemoryReference":
+        return MemoryReference(self._db, self._parts + split_path(path))
+
+    def get(self, etag: bool = False, shallow: bool = False) -> Any:
+        with self._db._lock:
+            value = self._db._read(self._parts)
+            if shallow and isinstance(value, dict):
+                value = {key: True for key in value}
+            else:
+                value = restore_lists(copy.deepcopy(value))
+            self._db._record("get", self.path, value)
+            return value
+
+    def set(self, value: Any):
+        with self._db._lock:
+            value = resolve_server_values(value, self._db._read(self._parts))
+            self._db._write(self._parts, value)
+            self._db._record("set", self.path)
+
+    def update(self, value: Dict[str, Any]):
+        with self._db._lock:
+            for path, child in value.items():
+                parts = self._parts + split_path(path)
+                self._db._write(parts, resolve_server_values(child, self._db._read(parts)))
+            self._db._record("update", self.path)
+
+    def delete(self):
+        with self._db._lock:
+            self._db._write(self._parts, None)
+            self._db._record("delete", self.path)
+
+    def transaction(self, transaction_update: Callable[[Any], Any]) -> Any:
+        with self._db._lock:
+            current = restore_lists(copy.deepcopy(self._db._read(self._parts)))
+            new_value = transaction_update(current)
+            self._db._write(self._parts, new_value)
+            # Firebase reads the value with its ETag, then writes it back
+            # conditionally: two round trips even when no retry is needed
+            self._db._record("transaction", self.path, current)
+            self._db._record("transaction_commit", self.path)
+            return new_value
+
+    def order_by_key(self) -> MemoryQuery:
+        return MemoryQuery(self, "$key")
+
+    def order_by_value(self) -> MemoryQuery:
+        return MemoryQuery(self, "$value")
+
+    def order_by_child(self, path: str) -> MemoryQuery:
+        return MemoryQuery(self, path)
+
+
+def install(database: Optional[MemoryDatabase] = None) -> MemoryDatabase:
+    """Route ``firebase_admin.db.reference`` to an in-memory database"""
+    database = database if database is not None else MemoryDatabase()
+    db.reference = lambda path="/", app=None, url=None: database.reference(path)
+    return database
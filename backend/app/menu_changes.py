@@ -0,0 +1,172 @@
+"""Per-restaurant menu change log for delta sync.
+
+Every menu write records an entry under ``menu_changes/{restaurant_id}/log``,
+keyed by a monotonically increasing sequence number: an upsert carries the
+full item, a delete is a tombstone. Clients remember the last sequence they
+saw and fetch only newer entries. The log keeps about MAX_LOG_ENTRIES recent
+entries; older ones are compacted away and ``floor`` records the oldest
+sequence still available, so clients that fall behind get a full snapshot.
+
+A sequence number is reserved before its entry is written, so with several
+writers entry N+1 can be committed before entry N. Readers therefore only
+advance to the end of the contiguous run of committed entries. A gap older
+than GAP_TIMEOUT_MS is a reservation whose write failed, and is skipped.
+"""
+from firebase_admin import db
+from typing import Dict, List, Optional, Tuple
+import os
+import time
+
+CHANGES_PATH = "menu_changes"
+
+# Entries kept per restaurant after compaction
+MAX_LOG_ENTRIES = int(os.getenv("MENU_CHANGE_LOG_MAX", "500"))
+
+# Compaction runs whenever the sequence crosses a multiple of this
+COMPACT_EVERY = 100
+
+# How long a reserved but unwritten sequence number holds up readers
+GAP_TIMEOUT_MS = int(os.getenv("MENU_CHANGE_GAP_TIMEOUT_MS", "30000"))
+
+# (op, menu_item_id, item data or None for deletes)
+Change = Tuple[str, str, Optional[dict]]
+
+
+def seq_key(seq: int) -> str:
+    """Zero-padded so Firebase key order matches numeric order"""
+    return f"{seq:012d}"
+
+
+def allocate_sequence(restaurant_id: str, count: int = 1) -> int:
+    """Reserve ``count`` sequence numbers and return the first one"""
+    last = db.reference(f"{CHANGES_PATH}/{restaurant_id}/seq").transaction(
+        lambda current: (current or 0) + count
+    )
+    return last - count + 1
+
+
+def compaction_updates(restaurant_id: str, last_seq: int) -> Dict[str, Optional[int]]:
+    """Null out log entries older than the retention window"""
+    new_floor = last_seq - MAX_LOG_ENTRIES + 1
+    if new_floor <= 1:
+        return {}
+    log_ref = db.reference(f"{CHANGES_PATH}/{restaurant_id}/log")
+    stale = log_ref.order_by_key().end_at(seq_key(new_floor - 1)).get() or {}
+    updates = {f"{CHANGES_PATH}/{restaurant_id}/log/{key}": None for key in stale}
+    updates[f"{CHANGES_PATH}/{restaurant_id}/floor"] = new_floor
+    return updates
+
+
+def record_changes(restaurant_id: str, changes: List[Change], updates: dict) -> int:
+    """Add log entries for ``changes`` to a pending multi-path ``updates`` dict.
+
+    Returns the last sequence number used. The caller commits ``updates`` with
+    a single ``db.reference("/").update(...)`` so data and log stay together.
+    """
+    first_seq = allocate_sequence(restaurant_id, len(changes))
+    now = int(time.time() * 1000)
+    for offset, (op, menu_item_id, item) in enumerate(changes):
+        seq = first_seq + offset
+        entry = {"seq": seq, "op": op, "item_id": menu_item_id, "ts": now}
+        if op == "upsert":
+            entry["item"] = item
+        updates[f"{CHANGES_PATH}/{restaurant_id}/log/{seq_key(seq)}"] = entry
+
+    last_seq = first_seq + len(changes) - 1
+    # Written in the same update as the data, unlike the reserved counter, so
+    # a reader that sees a new version also sees the data it stands for
+    updates[f"{CHANGES_PATH}/{restaurant_id}/version"] = last_seq
+    if last_seq // COMPACT_EVERY != (first_seq - 1) // COMPACT_EVERY:
+        updates.update(compaction_updates(restaurant_id, last_seq))
+    return last_seq
+
+
+def write_menu_changes(restaurant_id: str, updates: dict, changes: List[Change]) -> int:
+    """Commit menu data ``updates`` together with their change log entries"""
+    last_seq = record_changes(restaurant_id, changes, updates)
+    db.reference("/").update(updates)
+    return last_seq
+
+
+def reset_log(restaurant_id: str) -> int:
+    """Drop a restaurant's change log so every client falls back to a snapshot.
+
+    The sequence keeps counting, so any ``since`` a client already holds is
+    below the new floor and gets a reset, and the new version makes cached
+    menu views stale. Returns the reserved sequence the log restarts after.
+    """
+    seq = allocate_sequence(restaurant_id)
+    db.reference(f"{CHANGES_PATH}/{restaurant_id}").update(
+        {"log": None, "floor": seq + 1, "version": seq}
+    )
+    return seq
+
+
+def menu_version(restaurant_id: str) -> int:
+    """Changes with every committed menu write; for keying cached menus"""
+    return db.reference(f"{CHANGES_PATH}/{restaurant_id}/version").get() or 0
+
+
+def gap_expired(entry_ts: Optional[int]) -> bool:
+    """True once the entry after a gap is old enough that the gap is abandoned"""
+    return int(time.time() * 1000) - (entry_ts or 0) > GAP_TIMEOUT_MS
+
+
+def committed_sequence(restaurant_id: str) -> int:
+    """The highest sequence up to which every log entry is committed.
+
+    Menu data read after this call reflects every change up to the returned
+    sequence, so it is safe to hand to clients along with a full snapshot.
+    """
+    floor = db.reference(f"{CHANGES_PATH}/{restaurant_id}/floor").get() or 0
+    log_ref = db.reference(f"{CHANGES_PATH}/{restaurant_id}/log")
+    keys = log_ref.get(shallow=True) or {}
+
+    seq = max(floor - 1, 0)
+    for key in sorted(keys):
+        entry_seq = int(key)
+        if entry_seq <= seq:
+            continue
+        if entry_seq != seq + 1 and not gap_expired(log_ref.child(f"{key}/ts").get()):
+            # An earlier reservation is still being written
+            break
+        seq = entry_seq
+    return seq
+
+
+def changes_since(restaurant_id: str, since: int) -> Optional[dict]:
+    """Upserts and deletes after ``since``; None if the log no longer reaches back that far"""
+    floor = db.reference(f"{CHANGES_PATH}/{restaurant_id}/floor").get() or 0
+    if since + 1 < floor:
+        return None
+
+    entries = (
+        db.reference(f"{CHANGES_PATH}/{restaurant_id}/log")
+        .order_by_key()
+        .start_at(seq_key(since + 1))
+        .get()
+    ) or {}
+
+    # Only the latest change to each item matters. Stop before a gap left by
+    # a write that is still in flight, so the client asks for it next time.
+    latest: Dict[str, dict] = {}
+    seq = since
+    for key in sorted(entries):
+        entry = entries[key]
+        if entry["seq"] != seq + 1 and not gap_expired(entry.get("ts")):
+            break
+        latest[entry["item_id"]] = entry
+        seq = entry["seq"]
+
+    return {
+        "seq": seq,
+        "reset": False,
+        "upserts": [
+            {**entry["item"], "id": item_id}
+            for item_id, entry in latest.items()
+            if entry["op"] == "upsert"
+        ],
+        "deletes": [
+            item_id for item_id, entry in latest.items() if entry["op"] == "delete"
+        ],
+    }
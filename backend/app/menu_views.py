@@ -0,0 +1,115 @@
+"""Filtered menu views, cached per restaurant version and filter.
+
+A view is a restaurant's menu after applying an allergen/dietary filter,
+either a saved profile or ad-hoc query parameters. Filters are identified
+by a hash of their normalized contents, so diners with the same needs
+share entries. Each entry remembers the restaurant version it was built
+from: the menu change-log sequence plus the local write-behind generation.
+A lookup with a newer version is a miss. Writes on this worker also drop
+the restaurant's views right away.
+"""
+from fastapi import APIRouter, Depends
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+from auth_routes import admin_only
+import hashlib
+import json
+import os
+import threading
+
+menu_views_router = APIRouter()
+
+
+def filter_hash(allergen_free: Optional[List[str]], dietary_categories: Optional[List[str]]) -> str:
+    """Stable id for a filter, independent of order and duplicates"""
+    canonical = json.dumps(
+        [sorted(set(allergen_free or [])), sorted(set(dietary_categories or []))]
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def filter_menu(
+    items: List[dict],
+    allergen_free: Optional[List[str]] = None,
+    dietary_categories: Optional[List[str]] = None,
+) -> List[dict]:
+    """Items that contain none of ``allergen_free`` and all ``dietary_categories``"""
+    avoid = set(allergen_free or [])
+    required = set(dietary_categories or [])
+    return [
+        item
+        for item in items
+        if not avoid & set(item.get("allergens") or [])
+        and required <= set(item.get("dietaryCategories") or [])
+    ]
+
+
+class MenuViewCache:
+    """LRU cache of filtered menus keyed by (restaurant, filter hash)."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._views: "OrderedDict[Tuple[str, str], Tuple[Hashable, List[dict]]]" = OrderedDict()
+        self._by_restaurant: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, restaurant_id: str, filter_id: str, version: Hashable) -> Optional[List[dict]]:
+        key = (restaurant_id, filter_id)
+        with self._lock:
+            entry = self._views.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._views.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, restaurant_id: str, filter_id: str, version: Hashable, items: List[dict]):
+        key = (restaurant_id, filter_id)
+        with self._lock:
+            self._views[key] = (version, items)
+            self._views.move_to_end(key)
+            self._by_restaurant.setdefault(restaurant_id, set()).add(filter_id)
+            while len(self._views) > self.maxsize:
+                (old_restaurant, old_filter), _ = self._views.popitem(last=False)
+                filters = self._by_restaurant.get(old_restaurant)
+                if filters is not None:
+                    filters.discard(old_filter)
+                    if not filters:
+                        del self._by_restaurant[old_restaurant]
+
+    def invalidate(self, restaurant_id: str):
+        """Drop every view of a restaurant whose menu just changed"""
+        with self._lock:
+            for filter_id in self._by_restaurant.pop(restaurant_id, ()):
+                self._views.pop((restaurant_id, filter_id), None)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+            self._by_restaurant.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "views": len(self._views),
+            "restaurants": len(self._by_restaurant),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+MENU_VIEWS = MenuViewCache(maxsize=int(os.getenv("MENU_VIEW_CACHE_SIZE", "1024")))
+
+
+@menu_views_router.get("")
+async def menu_view_stats(token_data: dict = Depends(admin_only)):
+    """Cached filtered menu views on this worker (admin only)"""
+    return MENU_VIEWS.stats()
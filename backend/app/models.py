@@ -26,4 +26,18 @@ class UserLogin(BaseModel):
 class UserResponse(BaseModel):
     uid: str
     email: str
-    display_name: Optional[str] = None
\ No newline at end of file
+    display_name: Optional[str] = None
+
+class MenuItemUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    allergens: Optional[List[str]] = None
+    dietaryCategories: Optional[List[str]] = None
+
+
+class RestaurantUpdate(BaseModel):
+    name: Optional[str] = None
+    address: Optional[str] = None
+    phone: Optional[str] = None
+    cuisine_type: Optional[str] = None
@@ -0,0 +1,43 @@
+from firebase_admin import db
+from typing import Any, Iterator, List, Optional, Tuple
+
+MAX_INT32 = 2 ** 31 - 1
+
+
+def key_order(key: str) -> tuple:
+    """Sort key matching Firebase: 32-bit integer keys first, numerically"""
+    if key.lstrip("-").isdigit() and str(int(key)) == key and abs(int(key)) <= MAX_INT32:
+        return (0, int(key), "")
+    return (1, 0, key)
+
+
+def iter_pages(path: str, page_size: int = 500, start_after: Optional[str] = None) -> Iterator[List[Tuple[str, Any]]]:
+    """Yield the children of ``path`` as pages of (key, value) in key order.
+
+    Reads the tree one page at a time with key-ordered range queries, so
+    memory stays bounded by ``page_size`` however large the tree is.
+    ``start_after`` resumes after a key returned by an earlier pass.
+    """
+    ref = db.reference(path)
+    last_key = start_after
+    while True:
+        query = ref.order_by_key()
+        if last_key is None:
+            page = query.limit_to_first(page_size).get() or {}
+        else:
+            # start_at is inclusive, so fetch one extra and skip the last key seen
+            page = query.start_at(last_key).limit_to_first(page_size + 1).get() or {}
+            page.pop(last_key, None)
+        if not page:
+            return
+        keys = sorted(page, key=key_order)
+        yield [(key, page[key]) for key in keys]
+        last_key = keys[-1]
+        if len(page) < page_size:
+            return
+
+
+def iter_children(path: str, page_size: int = 500) -> Iterator[Tuple[str, Any]]:
+    """Yield (key, value) for every child of ``path`` in key order, a page at a time"""
+    for page in iter_pages(path, page_size):
+        yield from page
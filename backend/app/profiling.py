@@ -0,0 +1,293 @@
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+from fastapi.responses import Response, PlainTextResponse
+from pydantic import BaseModel
+from starlette.routing import Match
+from typing import List, Optional
+from auth_routes import admin_only
+import cProfile
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+profiling_router = APIRouter()
+
+# Hard upper bound on how long a profiling window can stay open
+MAX_PROFILING_SECONDS = 600
+
+# Interval between stack samples for the collapsed-stack output
+STACK_SAMPLE_INTERVAL = 0.005
+
+# cProfile sees the whole event loop thread, not just the profiled request
+PSTATS_SCOPE_NOTE = (
+    "pstats covers every coroutine that ran on the event loop while a profiled "
+    "request was in flight; collapsed stacks keep only the profiled route's endpoint"
+)
+
+
+class ProfilingStart(BaseModel):
+    sample_rate: float = 0.1
+    route: Optional[str] = None
+    # Profile only this method of the route; all of them by default
+    method: Optional[str] = None
+    duration_seconds: int = 60
+
+
+class RequestProfiler:
+    """Collects cProfile stats and sampled stacks for a fraction of requests.
+
+    The middleware only reads ``active`` while profiling is off, so a disabled
+    profiler adds a single attribute check per request.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.sample_rate = 0.0
+        self.routes: List = []
+        self.route_path = None
+        self.method = None
+        self.expires_at = 0.0
+        self.profiled_requests = 0
+        self.skipped_requests = 0
+        self._lock = threading.Lock()
+        self._stats = None
+        self._stacks = Counter()
+        # cProfile allows only one active profiler per thread, so profiled
+        # requests are serialized; overlapping ones are simply not sampled.
+        self._busy = False
+
+    def start(
+        self,
+        sample_rate: float,
+        routes: List,
+        route_path: Optional[str],
+        method: Optional[str],
+        duration_seconds: int,
+    ):
+        with self._lock:
+            self.sample_rate = sample_rate
+            self.routes = routes
+            self.route_path = route_path
+            self.method = method
+            self.expires_at = time.monotonic() + duration_seconds
+            self.active = True
+
+    def stop(self):
+        with self._lock:
+            self.active = False
+            self.routes = []
+
+    def reset(self):
+        with self._lock:
+            self._stats = None
+            self._stacks = Counter()
+            self.profiled_requests = 0
+            self.skipped_requests = 0
+
+    def status(self) -> dict:
+        remaining = max(0.0, self.expires_at - time.monotonic()) if self.active else 0.0
+        return {
+            "active": self.active,
+            "sample_rate": self.sample_rate,
+            "route": self.route_path,
+            "method": self.method,
+            "seconds_remaining": round(remaining, 1),
+            "profiled_requests": self.profiled_requests,
+            "skipped_requests": self.skipped_requests,
+            "distinct_stacks": len(self._stacks),
+            "note": PSTATS_SCOPE_NOTE,
+        }
+
+    def endpoint_codes(self) -> Optional[set]:
+        """Code objects of the endpoints a profiled request can run, or None
+        when every route is profiled"""
+        if not self.route_path:
+            return None
+        return {route.endpoint.__code__ for route in self.routes}
+
+    def should_profile(self, scope) -> bool:
+        if time.monotonic() >= self.expires_at:
+            self.stop()
+            return False
+        if self.route_path is not None:
+            # Routes sharing a path differ by method, so a path match is enough
+            if not any(route.matches(scope)[0] != Match.NONE for route in self.routes):
+                return False
+            if self.method is not None and scope["method"] != self.method:
+                return False
+        if random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            if self._busy:
+                self.skipped_requests += 1
+                return False
+            self._busy = True
+        return True
+
+    def finish(self, profile: cProfile.Profile, stacks: Counter):
+        with self._lock:
+            self._busy = False
+            self.profiled_requests += 1
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self._stacks.update(stacks)
+
+    def pstats_bytes(self) -> Optional[bytes]:
+        with self._lock:
+            if self._stats is None:
+                return None
+            # Same format as pstats.Stats.dump_stats, without a temp file
+            return marshal.dumps(self._stats.stats)
+
+    def collapsed_stacks(self) -> str:
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in self._stacks.most_common()]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of one thread into collapsed-stack counts.
+
+    With ``codes``, only stacks running one of those code objects are kept,
+    which drops other coroutines sharing the event loop thread.
+    """
+
+    def __init__(self, thread_id: int, codes: Optional[set] = None):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.codes = codes
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(STACK_SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            matched = self.codes is None
+            while frame is not None:
+                code = frame.f_code
+                matched = matched or code in self.codes
+                names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if matched:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+PROFILER = RequestProfiler()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requests selected by PROFILER."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not PROFILER.active or scope["type"] != "http" or not PROFILER.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = StackSampler(threading.get_ident(), PROFILER.endpoint_codes())
+        profile = cProfile.Profile()
+        sampler.start()
+        profile.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile.disable()
+            PROFILER.finish(profile, sampler.stop())
+
+
+@profiling_router.post("/start")
+async def start_profiling(
+    config: ProfilingStart, request: Request, token_data: dict = Depends(admin_only)
+):
+    """Start profiling a sampled fraction of requests (admin only)"""
+    if not 0 < config.sample_rate <= 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="sample_rate must be in (0, 1]",
+        )
+    if not 0 < config.duration_seconds <= MAX_PROFILING_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"duration_seconds must be between 1 and {MAX_PROFILING_SECONDS}",
+        )
+
+    # Resolve the route template (e.g. /restaurants/{restaurant_id}/menu);
+    # each method of a path is its own route
+    method = config.method.upper() if config.method else None
+    routes = []
+    if config.route:
+        routes = [
+            r for r in request.app.routes
+            if getattr(r, "path", None) == config.route
+            and (method is None or method in (getattr(r, "methods", None) or ()))
+        ]
+        if not routes:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Route {config.route} not found" + (f" for {method}" if method else ""),
+            )
+
+    PROFILER.start(config.sample_rate, routes, config.route, method, config.duration_seconds)
+    return PROFILER.status()
+
+
+@profiling_router.post("/stop")
+async def stop_profiling(token_data: dict = Depends(admin_only)):
+    """Stop profiling; collected data stays available for download (admin only)"""
+    PROFILER.stop()
+    return PROFILER.status()
+
+
+@profiling_router.get("/status")
+async def profiling_status(token_data: dict = Depends(admin_only)):
+    """Get the current profiling window and sample counts (admin only)"""
+    return PROFILER.status()
+
+
+@profiling_router.get("/download")
+async def download_profile(format: str = "pstats", token_data: dict = Depends(admin_only)):
+    """Download aggregated profiles as pstats or collapsed stacks (admin only)"""
+    if format == "collapsed":
+        return PlainTextResponse(
+            PROFILER.collapsed_stacks(),
+            headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'},
+        )
+    if format != "pstats":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="format must be 'pstats' or 'collapsed'",
+        )
+
+    data = PROFILER.pstats_bytes()
+    if data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No profiles collected yet",
+        )
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="profile.pstats"'},
+    )
+
+
+@profiling_router.delete("/")
+async def clear_profiles(token_data: dict = Depends(admin_only)):
+    """Discard collected profiles (admin only)"""
+    PROFILER.reset()
+    return {"message": "Profiles cleared"}
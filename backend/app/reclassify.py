@@ -0,0 +1,407 @@
+"""Bulk re-classification of stored menu items after a taxonomy change.
+
+The job streams ``menu_items`` a page at a time and recomputes each item's
+allergens. Text is first checked with the local keyword classifier, then
+against cached AI parse results, and the model is only asked (when enabled)
+for items where neither found anything. Allergens are only ever added or
+renamed to their current id, never dropped, because owners set them by hand.
+Dietary categories are never changed. When an item seems to contain something
+that rules out its vegan or vegetarian label, it is flagged for review.
+
+Each page is committed with one multi-path update that also writes the
+change-log entries and the counter increments. Just before that, the page's
+items are read again: items deleted, moved to a deleted restaurant or edited
+through write-behind since the scan are skipped, and the added allergens are
+applied to the item as it is now, which is also what gets logged. After every committed
+page the last key is saved to a checkpoint file. A crashed or cancelled run
+resumes from there. Re-running a page is harmless, because reclassifying an
+item twice gives the same result.
+"""
+from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.concurrency import run_in_threadpool
+from firebase_admin import db
+from pydantic import BaseModel
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from auth_routes import admin_only
+from paging import iter_pages
+from menu_changes import record_changes
+from catalog_stats import count_deltas, menu_item_counts, stat_updates
+from change_events import publish_menu_event
+from write_behind import WRITE_BEHIND
+from menu_views import MENU_VIEWS
+from ai_parser import SIMILAR_PARSES, parse_ingredients_shared
+from taxonomy import (
+    NOT_VEGAN_ALLERGENS,
+    NOT_VEGETARIAN_ALLERGENS,
+    TAXONOMY_VERSION,
+    classify_text,
+    normalize_allergens,
+    normalize_dietary,
+)
+import asyncio
+import json
+import os
+import time
+
+reclassify_router = APIRouter()
+
+CHECKPOINT_PATH = os.getenv(
+    "RECLASSIFY_CHECKPOINT",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "reclassify_checkpoint.json"),
+)
+
+# Changed items kept in the report for review
+MAX_DIFF_SAMPLE = 200
+
+# Items whose dietary labels look wrong, kept in the report for review
+MAX_REVIEW_SAMPLE = 1000
+
+
+class ReclassifyRequest(BaseModel):
+    dry_run: bool = True
+    use_model: bool = False
+    page_size: int = 200
+    concurrency: int = 4
+    restart: bool = False
+
+
+def reclassify_item(
+    item: dict, detected: set, not_vegan: bool, not_vegetarian: bool
+) -> Tuple[dict, List[str]]:
+    """``item`` with its allergens recomputed, keeping every allergen already
+    set, and the dietary categories that look ruled out.
+
+    Dietary categories are the owner's claim and are left as they are; the
+    flagged ones are for a person to check.
+    """
+    allergens = normalize_allergens(list(item.get("allergens") or []) + list(detected))
+    dietary = normalize_dietary(item.get("dietaryCategories"))
+    # An allergen like milk or fish rules out a category too
+    not_vegetarian = not_vegetarian or bool(set(allergens) & NOT_VEGETARIAN_ALLERGENS)
+    not_vegan = not_vegan or not_vegetarian or bool(set(allergens) & NOT_VEGAN_ALLERGENS)
+    flagged = [
+        d for d in dietary
+        if (d == "vegan" and not_vegan) or (d == "vegetarian" and not_vegetarian)
+    ]
+    return {**item, "allergens": allergens}, flagged
+
+
+def item_diff(item_id: str, old: dict, new: dict, source: str, flagged: List[str]) -> dict:
+    old_allergens = set(old.get("allergens") or [])
+    return {
+        "id": item_id,
+        "restaurant_id": old.get("restaurant_id"),
+        "name": old.get("name"),
+        "source": source,
+        "allergens_added": sorted(set(new["allergens"]) - old_allergens),
+        "allergens_removed": sorted(old_allergens - set(new["allergens"])),
+        "dietary_flagged": sorted(flagged),
+    }
+
+
+def load_checkpoint() -> Optional[dict]:
+    try:
+        with open(CHECKPOINT_PATH, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring unreadable reclassification checkpoint: {str(e)}")
+        return None
+
+
+def save_checkpoint(checkpoint: dict):
+    # Write then rename so a crash never leaves a half-written checkpoint
+    tmp_path = CHECKPOINT_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+
+def clear_checkpoint():
+    try:
+        os.remove(CHECKPOINT_PATH)
+    except FileNotFoundError:
+        pass
+
+
+class ReclassifyJob:
+    """One re-classification pass at a time per worker, with progress counters."""
+
+    def __init__(self):
+        self.running = False
+        self.cancel_requested = False
+        self.options: Optional[dict] = None
+        self.progress: Dict[str, object] = {}
+        self.diffs: List[dict] = []
+        self.review: List[dict] = []
+        self.report: Optional[dict] = None
+        # Held so the running pass isn't garbage collected mid-run
+        self.task: Optional[asyncio.Task] = None
+
+    def _new_progress(self, resumed_from: Optional[str]) -> dict:
+        return {
+            "taxonomy_version": TAXONOMY_VERSION,
+            "resumed_from": resumed_from,
+            "last_key": resumed_from,
+            "pages": 0,
+            "scanned": 0,
+            "changed": 0,
+            "unchanged": 0,
+            "skipped_pending": 0,
+            "skipped_stale": 0,
+            "errors": 0,
+            "sources": {},
+            "allergens_added": {},
+            "allergens_removed": {},
+            "dietary_flagged": {},
+            "started_at": time.time(),
+            "items_per_second": 0.0,
+        }
+
+    async def classify(
+        self, item: dict, use_model: bool, limit: asyncio.Semaphore
+    ) -> Tuple[dict, List[str], str]:
+        """(reclassified item, flagged dietary categories, where the labels came from)"""
+        text = ". ".join(str(item.get(k) or "") for k in ("name", "description"))
+        detected, not_vegan, not_vegetarian = classify_text(text)
+        source = "local"
+
+        description = item.get("description") or ""
+        reused = SIMILAR_PARSES.lookup(description) if description else None
+        if reused is not None:
+            detected |= set(normalize_allergens(reused.get("allergens")))
+            source = "cached_ai"
+        elif use_model and description and not detected:
+            async with limit:
+                try:
+                    parsed = await parse_ingredients_shared(description)
+                    detected |= set(normalize_allergens(parsed.get("allergens")))
+                    source = "model"
+                except Exception as e:
+                    # Keep the local result; the item can be retried in a later run
+                    print(f"Model reclassification failed for {item.get('name')}: {str(e)}")
+                    self.progress["errors"] += 1
+
+        new, flagged = reclassify_item(item, detected, not_vegan, not_vegetarian)
+        return new, flagged, source
+
+    def commit_page(
+        self, changed: List[Tuple[str, dict, dict]]
+    ) -> Tuple[Dict[str, tuple], List[Tuple[str, dict, dict]]]:
+        """Write the changed items of one page and their log entries together.
+
+        Items are read again first and the allergens added by the scan are
+        applied to their current state. Returns (owner uid, last change
+        sequence) per restaurant, and the (id, current, new) items written.
+        """
+        ids = [item_id for item_id, _, _ in changed]
+        current = (
+            db.reference("menu_items").order_by_key().start_at(min(ids)).end_at(max(ids)).get()
+        ) or {}
+
+        owners: Dict[str, Optional[str]] = {}
+        committed = []
+        for item_id, old, new in changed:
+            item = current.get(item_id)
+            if not isinstance(item, dict) or WRITE_BEHIND.has_pending(f"menu_items/{item_id}"):
+                continue
+            restaurant_id = item.get("restaurant_id")
+            if restaurant_id not in owners:
+                # Read fresh: a field write to an item of a deleted restaurant leaves an orphan
+                owners[restaurant_id] = (
+                    db.reference(f"restaurants/{restaurant_id}/owner_uid").get()
+                    if restaurant_id else None
+                )
+            if owners[restaurant_id] is None:
+                continue
+            added = set(new["allergens"]) - set(old.get("allergens") or [])
+            allergens = normalize_allergens(list(item.get("allergens") or []) + sorted(added))
+            if set(allergens) == set(item.get("allergens") or []):
+                continue
+            committed.append((item_id, item, {**item, "allergens": allergens}))
+        self.progress["skipped_stale"] += len(changed) - len(committed)
+        if not committed:
+            return {}, []
+
+        updates = {}
+        by_restaurant: Dict[str, list] = {}
+        deltas = Counter()
+        for item_id, item, new in committed:
+            updates[f"menu_items/{item_id}/allergens"] = new["allergens"]
+            by_restaurant.setdefault(item["restaurant_id"], []).append(("upsert", item_id, new))
+            deltas.update(count_deltas(menu_item_counts(item), menu_item_counts(new)))
+
+        restaurants = {}
+        for restaurant_id, changes in by_restaurant.items():
+            restaurants[restaurant_id] = (
+                owners[restaurant_id], record_changes(restaurant_id, changes, updates)
+            )
+        updates.update(stat_updates(dict(deltas)))
+
+        db.reference("/").update(updates)
+        for restaurant_id in restaurants:
+            MENU_VIEWS.invalidate(restaurant_id)
+        return restaurants, committed
+
+    async def run(self, options: dict):
+        dry_run = options["dry_run"]
+        limit = asyncio.Semaphore(max(1, options["concurrency"]))
+
+        checkpoint = None if dry_run or options["restart"] else load_checkpoint()
+        if checkpoint and checkpoint.get("taxonomy_version") != TAXONOMY_VERSION:
+            print("Reclassification checkpoint is for another taxonomy version; starting over")
+            checkpoint = None
+        if checkpoint:
+            self.progress = {**self._new_progress(checkpoint["last_key"]), **checkpoint["progress"]}
+            self.progress["resumed_from"] = checkpoint["last_key"]
+        else:
+            self.progress = self._new_progress(None)
+        self.diffs = []
+        self.review = []
+        started = time.time()
+        scanned_before = self.progress["scanned"]
+
+        pages = iter_pages("menu_items", max(1, options["page_size"]), self.progress["last_key"])
+        while not self.cancel_requested:
+            page = await run_in_threadpool(next, pages, None)
+            if page is None:
+                break
+
+            entries = [
+                (item_id, item)
+                for item_id, item in page
+                if isinstance(item, dict) and not WRITE_BEHIND.has_pending(f"menu_items/{item_id}")
+            ]
+            # Items with buffered edits are picked up by the next run
+            self.progress["skipped_pending"] += len(page) - len(entries)
+            results = await asyncio.gather(
+                *(self.classify(item, options["use_model"], limit) for _, item in entries)
+            )
+
+            changed = []
+            sources = Counter(self.progress["sources"])
+            for (item_id, old), (new, flagged, source) in zip(entries, results):
+                sources[source] += 1
+                diff = item_diff(item_id, old, new, source, flagged)
+                for field in ("allergens_added", "allergens_removed", "dietary_flagged"):
+                    totals = Counter(self.progress[field])
+                    totals.update(diff[field])
+                    self.progress[field] = dict(totals)
+                if flagged and len(self.review) < MAX_REVIEW_SAMPLE:
+                    self.review.append(diff)
+                if set(new["allergens"]) == set(old.get("allergens") or []):
+                    self.progress["unchanged"] += 1
+                    continue
+                changed.append((item_id, old, new))
+                if len(self.diffs) < MAX_DIFF_SAMPLE:
+                    self.diffs.append(diff)
+            self.progress["sources"] = dict(sources)
+
+            if changed and not dry_run:
+                restaurants, changed = await run_in_threadpool(self.commit_page, changed)
+                for item_id, item, new in changed:
+                    owner_uid, seq = restaurants[item["restaurant_id"]]
+                    publish_menu_event(item["restaurant_id"], owner_uid, "upsert", item_id, new, seq)
+
+            self.progress["changed"] += len(changed)
+            self.progress["scanned"] += len(page)
+            self.progress["pages"] += 1
+            self.progress["last_key"] = page[-1][0]
+            elapsed = time.time() - started
+            if elapsed > 0:
+                self.progress["items_per_second"] = round(
+                    (self.progress["scanned"] - scanned_before) / elapsed, 1
+                )
+            if not dry_run:
+                await run_in_threadpool(
+                    save_checkpoint,
+                    {
+                        "taxonomy_version": TAXONOMY_VERSION,
+                        "last_key": self.progress["last_key"],
+                        "progress": self.progress,
+                    },
+                )
+
+        finished = not self.cancel_requested
+        if finished and not dry_run:
+            await run_in_threadpool(clear_checkpoint)
+        return {
+            **self.progress,
+            "dry_run": dry_run,
+            "completed": finished,
+            "finished_at": time.time(),
+            "diff_sample": self.diffs,
+            "review_sample": self.review,
+        }
+
+    def start(self, options: dict):
+        """Run a pass on the event loop; the caller checks ``running`` first"""
+        self.running = True
+        self.task = asyncio.create_task(self.run_in_background(options))
+        self.task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        if self.task is task:
+            self.task = None
+
+    async def run_in_background(self, options: dict):
+        self.running = True
+        self.cancel_requested = False
+        self.options = options
+        try:
+            self.report = await self.run(options)
+        except Exception as e:
+            print(f"Menu reclassification failed: {str(e)}")
+            self.report = {
+                **self.progress,
+                "error": str(e),
+                "finished_at": time.time(),
+                "diff_sample": self.diffs,
+                "review_sample": self.review,
+            }
+        finally:
+            self.running = False
+
+
+RECLASSIFIER = ReclassifyJob()
+
+
+@reclassify_router.post("", status_code=status.HTTP_202_ACCEPTED)
+async def start_reclassify(request: ReclassifyRequest, token_data: dict = Depends(admin_only)):
+    """Recompute allergens for every menu item in the background (admin only).
+
+    Dry runs (the default) only report what would change. Applying runs
+    resume from the last checkpoint unless ``restart`` is set.
+    """
+    if RECLASSIFIER.running:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Reclassification is already running",
+        )
+    RECLASSIFIER.start(request.dict())
+    return {"message": "Reclassification started", "dry_run": request.dry_run}
+
+
+@reclassify_router.get("")
+async def reclassify_status(token_data: dict = Depends(admin_only)):
+    """Progress of the running job, the saved checkpoint and the last report (admin only)"""
+    return {
+        "running": RECLASSIFIER.running,
+        "options": RECLASSIFIER.options,
+        "progress": RECLASSIFIER.progress if RECLASSIFIER.running else None,
+        "checkpoint": await run_in_threadpool(load_checkpoint),
+        "report": RECLASSIFIER.report,
+    }
+
+
+@reclassify_router.post("/cancel")
+async def cancel_reclassify(token_data: dict = Depends(admin_only)):
+    """Stop after the current page; an applying run can be resumed later (admin only)"""
+    if not RECLASSIFIER.running:
+        raise HTTPException(status_code=404, detail="No reclassification is running")
+    RECLASSIFIER.cancel_requested = True
+    return {"message": "Reclassification will stop after the current page"}
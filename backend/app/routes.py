@@ -1,20 +1,37 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from firebase_admin import db
 import random
-from models import Restaurant, MenuItem
+from models import Restaurant, RestaurantUpdate, MenuItem, MenuItemUpdate
 from typing import List, Optional
-from auth_routes import verify_token
-import os
-import json
+from auth_routes import verify_token, get_profile
+from admission import ai_rate_limited
+from cache import TTLCache
+from singleflight import SingleFlight
+from ai_parser import parse_ingredients_shared
+from fastapi.concurrency import run_in_threadpool
+from menu_changes import (
+    CHANGES_PATH,
+    changes_since,
+    committed_sequence,
+    menu_version,
+)
+from write_behind import WRITE_BEHIND, write_menu
+from catalog_stats import count_deltas, menu_item_counts, restaurant_counts, stat_updates
+from collections import Counter
+from change_events import publish_menu_event, publish_restaurant_event
+from taxonomy import VALID_ALLERGENS, VALID_DIETARY_CATEGORIES
+from menu_views import MENU_VIEWS, filter_hash, filter_menu
 from pydantic import BaseModel
 
-try:
-    import google.generativeai as genai
-except Exception:
-    genai = None
-
 router = APIRouter()
 
+# Restaurant documents by id, used for ownership checks on hot write paths.
+# Owners rarely change, so a short TTL bounds staleness across workers.
+RESTAURANT_CACHE = TTLCache(maxsize=2048, ttl=60)
+
+# Coalesce identical concurrent menu reads
+MENU_READS = SingleFlight()
+
 
 def generate_id(ref_path: str, length: int = 5, max_attempts: int = 5) -> str:
     """
@@ -39,8 +56,10 @@ def generate_id(ref_path: str, length: int = 5, max_attempts: int = 5) -> str:
         max_value = (10**length) - 1
         new_id = str(random.randint(min_value, max_value))
 
-        # Check if ID exists in database
-        if not ref.child(new_id).get():
+        # Check if ID exists in database or is waiting to be written
+        if not ref.child(new_id).get() and not WRITE_BEHIND.has_pending(
+            f"{ref_path}/{new_id}"
+        ):
             return new_id
 
     raise HTTPException(
@@ -49,6 +68,37 @@ def generate_id(ref_path: str, length: int = 5, max_attempts: int = 5) -> str:
     )
 
 
+def get_restaurant_cached(restaurant_id: str) -> Optional[dict]:
+    """Get a restaurant document, reading through RESTAURANT_CACHE"""
+    restaurant_data = RESTAURANT_CACHE.get(restaurant_id)
+    if restaurant_data is None:
+        restaurant_data = db.reference(f"restaurants/{restaurant_id}").get()
+        if restaurant_data:
+            RESTAURANT_CACHE.set(restaurant_id, restaurant_data)
+    return restaurant_data
+
+
+def validate_menu_labels(
+    allergens: Optional[List[str]], dietary_categories: Optional[List[str]]
+):
+    """Raise a 400 if any allergen or dietary category id is unknown"""
+    # Validate allergens
+    invalid_allergens = set(allergens or []) - VALID_ALLERGENS
+    if invalid_allergens:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid allergens: {', '.join(invalid_allergens)}",
+        )
+
+    # Validate dietary categories
+    invalid_categories = set(dietary_categories or []) - VALID_DIETARY_CATEGORIES
+    if invalid_categories:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid dietary categories: {', '.join(invalid_categories)}",
+        )
+
+
 # Check if the user is an admin
 async def check_admin_status(token_data: dict) -> bool:
     """Check if the user has admin privileges based on token data"""
@@ -56,6 +106,10 @@ async def check_admin_status(token_data: dict) -> bool:
     if not user_id:
         return False
 
+    # Signed tokens carry a verified, short-lived is_admin claim
+    if token_data.get("token_type") == "signed":
+        return bool(token_data.get("is_admin", False))
+
     # Get user data from database to check admin status
     user_ref = db.reference(f"users/{user_id}")
     user_data = user_ref.get()
@@ -70,155 +124,15 @@ class ParseIngredientsRequest(BaseModel):
 
 @router.post("/ai/parse-ingredients")
 async def parse_ingredients_ai(
-    payload: ParseIngredientsRequest, token_data: dict = Depends(verify_token)
+    payload: ParseIngredientsRequest, token_data: dict = Depends(ai_rate_limited)
 ):
     try:
         user_id = token_data.get("uid")
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid user token")
 
-        api_key = os.getenv("GOOGLE_AI_API_KEY")
-        if not api_key:
-            raise HTTPException(
-                status_code=500,
-                detail="GOOGLE_AI_API_KEY env var is not set on the server",
-            )
-
-        if genai is None:
-            raise HTTPException(
-                status_code=500,
-                detail="google-generativeai library is not installed on the server",
-            )
-
-        genai.configure(api_key=api_key)
-
-        # Determine candidate models: prefer env override, then SDK-discovered, then fallbacks
-        env_model = os.getenv("GEMINI_MODEL")
-        candidate_models: List[str] = []
-        if env_model:
-            candidate_models.append(env_model)
-
-        # Try to discover models supported for generateContent via SDK
-        try:
-            discovered = [
-                m.name
-                for m in genai.list_models()
-                if getattr(m, "supported_generation_methods", None)
-                and "generateContent" in m.supported_generation_methods
-            ]
-            # Simple preference ordering: flash/pro, 1.5 > 1.0 > others
-            preference = ["1.5", "flash", "pro"]
-            discovered_sorted = sorted(
-                discovered,
-                key=lambda n: (0 if any(p in n for p in preference) else 1, n),
-            )
-            for n in discovered_sorted:
-                if n not in candidate_models:
-                    candidate_models.append(n)
-        except Exception:
-            pass
-
-        # Final fallbacks in case discovery failed
-        for fb in [
-            "gemini-1.5-flash-001",
-            "gemini-1.5-flash",
-            "gemini-1.5-flash-latest",
-            "gemini-1.5-flash-002",
-            "gemini-1.5-pro",
-            "gemini-1.0-pro",
-            "gemini-pro",
-        ]:
-            if fb not in candidate_models:
-                candidate_models.append(fb)
-
-        prompt = (
-            "You are extracting food safety attributes from free-text ingredient lists.\n"
-            "Given the text, return a strict JSON object with keys: allergens (array of strings), "
-            "dietaryCategories (array of strings), and extractedIngredients (array of strings).\n"
-            "The allowed allergen ids are: milk, eggs, fish, tree_nuts, wheat, shellfish, peanuts, soybeans, sesame.\n"
-            "The allowed dietary category ids are: vegan, vegetarian.\n"
-            "Normalize synonyms to these ids (e.g., 'tree nuts' -> 'tree_nuts').\n"
-            "Only output valid ids. If none, output empty arrays.\n"
-            f"Text: {payload.ingredients}"
-        )
-
-        last_error = None
-        response = None
-        for model_name in candidate_models:
-            try:
-                model = genai.GenerativeModel(
-                    model_name=model_name,
-                    generation_config={
-                        "temperature": 0,
-                        "response_mime_type": "application/json",
-                    },
-                )
-                response = model.generate_content(prompt)
-                if response and getattr(response, "text", None):
-                    break
-            except Exception as e:
-                last_error = e
-                continue
-
-        if response is None or not getattr(response, "text", None):
-            err_msg = "Model not available or failed to generate. "
-            if last_error:
-                err_msg += str(last_error)
-            raise HTTPException(status_code=500, detail=err_msg)
-        raw_text = response.text
-
-        try:
-            parsed = json.loads(raw_text)
-        except Exception:
-            # Fallback: try to locate a JSON object in the text
-            start = raw_text.find("{")
-            end = raw_text.rfind("}")
-            if start != -1 and end != -1 and end > start:
-                parsed = json.loads(raw_text[start : end + 1])
-            else:
-                raise
-
-        # Post-process and validate IDs against backend sets
-        valid_allergens = {
-            "milk",
-            "eggs",
-            "fish",
-            "tree_nuts",
-            "wheat",
-            "shellfish",
-            "peanuts",
-            "soybeans",
-            "sesame",
-        }
-        valid_dietary = {"vegan", "vegetarian"}
-
-        # Accept some common synonyms and map to our ids
-        allergen_synonyms = {
-            "tree nuts": "tree_nuts",
-            "treenuts": "tree_nuts",
-            "gluten": "wheat",  # approximate mapping for common usage
-        }
-
-        def normalize_id(value: str) -> str:
-            v = (value or "").strip().lower()
-            if v in allergen_synonyms:
-                v = allergen_synonyms[v]
-            v = v.replace(" ", "_")
-            return v
-
-        allergens = [normalize_id(a) for a in parsed.get("allergens", [])]
-        allergens = [a for a in allergens if a in valid_allergens]
-
-        dietary = [normalize_id(c) for c in parsed.get("dietaryCategories", [])]
-        dietary = [d for d in dietary if d in valid_dietary]
-
-        extracted_ingredients = parsed.get("extractedIngredients", []) or []
-
-        return {
-            "allergens": allergens,
-            "dietaryCategories": dietary,
-            "extractedIngredients": extracted_ingredients,
-        }
+        # Identical texts that arrive together share a single model call
+        return await parse_ingredients_shared(payload.ingredients)
     except HTTPException:
         raise
     except Exception as e:
@@ -244,10 +158,15 @@ async def create_restaurant(
         # Add owner_uid to the restaurant data
         restaurant_dict["owner_uid"] = user_id
 
-        ref = db.reference("restaurants")
         print(f"Attempting to create restaurant: {restaurant_dict}")
 
-        ref.child(restaurant_id).set(restaurant_dict)
+        # Write the restaurant and its counter increments together
+        db.reference("/").update({
+            f"restaurants/{restaurant_id}": restaurant_dict,
+            **stat_updates(count_deltas(Counter(), restaurant_counts(restaurant_dict))),
+        })
+        RESTAURANT_CACHE.set(restaurant_id, restaurant_dict)
+        publish_restaurant_event(restaurant_id, user_id, "upsert", restaurant_dict)
         print(f"Successfully created restaurant with ID: {restaurant_id}")
 
         # Check if this is the user's first restaurant and update user data
@@ -274,27 +193,21 @@ async def get_restaurants(token_data: dict = Depends(verify_token)):
         # Check if user is admin
         is_admin = await check_admin_status(token_data)
 
-        # Get restaurants
+        # Admins can see all restaurants, others only see their own
         ref = db.reference("restaurants")
-        all_restaurants = ref.get()
+        if is_admin:
+            all_restaurants = ref.get()
+        else:
+            # Fetch only this owner's restaurants via the owner_uid index
+            all_restaurants = ref.order_by_child("owner_uid").equal_to(user_id).get()
 
         if not all_restaurants:
             return []
 
-        # Admins can see all restaurants, others only see their own
-        if is_admin:
-            # Return all restaurants for admins
-            restaurants = [
-                {"id": str(restaurant_id), **restaurant_data}
-                for restaurant_id, restaurant_data in all_restaurants.items()
-            ]
-        else:
-            # Filter restaurants by owner_uid for regular users
-            restaurants = [
-                {"id": str(restaurant_id), **restaurant_data}
-                for restaurant_id, restaurant_data in all_restaurants.items()
-                if restaurant_data.get("owner_uid") == user_id
-            ]
+        restaurants = [
+            {"id": str(restaurant_id), **restaurant_data}
+            for restaurant_id, restaurant_data in all_restaurants.items()
+        ]
 
         return restaurants
     except Exception as e:
@@ -321,6 +234,7 @@ async def get_restaurant(restaurant_id: str, token_data: dict = Depends(verify_t
             raise HTTPException(
                 status_code=404, detail=f"Restaurant {restaurant_id} not found"
             )
+        RESTAURANT_CACHE.set(restaurant_id, restaurant_data)
 
         # Verify ownership or admin status
         if restaurant_data.get("owner_uid") != user_id and not is_admin:
@@ -337,6 +251,141 @@ async def get_restaurant(restaurant_id: str, token_data: dict = Depends(verify_t
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.put("/restaurants/{restaurant_id}")
+async def update_restaurant(
+    restaurant_id: str,
+    restaurant: RestaurantUpdate,
+    token_data: dict = Depends(verify_token),
+):
+    try:
+        # Extract user ID from token
+        user_id = token_data.get("uid")
+        if not user_id:
+            raise HTTPException(status_code=401, detail="Invalid user token")
+
+        # Get the restaurant
+        ref = db.reference(f"restaurants/{restaurant_id}")
+        restaurant_data = ref.get()
+
+        if not restaurant_data:
+            raise HTTPException(
+                status_code=404, detail=f"Restaurant {restaurant_id} not found"
+            )
+
+        # Verify ownership or admin status
+        if restaurant_data.get("owner_uid") != user_id and not await check_admin_status(
+            token_data
+        ):
+            raise HTTPException(
+                status_code=403,
+                detail="You don't have permission to modify this restaurant",
+            )
+
+        # Write only the fields whose values actually changed
+        changed = {
+            field: value
+            for field, value in restaurant.dict(exclude_unset=True).items()
+            if value is not None and restaurant_data.get(field) != value
+        }
+        updated_restaurant = {**restaurant_data, **changed}
+        if changed:
+            db.reference("/").update({
+                **{f"restaurants/{restaurant_id}/{field}": value for field, value in changed.items()},
+                **stat_updates(
+                    count_deltas(
+                        restaurant_counts(restaurant_data),
+                        restaurant_counts(updated_restaurant),
+                    )
+                ),
+            })
+            publish_restaurant_event(
+                restaurant_id,
+                restaurant_data.get("owner_uid"),
+                "upsert",
+                updated_restaurant,
+            )
+        RESTAURANT_CACHE.set(restaurant_id, updated_restaurant)
+
+        return {"id": restaurant_id, **updated_restaurant}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error updating restaurant: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/restaurants/{restaurant_id}")
+async def delete_restaurant(restaurant_id: str, token_data: dict = Depends(verify_token)):
+    """Delete a restaurant together with its menu items in one atomic write"""
+    try:
+        # Extract user ID from token
+        user_id = token_data.get("uid")
+        if not user_id:
+            raise HTTPException(status_code=401, detail="Invalid user token")
+
+        # Get the restaurant
+        restaurant_data = db.reference(f"restaurants/{restaurant_id}").get()
+
+        if not restaurant_data:
+            raise HTTPException(
+                status_code=404, detail=f"Restaurant {restaurant_id} not found"
+            )
+
+        # Verify ownership or admin status
+        owner_uid = restaurant_data.get("owner_uid")
+        if owner_uid != user_id and not await check_admin_status(token_data):
+            raise HTTPException(
+                status_code=403,
+                detail="You don't have permission to delete this restaurant",
+            )
+
+        # Unsaved menu writes must not recreate items after the delete
+        await run_in_threadpool(WRITE_BEHIND.discard, restaurant_id)
+
+        # Collect only this restaurant's menu items via the restaurant_id index
+        menu_items = (
+            db.reference("menu_items")
+            .order_by_child("restaurant_id")
+            .equal_to(restaurant_id)
+            .get()
+        ) or {}
+
+        # Null values delete every path in a single multi-path update,
+        # including the restaurant's menu change log
+        updates = {
+            f"restaurants/{restaurant_id}": None,
+            f"{CHANGES_PATH}/{restaurant_id}": None,
+        }
+        for menu_item_id in menu_items:
+            updates[f"menu_items/{menu_item_id}"] = None
+
+        # Clear the owner's back-reference if it points at this restaurant
+        if owner_uid:
+            owner_restaurant_id = db.reference(f"users/{owner_uid}/restaurant_id").get()
+            if owner_restaurant_id == restaurant_id:
+                updates[f"users/{owner_uid}/restaurant_id"] = None
+
+        removed = restaurant_counts(restaurant_data)
+        for menu_item_data in menu_items.values():
+            removed.update(menu_item_counts(menu_item_data))
+        updates.update(stat_updates(count_deltas(removed, Counter())))
+
+        db.reference("/").update(updates)
+        RESTAURANT_CACHE.pop(restaurant_id)
+        MENU_VIEWS.invalidate(restaurant_id)
+        publish_restaurant_event(restaurant_id, owner_uid, "delete")
+
+        return {
+            "message": f"Restaurant {restaurant_id} successfully deleted",
+            "deleted_menu_items": len(menu_items),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error deleting restaurant: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # Menu item routes remain largely the same but now check for admin status too
 @router.post("/restaurants/{restaurant_id}/menu")
 async def add_menu_item(
@@ -368,35 +417,7 @@ async def add_menu_item(
             )
 
         # Validate allergens and dietary categories
-        valid_allergens = {
-            "milk",
-            "eggs",
-            "fish",
-            "tree_nuts",
-            "wheat",
-            "shellfish",
-            "gluten_free",
-            "peanuts",
-            "soybeans",
-            "sesame",
-        }
-        valid_dietary_categories = {"vegan", "vegetarian"}
-
-        # Validate allergens
-        invalid_allergens = set(menu_item.allergens) - valid_allergens
-        if invalid_allergens:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid allergens: {', '.join(invalid_allergens)}",
-            )
-
-        # Validate dietary categories
-        invalid_categories = set(menu_item.dietaryCategories) - valid_dietary_categories
-        if invalid_categories:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid dietary categories: {', '.join(invalid_categories)}",
-            )
+        validate_menu_labels(menu_item.allergens, menu_item.dietaryCategories)
 
         menu_item_id = generate_id("menu_items")
         menu_item_dict = menu_item.dict()
@@ -408,9 +429,18 @@ async def add_menu_item(
             "id": menu_item_id,
         }
 
-        # Store menu item
-        menu_ref = db.reference("menu_items")
-        menu_ref.child(menu_item_id).set(menu_item_data)
+        # Store menu item together with its change log entry
+        seq = await run_in_threadpool(
+            write_menu,
+            restaurant_id,
+            {f"menu_items/{menu_item_id}": menu_item_data},
+            [("upsert", menu_item_id, menu_item_data)],
+            count_deltas(Counter(), menu_item_counts(menu_item_data)),
+        )
+        publish_menu_event(
+            restaurant_id, restaurant_data.get("owner_uid"), "upsert",
+            menu_item_id, menu_item_data, seq,
+        )
 
         return menu_item_data
 
@@ -422,13 +452,41 @@ async def add_menu_item(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def load_menu_items(
+    restaurant_id: str,
+    dietary_categories: Optional[List[str]] = None,
+    allergen_free: Optional[List[str]] = None,
+) -> List[dict]:
+    """Fetch a restaurant's menu items and apply the optional filters"""
+    # Get only this restaurant's menu items via the restaurant_id index
+    menu_items = (
+        db.reference("menu_items")
+        .order_by_child("restaurant_id")
+        .equal_to(restaurant_id)
+        .get()
+    ) or {}
+    menu_items = WRITE_BEHIND.overlay_menu(restaurant_id, menu_items)
+
+    restaurant_menu = [
+        {"id": str(item_id), **item_data}
+        for item_id, item_data in menu_items.items()
+        if item_data.get("restaurant_id") == restaurant_id
+    ]
+
+    # Apply dietary category and allergen-free filters if specified
+    return filter_menu(restaurant_menu, allergen_free, dietary_categories)
+
+
 @router.get("/restaurants/{restaurant_id}/menu")
 async def get_menu_items(
     restaurant_id: str,
     dietary_category: Optional[str] = None,
-    allergen_free: Optional[List[str]] = None,
+    allergen_free: Optional[List[str]] = Query(None),
+    profile: Optional[str] = None,
     token_data: dict = Depends(verify_token),
 ):
+    """A restaurant's menu, optionally filtered by query parameters and/or
+    one of the user's saved allergen profiles (``profile=<id>``)"""
     try:
         # Extract user ID from token
         user_id = token_data.get("uid")
@@ -439,8 +497,7 @@ async def get_menu_items(
         is_admin = await check_admin_status(token_data)
 
         # Verify restaurant exists
-        restaurant_ref = db.reference(f"restaurants/{restaurant_id}")
-        restaurant_data = restaurant_ref.get()
+        restaurant_data = get_restaurant_cached(restaurant_id)
 
         if not restaurant_data:
             raise HTTPException(
@@ -454,42 +511,102 @@ async def get_menu_items(
                 detail="You don't have permission to access this restaurant's menu",
             )
 
-        # Get all menu items for the restaurant
-        menu_ref = db.reference("menu_items")
-        menu_items = menu_ref.get()
+        allergen_free = list(allergen_free or [])
+        dietary_categories = [dietary_category] if dietary_category else []
+        if profile:
+            saved = await run_in_threadpool(get_profile, user_id, profile)
+            if not saved:
+                raise HTTPException(
+                    status_code=404, detail=f"Profile {profile} not found"
+                )
+            allergen_free += saved.get("allergen_free") or []
+            dietary_categories += saved.get("dietaryCategories") or []
+
+        # Views are cached per menu version, which is committed together with
+        # the data. Reading it first means a write racing with the load below
+        # only makes the entry stale.
+        filter_id = filter_hash(allergen_free, dietary_categories)
+        version = (
+            await run_in_threadpool(menu_version, restaurant_id),
+            WRITE_BEHIND.generation,
+        )
+        cached = MENU_VIEWS.get(restaurant_id, filter_id, version)
+        if cached is not None:
+            return cached
+
+        # Identical concurrent misses share one fetch; authorization above
+        # is still checked for every caller
+        menu = await MENU_READS.do(
+            (restaurant_id, filter_id, version),
+            lambda: run_in_threadpool(
+                load_menu_items, restaurant_id, dietary_categories, allergen_free
+            ),
+        )
+        MENU_VIEWS.set(restaurant_id, filter_id, version, menu)
+        return menu
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error fetching menu items: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if not menu_items:
-            return []
 
-        # Filter menu items for this restaurant
-        restaurant_menu = [
-            {"id": str(item_id), **item_data}
-            for item_id, item_data in menu_items.items()
-            if item_data.get("restaurant_id") == restaurant_id
-        ]
+@router.get("/restaurants/{restaurant_id}/menu/changes")
+async def get_menu_changes(
+    restaurant_id: str,
+    since: Optional[int] = None,
+    token_data: dict = Depends(verify_token),
+):
+    """Menu upserts and deletions after sequence ``since``, for delta sync.
 
-        # Apply dietary category filter if specified
-        if dietary_category:
-            restaurant_menu = [
-                item
-                for item in restaurant_menu
-                if dietary_category in item.get("dietaryCategories", [])
-            ]
-
-        # Apply allergen-free filter if specified
-        if allergen_free:
-            restaurant_menu = [
-                item
-                for item in restaurant_menu
-                if not any(
-                    allergen in item.get("allergens", []) for allergen in allergen_free
-                )
-            ]
+    Returns a full snapshot with ``reset: true`` when ``since`` is omitted
+    (first sync) or the change log has been compacted past it.
+    """
+    try:
+        # Extract user ID from token
+        user_id = token_data.get("uid")
+        if not user_id:
+            raise HTTPException(status_code=401, detail="Invalid user token")
+
+        # Verify restaurant exists
+        restaurant_data = await run_in_threadpool(
+            db.reference(f"restaurants/{restaurant_id}").get
+        )
+
+        if not restaurant_data:
+            raise HTTPException(
+                status_code=404, detail=f"Restaurant {restaurant_id} not found"
+            )
+
+        # Verify ownership or admin status
+        if restaurant_data.get("owner_uid") != user_id and not await check_admin_status(
+            token_data
+        ):
+            raise HTTPException(
+                status_code=403,
+                detail="You don't have permission to access this restaurant's menu",
+            )
 
-        return restaurant_menu
+        if since is not None:
+            changes = await run_in_threadpool(changes_since, restaurant_id, since)
+            if changes is not None:
+                return changes
+
+        # Read the committed sequence before the snapshot, so every change up
+        # to it is in the snapshot and no later change is missed
+        seq = await run_in_threadpool(committed_sequence, restaurant_id)
+        return {
+            "seq": seq,
+            "reset": True,
+            "upserts": await run_in_threadpool(load_menu_items, restaurant_id),
+            "deletes": [],
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error fetching menu items: {str(e)}")
+        print(f"Error fetching menu changes: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -507,7 +624,9 @@ async def update_menu_item(restaurant_id: str, menu_item_id: str, menu_item: Men
 
         # Verify menu item exists and belongs to the restaurant
         menu_ref = db.reference(f"menu_items/{menu_item_id}")
-        menu_item_data = menu_ref.get()
+        menu_item_data = WRITE_BEHIND.overlay_item(
+            restaurant_id, menu_item_id, menu_ref.get()
+        )
 
         if not menu_item_data:
             raise HTTPException(
@@ -528,8 +647,20 @@ async def update_menu_item(restaurant_id: str, menu_item_id: str, menu_item: Men
             "restaurant_id": restaurant_id,
         }
 
-        # Update in database
-        menu_ref.set(updated_menu_item)
+        # Update in database together with its change log entry
+        seq = await run_in_threadpool(
+            write_menu,
+            restaurant_id,
+            {f"menu_items/{menu_item_id}": updated_menu_item},
+            [("upsert", menu_item_id, updated_menu_item)],
+            count_deltas(
+                menu_item_counts(menu_item_data), menu_item_counts(updated_menu_item)
+            ),
+        )
+        publish_menu_event(
+            restaurant_id, restaurant_data.get("owner_uid"), "upsert",
+            menu_item_id, updated_menu_item, seq,
+        )
 
         return updated_menu_item
 
@@ -541,6 +672,104 @@ async def update_menu_item(restaurant_id: str, menu_item_id: str, menu_item: Men
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.patch("/restaurants/{restaurant_id}/menu/{menu_item_id}")
+async def patch_menu_item(
+    restaurant_id: str,
+    menu_item_id: str,
+    changes: MenuItemUpdate,
+    token_data: dict = Depends(verify_token),
+):
+    """Update only the provided fields of a menu item"""
+    try:
+        # Extract user ID from token
+        user_id = token_data.get("uid")
+        if not user_id:
+            raise HTTPException(status_code=401, detail="Invalid user token")
+
+        fields = changes.dict(exclude_unset=True)
+        if not fields:
+            raise HTTPException(status_code=400, detail="No fields to update")
+
+        # A null in a multi-path update deletes the field, and every menu
+        # item field is required; send [] to clear allergens or categories
+        null_fields = sorted(field for field, value in fields.items() if value is None)
+        if null_fields:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Fields cannot be null: {', '.join(null_fields)}",
+            )
+
+        validate_menu_labels(fields.get("allergens"), fields.get("dietaryCategories"))
+
+        # Verify restaurant exists (usually served from the cache)
+        restaurant_data = get_restaurant_cached(restaurant_id)
+        if not restaurant_data:
+            raise HTTPException(
+                status_code=404, detail=f"Restaurant {restaurant_id} not found"
+            )
+
+        # Verify ownership; only non-owners pay for the admin lookup
+        if restaurant_data.get("owner_uid") != user_id and not await check_admin_status(
+            token_data
+        ):
+            raise HTTPException(
+                status_code=403,
+                detail="You don't have permission to modify this restaurant's menu",
+            )
+
+        # Verify menu item exists and belongs to the restaurant
+        menu_ref = db.reference(f"menu_items/{menu_item_id}")
+        menu_item_data = WRITE_BEHIND.overlay_item(
+            restaurant_id, menu_item_id, menu_ref.get()
+        )
+
+        if not menu_item_data:
+            raise HTTPException(
+                status_code=404, detail=f"Menu item {menu_item_id} not found"
+            )
+
+        if menu_item_data.get("restaurant_id") != restaurant_id:
+            raise HTTPException(
+                status_code=403,
+                detail=f"Menu item {menu_item_id} does not belong to restaurant {restaurant_id}",
+            )
+
+        # Write only the fields whose values actually changed
+        changed = {
+            field: value
+            for field, value in fields.items()
+            if menu_item_data.get(field) != value
+        }
+        updated_menu_item = {**menu_item_data, **changed, "id": menu_item_id}
+        if changed:
+            seq = await run_in_threadpool(
+                write_menu,
+                restaurant_id,
+                {
+                    f"menu_items/{menu_item_id}/{field}": value
+                    for field, value in changed.items()
+                },
+                [("upsert", menu_item_id, updated_menu_item)],
+                count_deltas(
+                    menu_item_counts(menu_item_data),
+                    menu_item_counts(updated_menu_item),
+                ),
+            )
+            publish_menu_event(
+                restaurant_id, restaurant_data.get("owner_uid"), "upsert",
+                menu_item_id, updated_menu_item, seq,
+            )
+
+        return updated_menu_item
+
+    except HTTPException as he:
+        # Re-raise HTTP exceptions as is
+        raise he
+    except Exception as e:
+        print(f"Error patching menu item: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.delete("/restaurants/{restaurant_id}/menu/{menu_item_id}")
 async def delete_menu_item(restaurant_id: str, menu_item_id: str):
     try:
@@ -555,7 +784,9 @@ async def delete_menu_item(restaurant_id: str, menu_item_id: str):
 
         # Verify menu item exists and belongs to the restaurant
         menu_ref = db.reference(f"menu_items/{menu_item_id}")
-        menu_item_data = menu_ref.get()
+        menu_item_data = WRITE_BEHIND.overlay_item(
+            restaurant_id, menu_item_id, menu_ref.get()
+        )
 
         if not menu_item_data:
             raise HTTPException(
@@ -568,8 +799,18 @@ async def delete_menu_item(restaurant_id: str, menu_item_id: str):
                 detail=f"Menu item {menu_item_id} does not belong to restaurant {restaurant_id}",
             )
 
-        # Delete the menu item
-        menu_ref.delete()
+        # Delete the menu item and leave a tombstone in the change log
+        seq = await run_in_threadpool(
+            write_menu,
+            restaurant_id,
+            {f"menu_items/{menu_item_id}": None},
+            [("delete", menu_item_id, None)],
+            count_deltas(menu_item_counts(menu_item_data), Counter()),
+        )
+        publish_menu_event(
+            restaurant_id, restaurant_data.get("owner_uid"), "delete",
+            menu_item_id, seq=seq,
+        )
 
         return {"message": f"Menu item {menu_item_id} successfully deleted"}
 
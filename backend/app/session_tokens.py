@@ -0,0 +1,210 @@
+"""Stateless signed session tokens.
+
+A token looks like ``v1.<key id>.<payload>.<signature>``: the payload is
+base64url-encoded JSON claims (uid, email, name, is_admin, login time,
+expiry, token id) and the signature is an HMAC-SHA256 over everything
+before it. Any worker holding the signing keys can verify a token without a
+database read or shared session store.
+
+Keys come from ``SESSION_SIGNING_KEYS`` as ``kid:secret`` pairs separated by
+commas. The first key signs new tokens and every listed key is accepted, so
+keys can be rotated by prepending a new one and dropping the old one after a
+token lifetime has passed. When the variable is unset the backend keeps using
+opaque in-memory session tokens.
+
+Refreshed tokens keep the login time (``auth_time``) of the token they
+replace, so a session ends ``SESSION_MAX_AGE_SECONDS`` after login however
+often it is refreshed.
+"""
+from fastapi.concurrency import run_in_threadpool
+from firebase_admin import db
+from typing import Dict, List, Optional
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+TOKEN_VERSION = "v1"
+
+# Short lifetime so admin promotion/demotion takes effect quickly
+DEFAULT_TTL_SECONDS = 900
+
+# How long after login a session can still be refreshed
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+# Firebase path holding revoked token ids mapped to their expiry
+REVOKED_TOKENS_PATH = "revoked_tokens"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def is_signed_token(token: str) -> bool:
+    return token.startswith(TOKEN_VERSION + ".")
+
+
+class TokenSigner:
+    def __init__(
+        self,
+        keys: List[tuple],
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        max_age_seconds: int = DEFAULT_MAX_AGE_SECONDS,
+    ):
+        if not keys:
+            raise ValueError("At least one signing key is required")
+        self.active_kid = keys[0][0]
+        self.keys: Dict[str, bytes] = {kid: secret for kid, secret in keys}
+        self.ttl_seconds = ttl_seconds
+        self.max_age_seconds = max_age_seconds
+
+    @classmethod
+    def from_env(cls) -> Optional["TokenSigner"]:
+        spec = os.getenv("SESSION_SIGNING_KEYS")
+        if not spec:
+            return None
+        keys = []
+        for entry in spec.split(","):
+            kid, _, secret = entry.strip().partition(":")
+            if not kid or not secret:
+                raise ValueError("SESSION_SIGNING_KEYS entries must look like kid:secret")
+            keys.append((kid, secret.encode("utf-8")))
+        ttl = int(os.getenv("SESSION_TOKEN_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        max_age = int(os.getenv("SESSION_MAX_AGE_SECONDS", DEFAULT_MAX_AGE_SECONDS))
+        return cls(keys, ttl, max_age)
+
+    def _sign(self, kid: str, signing_input: str) -> str:
+        digest = hmac.new(self.keys[kid], signing_input.encode("ascii"), hashlib.sha256)
+        return _b64encode(digest.digest())
+
+    def issue(
+        self,
+        uid: str,
+        email: Optional[str],
+        name: Optional[str],
+        is_admin: bool,
+        auth_time: Optional[int] = None,
+    ) -> tuple:
+        """Return (token, claims) for a new session.
+
+        ``auth_time`` is the login time of the session being refreshed; the
+        token never outlives ``max_age_seconds`` after it.
+        """
+        now = int(time.time())
+        auth_time = now if auth_time is None else auth_time
+        claims = {
+            "uid": uid,
+            "email": email,
+            "name": name,
+            "adm": bool(is_admin),
+            "auth_time": auth_time,
+            "iat": now,
+            "exp": min(now + self.ttl_seconds, auth_time + self.max_age_seconds),
+            "jti": secrets.token_hex(8),
+        }
+        return self.sign_claims(claims), claims
+
+    def sign_claims(self, claims: dict) -> str:
+        """Sign arbitrary claims with the active key; ``exp`` is required"""
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        signing_input = f"{TOKEN_VERSION}.{self.active_kid}.{payload}"
+        return f"{signing_input}.{self._sign(self.active_kid, signing_input)}"
+
+    def verify(self, token: str) -> dict:
+        """Check signature and expiry; return the claims"""
+        try:
+            version, kid, payload, signature = token.split(".")
+        except ValueError:
+            raise InvalidToken("Malformed token")
+        if version != TOKEN_VERSION or kid not in self.keys:
+            raise InvalidToken("Unknown token version or key")
+
+        expected = self._sign(kid, f"{version}.{kid}.{payload}")
+        if not hmac.compare_digest(expected, signature):
+            raise InvalidToken("Bad signature")
+
+        try:
+            claims = json.loads(_b64decode(payload))
+        except Exception:
+            raise InvalidToken("Malformed payload")
+        if claims.get("exp", 0) <= time.time():
+            raise InvalidToken("Token expired")
+        return claims
+
+
+class RevocationList:
+    """Deny-list of revoked token ids, shared between workers through Firebase.
+
+    Entries only need to live until the token would have expired anyway, so
+    with short token lifetimes the list stays small. Each sync downloads just
+    the unexpired entries. The queries order by value, so ``revoked_tokens``
+    needs ``".indexOn": ".value"`` in the database rules.
+    """
+
+    def __init__(self):
+        self._revoked: Dict[str, int] = {}
+        self.last_sync: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.interval: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def revoke(self, jti: str, exp: int):
+        self._revoked[jti] = exp
+        db.reference(f"{REVOKED_TOKENS_PATH}/{jti}").set(exp)
+
+    def sync(self):
+        """Pull unexpired revocations and drop expired ones locally and remotely"""
+        now = int(time.time())
+        ref = db.reference(REVOKED_TOKENS_PATH)
+        active = ref.order_by_value().start_at(now).get() or {}
+        expired = ref.order_by_value().end_at(now - 1).get() or {}
+
+        self._revoked = {
+            jti: exp for jti, exp in self._revoked.items() if exp >= now
+        }
+        self._revoked.update(active)
+        if expired:
+            ref.update({jti: None for jti in expired})
+        self.last_sync = time.time()
+
+    def problem(self) -> Optional[str]:
+        """Why revocations may be out of date on this worker, or None"""
+        if self.interval is None:
+            return None
+        if self.last_error is not None:
+            return f"Token revocation sync failed: {self.last_error}"
+        if self.last_sync is None or time.time() - self.last_sync > 3 * self.interval:
+            return "Token revocations have not synced recently"
+        return None
+
+    async def run_sync_loop(self, interval: float):
+        self.interval = interval
+        while True:
+            try:
+                await run_in_threadpool(self.sync)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Token revocation sync error: {e}")
+            await asyncio.sleep(interval)
+
+
+SIGNER = TokenSigner.from_env()
+REVOCATIONS = RevocationList()
@@ -0,0 +1,342 @@
+"""Export and restore compressed snapshots of the catalog.
+
+A snapshot is a gzip-compressed JSON Lines file. The first line is a header,
+then each line is one chunk of up to ``page_size`` children of one tree
+(``{"tree": ..., "records": {key: value}}``), and the last line records how
+many children of each tree were written. Exports stream ``restaurants``,
+``menu_items`` and ``users`` with key-ordered page reads, so memory stays
+bounded by one page however large the database is.
+
+Restores check the whole file first, so a truncated snapshot writes nothing.
+They then write the children back with multi-path updates of up to
+``batch_size`` children, several batches at a time. Keys are kept, so ids
+stay the same and nothing goes through ``generate_id``. Afterwards the menu
+change log of every restaurant the snapshot touched is reset, so delta-sync
+clients refetch the whole menu and cached menu views go stale. A replacing
+restore resets every change log and also clears the stored AI parse results
+derived from the old data. The CLI then recounts the catalog statistics
+unless told not to.
+
+Usage (from the backend directory):
+    python app/snapshot.py export catalog.jsonl.gz
+    python app/snapshot.py import catalog.jsonl.gz [--replace] [--no-reconcile-stats]
+    python app/snapshot.py generate seed.jsonl.gz --restaurants 1000 --items 50
+    python app/snapshot.py import seed.jsonl.gz --memory
+
+``--memory`` runs against the in-memory stand-in in ``memory_db.py``
+instead of Firebase, which is useful for measuring restore throughput.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from firebase_admin import db
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+from paging import iter_pages
+from taxonomy import ALLERGENS
+from menu_changes import CHANGES_PATH, reset_log
+from ingredient_similarity import RESULTS_PATH
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+SNAPSHOT_FORMAT = "safeeats-snapshot"
+SNAPSHOT_VERSION = 1
+TREES = ("restaurants", "menu_items", "users")
+
+Chunk = Tuple[str, Dict[str, Any]]
+
+
+class SnapshotError(ValueError):
+    """The file is not a complete snapshot"""
+
+
+def write_snapshot(path: str, chunks: Iterable[Chunk], trees: Sequence[str] = TREES) -> Dict[str, int]:
+    """Write ``chunks`` of (tree, records) to ``path``; returns children per tree"""
+    counts = {tree: 0 for tree in trees}
+    # Write then rename so a failed export never leaves a partial snapshot behind
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as out:
+        header = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "created_at": time.time(),
+            "trees": list(trees),
+        }
+        out.write(json.dumps(header) + "\n")
+        for tree, records in chunks:
+            if not records:
+                continue
+            out.write(json.dumps({"tree": tree, "records": records}, separators=(",", ":")) + "\n")
+            counts[tree] += len(records)
+        out.write(json.dumps({"end": True, "counts": counts}) + "\n")
+    os.replace(tmp_path, path)
+    return counts
+
+
+def export_snapshot(path: str, trees: Sequence[str] = TREES, page_size: int = 500) -> Dict[str, int]:
+    """Stream ``trees`` from the database into a snapshot at ``path``"""
+
+    def chunks() -> Iterator[Chunk]:
+        for tree in trees:
+            for page in iter_pages(tree, page_size):
+                yield tree, dict(page)
+
+    return write_snapshot(path, chunks(), trees)
+
+
+def read_snapshot(path: str) -> Tuple[dict, Iterator[Chunk]]:
+    """The header of the snapshot at ``path`` and an iterator over its chunks.
+
+    The iterator raises SnapshotError if the file ends early or its counts
+    don't match.
+    """
+    f = gzip.open(path, "rt", encoding="utf-8")
+    try:
+        header = json.loads(f.readline() or "null")
+    except (OSError, EOFError, ValueError) as e:
+        f.close()
+        raise SnapshotError(f"{path} is not a snapshot: {str(e)}")
+    if not isinstance(header, dict) or header.get("format") != SNAPSHOT_FORMAT:
+        f.close()
+        raise SnapshotError(f"{path} is not a snapshot")
+    if header.get("version") != SNAPSHOT_VERSION:
+        f.close()
+        raise SnapshotError(f"Unsupported snapshot version {header.get('version')}")
+
+    def chunks() -> Iterator[Chunk]:
+        counts = {tree: 0 for tree in header["trees"]}
+        with f:
+            try:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry.get("end"):
+                        if entry.get("counts") != counts:
+                            raise SnapshotError(f"{path} has {counts} children, expected {entry.get('counts')}")
+                        return
+                    tree, records = entry["tree"], entry["records"]
+                    if tree not in counts:
+                        raise SnapshotError(f"{path} has a chunk for unknown tree {tree}")
+                    counts[tree] += len(records)
+                    yield tree, records
+            except SnapshotError:
+                raise
+            except (OSError, EOFError, ValueError, KeyError) as e:
+                raise SnapshotError(f"{path} is damaged: {str(e)}")
+        raise SnapshotError(f"{path} is truncated")
+
+    return header, chunks()
+
+
+def check_snapshot(path: str) -> Dict[str, int]:
+    """Read through the snapshot at ``path`` without keeping it; returns children per tree"""
+    header, chunks = read_snapshot(path)
+    counts = {tree: 0 for tree in header["trees"]}
+    for tree, records in chunks:
+        counts[tree] += len(records)
+    return counts
+
+
+def write_batch(updates: Dict[str, Any]) -> int:
+    """One multi-path update; returns how many children it wrote"""
+    db.reference("/").update(updates)
+    return len(updates)
+
+
+def import_snapshot(
+    path: str,
+    batch_size: int = 500,
+    workers: int = 8,
+    replace: bool = False,
+    progress_every: int = 0,
+) -> dict:
+    """Restore the snapshot at ``path``; returns counts and throughput.
+
+    Existing children with the same keys are overwritten. With ``replace``
+    the snapshot's trees are deleted first, so nothing else is left in them,
+    and data derived from the old trees is cleared afterwards. Either way the
+    change logs of the restaurants the snapshot touched are reset.
+    """
+    expected = check_snapshot(path)
+    header, chunks = read_snapshot(path)
+    if replace:
+        for tree in header["trees"]:
+            db.reference(tree).delete()
+
+    started = time.perf_counter()
+    written = 0
+    batches = 0
+    reported = 0
+    in_flight = set()
+
+    def finish(done):
+        nonlocal written, reported
+        for future in done:
+            in_flight.discard(future)
+            # Re-raises the first failed write, which stops the restore
+            written += future.result()
+        if progress_every and written - reported >= progress_every:
+            reported = written
+            print(f"Restored {written} children ({written / (time.perf_counter() - started):.0f}/s)")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def submit(updates: Dict[str, Any]):
+            nonlocal batches
+            # At most two batches per worker queued, so memory stays bounded
+            while len(in_flight) >= workers * 2:
+                finish(wait(in_flight, return_when=FIRST_COMPLETED).done)
+            in_flight.add(executor.submit(write_batch, updates))
+            batches += 1
+
+        pending: Dict[str, Any] = {}
+        # Restaurants whose menus change, so their change logs are reset
+        touched = set()
+        for tree, records in chunks:
+            for key, value in records.items():
+                pending[f"{tree}/{key}"] = value
+                if tree == "restaurants":
+                    touched.add(key)
+                elif tree == "menu_items" and isinstance(value, dict) and value.get("restaurant_id"):
+                    touched.add(value["restaurant_id"])
+                if len(pending) >= batch_size:
+                    submit(pending)
+                    pending = {}
+        if pending:
+            submit(pending)
+        finish(wait(in_flight).done)
+
+        # Clients' delta-sync positions and cached menu views refer to the old data
+        if replace:
+            db.reference(RESULTS_PATH).delete()
+            touched.update(db.reference(CHANGES_PATH).get(shallow=True) or {})
+        change_logs = len(list(executor.map(reset_log, sorted(touched))))
+
+    seconds = time.perf_counter() - started
+    return {
+        "counts": expected,
+        "change_logs_reset": change_logs,
+        "items": written,
+        "batches": batches,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(written / seconds, 1) if seconds else None,
+    }
+
+
+def generate_chunks(restaurants: int, items: int, chunk_size: int = 500, seed: int = 0) -> Iterator[Chunk]:
+    """Synthetic catalog: ``restaurants`` owners, each with a restaurant of ``items`` dishes"""
+    rng = random.Random(seed)
+    cuisines = ["italian", "thai", "mexican", "indian", "japanese", "american"]
+
+    def in_chunks(tree: str, records: Iterator[Tuple[str, dict]]) -> Iterator[Chunk]:
+        chunk = {}
+        for key, value in records:
+            chunk[key] = value
+            if len(chunk) >= chunk_size:
+                yield tree, chunk
+                chunk = {}
+        if chunk:
+            yield tree, chunk
+
+    yield from in_chunks("restaurants", (
+        (str(10000 + r), {"name": f"Restaurant {r}", "address": f"{r} Main St", "phone": "555-0100",
+                          "cuisine_type": rng.choice(cuisines), "owner_uid": f"seed-owner-{r}"})
+        for r in range(restaurants)
+    ))
+    yield from in_chunks("menu_items", (
+        (str(10000 + r * items + i), {
+            "restaurant_id": str(10000 + r),
+            "name": f"Dish {i}",
+            "description": "",
+            "price": round(rng.uniform(4, 30), 2),
+            "allergens": rng.sample(ALLERGENS, rng.randint(0, 3)),
+            "dietaryCategories": rng.choice([[], ["vegetarian"], ["vegan", "vegetarian"]]),
+        })
+        for r in range(restaurants) for i in range(items)
+    ))
+    yield from in_chunks("users", (
+        (f"seed-owner-{r}", {"email": f"owner{r}@example.com", "name": f"Owner {r}", "is_admin": False,
+                             "restaurant_id": str(10000 + r), "created_at": 0})
+        for r in range(restaurants)
+    ))
+
+
+def connect(memory: bool) -> Optional[Any]:
+    """Point ``db.reference`` at the in-memory stand-in or at Firebase"""
+    if memory:
+        from memory_db import install
+        return install()
+    from main import initialize_firebase, FIREBASE_STATE
+    initialize_firebase()
+    if not FIREBASE_STATE["ready"]:
+        sys.exit(f"Could not connect to Firebase: {FIREBASE_STATE['error']}")
+    return None
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Export and restore compressed catalog snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = commands.add_parser("export", help="write the database to a snapshot")
+    export_cmd.add_argument("path")
+    export_cmd.add_argument("--trees", nargs="+", choices=TREES, default=list(TREES))
+    export_cmd.add_argument("--page-size", type=int, default=500)
+    export_cmd.add_argument("--memory", action="store_true", help="use the in-memory database")
+
+    import_cmd = commands.add_parser("import", help="restore a snapshot into the database")
+    import_cmd.add_argument("path")
+    import_cmd.add_argument("--batch-size", type=int, default=500)
+    import_cmd.add_argument("--workers", type=int, default=8)
+    import_cmd.add_argument("--replace", action="store_true", help="delete the snapshot's trees first")
+    import_cmd.add_argument(
+        "--reconcile-stats", action=argparse.BooleanOptionalAction, default=True,
+        help="recount the catalog statistics afterwards (default: on)",
+    )
+    import_cmd.add_argument("--memory", action="store_true", help="use the in-memory database")
+
+    generate_cmd = commands.add_parser("generate", help="write a synthetic snapshot")
+    generate_cmd.add_argument("path")
+    generate_cmd.add_argument("--restaurants", type=int, default=100)
+    generate_cmd.add_argument("--items", type=int, default=50, help="menu items per restaurant")
+    generate_cmd.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "generate":
+            counts = write_snapshot(args.path, generate_chunks(args.restaurants, args.items, seed=args.seed))
+            print(f"Wrote {args.path}: {counts}")
+            return
+
+        memory = connect(args.memory)
+        if args.command == "export":
+            started = time.perf_counter()
+            counts = export_snapshot(args.path, args.trees, args.page_size)
+            print(f"Wrote {args.path}: {counts} in {time.perf_counter() - started:.1f}s "
+                  f"({os.path.getsize(args.path)} bytes)")
+        else:
+            report = import_snapshot(args.path, args.batch_size, args.workers, args.replace,
+                                     progress_every=10000)
+            print(f"Restored {report['items']} children {report['counts']} in {report['batches']} batches, "
+                  f"{report['seconds']}s ({report['items_per_second']} items/s)")
+            print(f"Reset {report['change_logs_reset']} menu change logs"
+                  + (" and cleared stored AI parse results" if args.replace else ""))
+            if memory is not None:
+                print(f"In-memory database: {memory.round_trips} round trips")
+            if not args.reconcile_stats:
+                print("Warning: catalog statistics were not recounted and may not match the "
+                      "imported data; run the import with --reconcile-stats or POST /admin/stats/reconcile")
+            else:
+                from catalog_stats import StatsReconciler
+                result = StatsReconciler().run(fix=True)
+                if result["drift"] and not result["fixed"]:
+                    print("Catalog statistics: writes happened during the recount; run it again")
+                else:
+                    print(f"Catalog statistics: corrected {len(result['drift'])} counters")
+    except (SnapshotError, OSError) as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
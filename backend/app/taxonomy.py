@@ -0,0 +1,151 @@
+"""Allergen and dietary category ids shared by validation, AI parsing and
+re-classification, plus a keyword classifier that runs without the model."""
+from typing import Iterable, List, Optional, Set, Tuple
+import re
+
+# Bump when ids or keyword rules change so stored items get re-classified
+TAXONOMY_VERSION = 3
+
+# Allergens the parsers can detect (the FDA major food allergens)
+ALLERGENS = (
+    "milk",
+    "eggs",
+    "fish",
+    "tree_nuts",
+    "wheat",
+    "shellfish",
+    "peanuts",
+    "soybeans",
+    "sesame",
+)
+
+# Set by hand in the menu form; no parser produces or removes it
+OWNER_ONLY_LABELS = ("gluten_free",)
+
+VALID_ALLERGENS = set(ALLERGENS) | set(OWNER_ONLY_LABELS)
+DIETARY_CATEGORIES = ("vegan", "vegetarian")
+VALID_DIETARY_CATEGORIES = set(DIETARY_CATEGORIES)
+
+# Other spellings seen from the model and in older stored items
+SYNONYMS = {
+    "tree nuts": "tree_nuts",
+    "treenuts": "tree_nuts",
+    "nuts": "tree_nuts",
+    "gluten": "wheat",  # approximate mapping for common usage
+    "crustaceans": "shellfish",
+    "crustacean": "shellfish",
+    "dairy": "milk",
+    "egg": "eggs",
+    "peanut": "peanuts",
+    "soy": "soybeans",
+    "soya": "soybeans",
+    "soybean": "soybeans",
+}
+
+# Words that indicate an allergen in a name, description or ingredient list.
+# They match whole words and their plurals ("almonds"), so "eggplant" and
+# "butternut" don't count; other forms are listed explicitly.
+ALLERGEN_KEYWORDS = {
+    "milk": ["milk", "buttermilk", "cheese", "cheesy", "butter", "buttery", "buttered", "cream",
+             "creamy", "yogurt", "yoghurt", "whey", "casein", "ghee", "mozzarella", "parmesan",
+             "cheddar", "ricotta", "feta", "alfredo", "queso"],
+    "eggs": ["egg", "mayo", "mayonnaise", "aioli", "meringue", "custard", "frittata", "omelet",
+             "omelette"],
+    "fish": ["fish", "salmon", "tuna", "cod", "anchovy", "anchovies", "tilapia", "halibut",
+             "trout", "sardine", "mackerel", "bass", "snapper", "caesar"],
+    "shellfish": ["shrimp", "prawn", "crab", "lobster", "crayfish", "crawfish", "langoustine"],
+    "tree_nuts": ["almond", "cashew", "walnut", "pecan", "pistachio", "hazelnut",
+                  "macadamia", "pine nut", "praline", "pesto"],
+    "peanuts": ["peanut", "satay"],
+    "wheat": ["wheat", "flour", "bread", "breaded", "breadcrumb", "pasta", "spaghetti", "bun",
+              "crouton", "seitan", "couscous", "panko", "tempura", "pita", "bagel"],
+    "soybeans": ["soy", "tofu", "edamame", "miso", "tempeh"],
+    "sesame": ["sesame", "tahini", "hummus"],
+}
+
+# Words just before a keyword that make it a plant-based stand-in:
+# "vegan cheese", "peanut butter", "oat milk", "coconut cream"
+PLANT_MODIFIERS = ["vegan", "plant[- ]based", "vegetable", "mock", "faux", "coconut", "almond",
+                   "cashew", "oat", "soy", "rice", "nut", "peanut", "cocoa", "cacao", "shea",
+                   "apple", "sunflower", "hemp", "flax"]
+
+# Words just before a keyword that rule the allergen out
+ALLERGEN_NEGATIONS = {
+    "milk": PLANT_MODIFIERS + ["dairy[- ]free", "non[- ]dairy", "lactose[- ]free", "milk[- ]free"],
+    "eggs": ["vegan", "plant[- ]based", "egg[- ]free", "eggless"],
+    "fish": ["vegan", "plant[- ]based", "mock", "faux"],
+    "shellfish": ["vegan", "plant[- ]based", "mock", "faux"],
+    "wheat": ["gluten[- ]free", "wheat[- ]free", "rice", "corn", "almond", "coconut", "chickpea"],
+}
+
+# Ingredients that rule out a dietary category
+NOT_VEGETARIAN_KEYWORDS = ["chicken", "beef", "pork", "bacon", "ham", "hamburger", "turkey",
+                           "lamb", "sausage", "pepperoni", "salami", "prosciutto", "duck", "veal",
+                           "chorizo", "gelatin", "steak", "meatball", "anchovy", "anchovies"]
+NOT_VEGAN_KEYWORDS = ["honey"]
+
+# Words just before a meat keyword that make it a meat substitute
+MEATLESS_MODIFIERS = ["vegan", "vegetarian", "veggie", "plant[- ]based", "meatless", "mock",
+                      "faux", "tofu", "seitan", "tempeh", "soy", "jackfruit", "mushroom",
+                      "cauliflower", "eggplant", "beyond", "impossible"]
+
+# Allergens that also rule out a dietary category
+NOT_VEGAN_ALLERGENS = {"milk", "eggs", "fish", "shellfish"}
+NOT_VEGETARIAN_ALLERGENS = {"fish", "shellfish"}
+
+
+def _keyword_pattern(keywords: List[str], negations: Iterable[str] = ()) -> re.Pattern:
+    # Whole words with an optional plural; "-free"/" free" after the keyword
+    # negates it, and so does a negating word before it (see keyword_found)
+    alternatives = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+    negation = "|".join(negations) or "(?!)"
+    return re.compile(
+        rf"(?P<negated>\b(?:{negation})\s+)?\b(?:{alternatives})(?:e?s)?\b(?![- ]free)",
+        re.IGNORECASE,
+    )
+
+
+def keyword_found(pattern: re.Pattern, text: str) -> bool:
+    """True if ``pattern`` matches ``text`` without a negating word in front"""
+    return any(not match.group("negated") for match in pattern.finditer(text))
+
+
+ALLERGEN_PATTERNS = {
+    a: _keyword_pattern(k, ALLERGEN_NEGATIONS.get(a, ())) for a, k in ALLERGEN_KEYWORDS.items()
+}
+NOT_VEGETARIAN_PATTERN = _keyword_pattern(NOT_VEGETARIAN_KEYWORDS, MEATLESS_MODIFIERS)
+NOT_VEGAN_PATTERN = _keyword_pattern(NOT_VEGAN_KEYWORDS)
+
+
+def normalize_label(value: str) -> str:
+    """Map a label to its canonical id form (lowercase, synonyms, underscores)"""
+    v = (value or "").strip().lower()
+    v = SYNONYMS.get(v, v)
+    return v.replace(" ", "_").replace("-", "_")
+
+
+def normalize_allergens(values: Optional[Iterable[str]], allowed: Set[str] = VALID_ALLERGENS) -> List[str]:
+    """Canonical, de-duplicated allergen ids in taxonomy order; unknown ids are dropped"""
+    found = {normalize_label(v) for v in values or []}
+    order = list(ALLERGENS) + list(OWNER_ONLY_LABELS)
+    return [a for a in order if a in found and a in allowed]
+
+
+def normalize_dietary(values: Optional[Iterable[str]]) -> List[str]:
+    found = {normalize_label(v) for v in values or []}
+    return [d for d in DIETARY_CATEGORIES if d in found]
+
+
+def classify_text(text: str) -> Tuple[Set[str], bool, bool]:
+    """Keyword classification: (allergens, rules out vegan, rules out vegetarian)"""
+    text = text or ""
+    allergens = {a for a, pattern in ALLERGEN_PATTERNS.items() if keyword_found(pattern, text)}
+    not_vegetarian = keyword_found(NOT_VEGETARIAN_PATTERN, text) or bool(
+        allergens & NOT_VEGETARIAN_ALLERGENS
+    )
+    not_vegan = (
+        not_vegetarian
+        or keyword_found(NOT_VEGAN_PATTERN, text)
+        or bool(allergens & NOT_VEGAN_ALLERGENS)
+    )
+    return allergens, not_vegan, not_vegetarian
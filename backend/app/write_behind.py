@@ -0,0 +1,625 @@
+"""Optional write-behind buffer for menu edits.
+
+With ``MENU_WRITE_BEHIND=1`` a validated menu write is appended to a local
+journal (fsynced) and acknowledged right away instead of waiting on Firebase.
+Pending writes are coalesced per path, so repeated edits to the same item
+collapse into one, and a background task commits everything in a single
+multi-path ``update()`` every ``MENU_WRITE_BEHIND_FLUSH_MS`` milliseconds or
+once ``MENU_WRITE_BEHIND_BATCH`` writes have queued up. Change log entries
+are allocated at flush time, one sequence reservation per restaurant, and
+catalog counter deltas are summed and written as increments in the same update.
+
+Reads on this worker see pending writes through ``overlay_item`` and
+``overlay_menu``. Journal segments are deleted only after their writes are
+committed.
+
+Each process journals into its own ``worker-*`` directory under
+``JOURNAL_DIR`` and holds that directory's lock file for as long as it runs.
+At startup a process adopts every directory whose lock is free, because its
+owner has exited. Each flush also writes a marker per committed segment in
+the same update. So segments that a crashed process committed but had not
+yet deleted are dropped, not replayed, and their data and counter increments
+are not applied twice.
+
+A failed ``update()`` may still have been applied, for example when the
+connection drops before the response arrives. The failed batch is therefore
+held apart until the next flush reads one of its markers: if the marker is
+there, the batch is treated as committed; otherwise it is retried. Counter
+increments are never sent twice.
+"""
+from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.concurrency import run_in_threadpool
+from firebase_admin import db
+from typing import Any, Dict, List, Optional
+from auth_routes import admin_only
+from menu_changes import Change, record_changes, write_menu_changes
+from catalog_stats import stat_updates
+from menu_views import MENU_VIEWS
+from collections import Counter
+import asyncio
+import copy
+import glob
+import json
+import os
+import secrets
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+write_behind_router = APIRouter()
+
+JOURNAL_DIR = os.getenv(
+    "MENU_WRITE_BEHIND_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "menu_journal"),
+)
+
+LOCK_NAME = "lock"
+
+# Markers of committed journal segments, written with the segment's data
+COMMITTED_PATH = "write_behind/committed"
+
+
+def try_lock(path: str):
+    """Open ``path`` and lock it exclusively without waiting.
+
+    Returns the open file, which holds the lock until it is closed or the
+    process exits, or None if another process holds it.
+    """
+    f = open(path, "a+")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def segment_id(segment: str) -> str:
+    """Key for a segment's commit marker: its directory plus its number"""
+    directory = os.path.basename(os.path.dirname(segment))
+    return f"{directory}-{os.path.basename(segment).split('.')[1]}"
+
+
+def set_nested(node: dict, parts: List[str], value: Any):
+    """Apply a Firebase-style write of ``value`` at ``parts`` below ``node``"""
+    for part in parts[:-1]:
+        child = node.get(part)
+        if not isinstance(child, dict):
+            child = node[part] = {}
+        node = child
+    if value is None:
+        node.pop(parts[-1], None)
+    else:
+        node[parts[-1]] = value
+
+
+def merge_path(paths: Dict[str, Any], path: str, value: Any):
+    """Coalesce a write into pending ``paths`` so only the latest value survives"""
+    # A write to a node replaces anything pending beneath it
+    prefix = path + "/"
+    for pending in [p for p in paths if p.startswith(prefix)]:
+        del paths[pending]
+
+    # A write beneath a pending node is folded into that node's value
+    parts = path.split("/")
+    for i in range(len(parts) - 1, 0, -1):
+        parent = "/".join(parts[:i])
+        if parent in paths:
+            node = paths[parent]
+            node = copy.deepcopy(node) if isinstance(node, dict) else {}
+            set_nested(node, parts[i:], value)
+            paths[parent] = node
+            return
+
+    paths.pop(path, None)
+    paths[path] = value
+
+
+def apply_record(
+    record: dict,
+    pending: Dict[str, Dict[str, Any]],
+    changes: Dict[str, Dict[str, Change]],
+    stats: Dict[str, Counter],
+) -> int:
+    """Apply one journal record to pending writes; returns the ops it added"""
+    restaurant_id = record.get("discard")
+    if restaurant_id is not None:
+        pending.pop(restaurant_id, None)
+        changes.pop(restaurant_id, None)
+        stats.pop(restaurant_id, None)
+        return 0
+
+    restaurant_id = record["rid"]
+    paths = pending.setdefault(restaurant_id, {})
+    for path, value in record["updates"].items():
+        merge_path(paths, path, value)
+    item_changes = changes.setdefault(restaurant_id, {})
+    for op, menu_item_id, item in record["changes"]:
+        # Only the latest change to each item needs a log entry
+        item_changes.pop(menu_item_id, None)
+        item_changes[menu_item_id] = (op, menu_item_id, item)
+    stats.setdefault(restaurant_id, Counter()).update(record.get("stats") or {})
+    return 1
+
+
+class WriteBehindBuffer:
+    """Journaled, coalescing buffer of pending menu writes."""
+
+    def __init__(
+        self,
+        enabled: bool,
+        journal_dir: str,
+        flush_interval: float,
+        max_batch: int,
+        max_pending: int,
+    ):
+        self.enabled = enabled
+        self.journal_dir = journal_dir
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        # Bumped on every accepted write so cached reads can tell they are stale
+        self.generation = 0
+        self.flushes = 0
+        self.flushed_ops = 0
+        self.failures = 0
+        self.last_flush_seconds: Optional[float] = None
+
+        # restaurant_id -> {path: value}, and restaurant_id -> {item_id: change}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._changes: Dict[str, Dict[str, Change]] = {}
+        self._stats: Dict[str, Counter] = {}
+        self._pending_ops = 0
+        # Batch currently being committed; still visible to reads
+        self._inflight: Optional[tuple] = None
+        # Batch whose update() failed and may still have been applied:
+        # (paths, changes, stats, ops, segments, markers)
+        self._unconfirmed: Optional[tuple] = None
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker_dir: Optional[str] = None
+        self._worker_lock = None
+        self._segment = None
+        self._segment_number = 0
+        self._sealed: List[str] = []
+        # Journal directories of exited processes: (directory, lock file)
+        self._adopted: List[tuple] = []
+        self._replayed = False
+        # Markers of segments deleted after the last flush, removed by the next
+        self._stale_markers: List[str] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "WriteBehindBuffer":
+        return cls(
+            enabled=os.getenv("MENU_WRITE_BEHIND", "").lower() in ("1", "true", "yes"),
+            journal_dir=JOURNAL_DIR,
+            flush_interval=int(os.getenv("MENU_WRITE_BEHIND_FLUSH_MS", "250")) / 1000,
+            max_batch=int(os.getenv("MENU_WRITE_BEHIND_BATCH", "200")),
+            max_pending=int(os.getenv("MENU_WRITE_BEHIND_MAX_PENDING", "10000")),
+        )
+
+    # Journal
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self._worker_dir, f"segment.{number:08d}.jsonl")
+
+    def _open_segment(self):
+        self._segment_number += 1
+        self._segment = open(self._segment_path(self._segment_number), "a", encoding="utf-8")
+
+    def _append(self, record: dict):
+        self._segment.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+
+    def _rotate(self) -> List[str]:
+        """Seal the current segment; return every segment awaiting commit"""
+        self._segment.close()
+        self._sealed.append(self._segment.name)
+        self._open_segment()
+        return list(self._sealed)
+
+    def recover(self):
+        """Claim a journal directory for this process and adopt those of
+        processes that have exited; their writes are replayed by the first
+        flush, once Firebase is reachable"""
+        os.makedirs(self.journal_dir, exist_ok=True)
+        # Segments directly in JOURNAL_DIR come from before per-process directories
+        candidates = [self.journal_dir] + sorted(
+            glob.glob(os.path.join(self.journal_dir, "worker-*"))
+        )
+        for directory in candidates:
+            if directory == self.journal_dir and not glob.glob(
+                os.path.join(directory, "segment.*.jsonl")
+            ):
+                continue
+            lock = try_lock(os.path.join(directory, LOCK_NAME))
+            if lock is not None:
+                self._adopted.append((directory, lock))
+
+        # Lock the new directory before giving it a name others look for
+        claiming = os.path.join(self.journal_dir, f".claim-{secrets.token_hex(6)}")
+        os.makedirs(claiming)
+        self._worker_lock = try_lock(os.path.join(claiming, LOCK_NAME))
+        self._worker_dir = os.path.join(self.journal_dir, "worker-" + claiming.rsplit("-", 1)[1])
+        os.rename(claiming, self._worker_dir)
+        self._open_segment()
+        self._replayed = not self._adopted
+
+    def replay_adopted(self):
+        """Queue the writes of adopted journals underneath this worker's own.
+
+        Segments with a commit marker were committed before their process
+        exited and are dropped instead of replayed.
+        """
+        with self._flush_lock:
+            if self._replayed:
+                return
+            committed = db.reference(COMMITTED_PATH).get(shallow=True) or {}
+            pending: Dict[str, Dict[str, Any]] = {}
+            changes: Dict[str, Dict[str, Change]] = {}
+            stats: Dict[str, Counter] = {}
+            ops = 0
+            replay: List[str] = []
+            for directory, _ in self._adopted:
+                for segment in sorted(glob.glob(os.path.join(directory, "segment.*.jsonl"))):
+                    if segment_id(segment) in committed:
+                        os.remove(segment)
+                        self._stale_markers.append(segment_id(segment))
+                        continue
+                    with open(segment, encoding="utf-8") as f:
+                        for line in f:
+                            try:
+                                record = json.loads(line)
+                            except ValueError:
+                                # Torn final line from a crash mid-append; it was never acknowledged
+                                break
+                            ops += apply_record(record, pending, changes, stats)
+                    replay.append(segment)
+
+            with self._lock:
+                self._put_back(pending, changes, stats, ops)
+                self._sealed = replay + self._sealed
+                self.generation += 1
+            self._replayed = True
+            self._release_adopted()
+            if ops:
+                print(f"Replayed {ops} pending menu writes from the journal")
+
+    def _release_adopted(self):
+        """Remove adopted journal directories once all their segments are gone"""
+        kept = []
+        for directory, lock in self._adopted:
+            if glob.glob(os.path.join(directory, "segment.*.jsonl")):
+                kept.append((directory, lock))
+                continue
+            lock.close()
+            if directory != self.journal_dir:
+                try:
+                    os.remove(os.path.join(directory, LOCK_NAME))
+                    os.rmdir(directory)
+                except OSError as e:
+                    print(f"Could not remove journal directory {directory}: {e}")
+        self._adopted = kept
+
+    # Buffer
+
+    def _apply(self, record: dict):
+        ops = apply_record(record, self._pending, self._changes, self._stats)
+        self._pending_ops += ops
+        if ops:
+            self.generation += 1
+
+    def _put_back(self, paths, changes, stats, ops: int):
+        """Make ``paths``/``changes``/``stats`` the pending writes, with anything
+        written since layered on top; the caller holds ``_lock``"""
+        newer_paths, newer_changes, newer_stats = self._pending, self._changes, self._stats
+        self._pending, self._changes, self._stats = paths, changes, stats
+        for restaurant_id, deltas in newer_stats.items():
+            self._stats.setdefault(restaurant_id, Counter()).update(deltas)
+        for restaurant_id, restaurant_paths in newer_paths.items():
+            merged = self._pending.setdefault(restaurant_id, {})
+            for path, value in restaurant_paths.items():
+                merge_path(merged, path, value)
+        for restaurant_id, restaurant_changes in newer_changes.items():
+            merged = self._changes.setdefault(restaurant_id, {})
+            for menu_item_id, change in restaurant_changes.items():
+                merged.pop(menu_item_id, None)
+                merged[menu_item_id] = change
+        self._pending_ops += ops
+
+    def submit(
+        self,
+        restaurant_id: str,
+        updates: dict,
+        changes: List[Change],
+        stat_deltas: Optional[Dict[str, int]] = None,
+    ):
+        """Journal a write and add it to the buffer; returns once it is durable"""
+        with self._lock:
+            if self._pending_ops >= self.max_pending:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many unsaved menu changes, try again shortly",
+                    headers={"Retry-After": "5"},
+                )
+            record = {
+                "rid": restaurant_id,
+                "updates": updates,
+                "changes": changes,
+                "stats": stat_deltas or {},
+            }
+            self._append(record)
+            self._apply(record)
+            full = self._pending_ops >= self.max_batch
+        if full and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def discard(self, restaurant_id: str):
+        """Drop pending writes for a restaurant that is being deleted"""
+        # Waiting for an in-flight flush keeps it from recreating deleted items
+        with self._flush_lock, self._lock:
+            unconfirmed = self._unconfirmed
+            if unconfirmed is not None and restaurant_id in unconfirmed[0]:
+                # Journaled below, so a replay drops these writes as well
+                apply_record({"discard": restaurant_id}, *unconfirmed[:3])
+            elif restaurant_id not in self._pending:
+                return
+            self._append({"discard": restaurant_id})
+            self._apply({"discard": restaurant_id})
+
+    def _resolve_unconfirmed(self):
+        """Settle a batch whose update() failed; the caller holds ``_flush_lock``.
+
+        All markers are written in the same update as the data, so one marker
+        tells whether the whole batch was applied.
+        """
+        paths, changes, stats, ops, segments, markers = self._unconfirmed
+        applied = db.reference(f"{COMMITTED_PATH}/{markers[0]}").get() is not None
+        with self._lock:
+            self._unconfirmed = None
+            self._inflight = None
+            if not applied:
+                # Retry it underneath anything written since
+                self._put_back(paths, changes, stats, ops)
+                return
+        self._committed(segments, markers, ops)
+
+    def _committed(self, segments: List[str], markers: List[str], ops: int):
+        """Delete committed segments and count the flush"""
+        with self._lock:
+            self._sealed = [s for s in self._sealed if s not in segments]
+        for segment in segments:
+            os.remove(segment)
+        # The segments are gone, so their markers can go with the next flush
+        self._stale_markers = markers
+        if self._adopted:
+            self._release_adopted()
+        self.flushes += 1
+        self.flushed_ops += ops
+
+    def flush(self) -> int:
+        """Commit all pending writes in one multi-path update; return the op count"""
+        if not self._replayed:
+            # Older writes from adopted journals must land before newer ones
+            self.replay_adopted()
+        with self._flush_lock:
+            if self._unconfirmed is not None:
+                self._resolve_unconfirmed()
+            with self._lock:
+                if not self._pending and not self._sealed:
+                    return 0
+                batch_paths, batch_changes = self._pending, self._changes
+                batch_stats, ops = self._stats, self._pending_ops
+                self._pending, self._changes, self._stats = {}, {}, {}
+                self._pending_ops = 0
+                self._inflight = (batch_paths, batch_changes)
+                segments = self._rotate()
+
+            started = time.perf_counter()
+            # Markers let a process adopting these segments after a crash
+            # skip the ones already committed, so deltas apply once
+            markers = [segment_id(segment) for segment in segments]
+            sent = False
+            try:
+                updates: Dict[str, Any] = {}
+                for restaurant_id, paths in batch_paths.items():
+                    updates.update(paths)
+                    changes = list(batch_changes.get(restaurant_id, {}).values())
+                    if changes:
+                        record_changes(restaurant_id, changes, updates)
+                total = Counter()
+                for deltas in batch_stats.values():
+                    total.update(deltas)
+                updates.update(stat_updates(dict(total)))
+                for marker in markers:
+                    updates[f"{COMMITTED_PATH}/{marker}"] = {".sv": "timestamp"}
+                for marker in self._stale_markers:
+                    updates[f"{COMMITTED_PATH}/{marker}"] = None
+                sent = True
+                db.reference("/").update(updates)
+            except Exception:
+                with self._lock:
+                    if sent:
+                        # The update may have been applied anyway; the next flush
+                        # checks its markers before retrying, so increments are not
+                        # applied twice. Until then reads see the batch as in flight.
+                        self._unconfirmed = (
+                            batch_paths, batch_changes, batch_stats, ops, segments, markers,
+                        )
+                    else:
+                        # Put the batch back underneath anything written since
+                        self._put_back(batch_paths, batch_changes, batch_stats, ops)
+                        self._inflight = None
+                self.failures += 1
+                raise
+
+            with self._lock:
+                self._inflight = None
+            self._committed(segments, markers, ops)
+            self.last_flush_seconds = round(time.perf_counter() - started, 4)
+            return ops
+
+    # Read-your-writes
+
+    def _layers(self, restaurant_id: str) -> List[Dict[str, Any]]:
+        layers = []
+        if self._inflight is not None and restaurant_id in self._inflight[0]:
+            layers.append(self._inflight[0][restaurant_id])
+        if restaurant_id in self._pending:
+            layers.append(self._pending[restaurant_id])
+        return layers
+
+    def overlay_menu(self, restaurant_id: str, menu_items: dict) -> dict:
+        """``menu_items`` (id -> item) with this restaurant's pending writes applied"""
+        if not self.enabled:
+            return menu_items
+        with self._lock:
+            layers = [dict(layer) for layer in self._layers(restaurant_id)]
+        if not layers:
+            return menu_items
+
+        merged = {"menu_items": dict(menu_items)}
+        for layer in layers:
+            for path, value in layer.items():
+                parts = path.split("/")
+                if parts[0] != "menu_items" or len(parts) < 2:
+                    continue
+                if len(parts) > 2 and parts[1] in merged["menu_items"]:
+                    merged["menu_items"][parts[1]] = copy.deepcopy(merged["menu_items"][parts[1]])
+                set_nested(merged, parts, copy.deepcopy(value))
+        return merged["menu_items"]
+
+    def overlay_item(self, restaurant_id: str, menu_item_id: str, stored: Optional[dict]) -> Optional[dict]:
+        """A single menu item as this worker will have written it"""
+        if not self.enabled:
+            return stored
+        items = {menu_item_id: stored} if stored is not None else {}
+        return self.overlay_menu(restaurant_id, items).get(menu_item_id)
+
+    def has_pending(self, path: str) -> bool:
+        """True if an unsaved write touches ``path``, a node beneath it (a
+        PATCH writes ``menu_items/{id}/{field}``) or a node above it"""
+        if not self.enabled:
+            return False
+        prefix = path + "/"
+        with self._lock:
+            layers = list(self._pending.values())
+            if self._inflight is not None:
+                layers += list(self._inflight[0].values())
+            return any(
+                pending == path or pending.startswith(prefix) or path.startswith(pending + "/")
+                for paths in layers
+                for pending in paths
+            )
+
+    # Background flushing
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        await run_in_threadpool(self.recover)
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await run_in_threadpool(self.flush)
+        except Exception as e:
+            print(f"Final menu write flush failed, kept in journal: {e}")
+        if self._segment is not None:
+            self._segment.close()
+            await run_in_threadpool(self._release_worker_dir)
+
+    def _release_worker_dir(self):
+        """Remove this process's journal directory if everything was committed"""
+        with self._lock:
+            if self._pending or self._sealed or os.path.getsize(self._segment.name):
+                return
+        try:
+            if self._stale_markers:
+                db.reference(COMMITTED_PATH).update({marker: None for marker in self._stale_markers})
+            os.remove(self._segment.name)
+            os.remove(os.path.join(self._worker_dir, LOCK_NAME))
+            os.rmdir(self._worker_dir)
+        except Exception as e:
+            print(f"Could not remove journal directory {self._worker_dir}: {e}")
+        self._worker_lock.close()
+
+    async def _flush_loop(self):
+        failures = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await run_in_threadpool(self.flush)
+                failures = 0
+            except Exception as e:
+                # Firebase may still be starting up or briefly unreachable
+                failures += 1
+                print(f"Menu write flush failed (attempt {failures}): {e}")
+                await asyncio.sleep(min(5.0, self.flush_interval * 2 ** failures))
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending_paths = sum(len(paths) for paths in self._pending.values())
+            pending_ops = self._pending_ops
+        return {
+            "enabled": self.enabled,
+            "pending_ops": pending_ops,
+            "pending_paths": pending_paths,
+            "flushes": self.flushes,
+            "flushed_ops": self.flushed_ops,
+            "failures": self.failures,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+
+WRITE_BEHIND = WriteBehindBuffer.from_env()
+
+
+def write_menu(
+    restaurant_id: str,
+    updates: dict,
+    changes: List[Change],
+    stat_deltas: Optional[Dict[str, int]] = None,
+) -> Optional[int]:
+    """Commit a menu write now, or buffer it when write-behind is enabled.
+
+    Returns the change log sequence of a direct write; None when buffered,
+    since sequences are only assigned at flush time.
+    """
+    if WRITE_BEHIND.enabled:
+        # Journals with fsync, so async callers run this in the threadpool
+        WRITE_BEHIND.submit(restaurant_id, updates, changes, stat_deltas)
+        MENU_VIEWS.invalidate(restaurant_id)
+        return None
+    seq = write_menu_changes(
+        restaurant_id, {**updates, **stat_updates(stat_deltas or {})}, changes
+    )
+    MENU_VIEWS.invalidate(restaurant_id)
+    return seq
+
+
+@write_behind_router.get("")
+async def write_behind_stats(token_data: dict = Depends(admin_only)):
+    """Pending and flushed menu writes on this worker (admin only)"""
+    return WRITE_BEHIND.stats()
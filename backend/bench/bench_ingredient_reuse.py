@@ -0,0 +1,196 @@
+"""Near-duplicate ingredient reuse benchmark.
+
+Builds a synthetic franchise dataset: a set of base recipes, each submitted
+by many locations with the kinds of edits chains make (reordering,
+punctuation and case, "organic" prefixes, sub-ingredient lists, an
+ingredient dropped, added or swapped). Lists are fed through the reuse index
+in order. A miss is answered by a ground-truth oracle that stands in for the
+model and is then added to the index. The report shows how many model calls
+were avoided, and checks that no reused result under-reports an allergen or
+over-claims a dietary category.
+
+Usage (from the backend directory):
+    python bench/bench_ingredient_reuse.py [--recipes 200] [--locations 20] [--threshold 0.9]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from ingredient_similarity import SimilarParseIndex  # noqa: E402
+
+# ingredient -> (allergens, vegan, vegetarian)
+VOCABULARY = {
+    "water": ((), True, True),
+    "sugar": ((), True, True),
+    "salt": ((), True, True),
+    "wheat flour": (("wheat",), True, True),
+    "enriched flour": (("wheat",), True, True),
+    "niacin": ((), True, True),
+    "reduced iron": ((), True, True),
+    "yeast": ((), True, True),
+    "canola oil": ((), True, True),
+    "olive oil": ((), True, True),
+    "soybean oil": (("soybeans",), True, True),
+    "soy lecithin": (("soybeans",), True, True),
+    "soy sauce": (("soybeans", "wheat"), True, True),
+    "whole milk": (("milk",), False, True),
+    "butter": (("milk",), False, True),
+    "cream": (("milk",), False, True),
+    "cheddar cheese": (("milk",), False, True),
+    "parmesan cheese": (("milk",), False, True),
+    "whey": (("milk",), False, True),
+    "eggs": (("eggs",), False, True),
+    "egg yolks": (("eggs",), False, True),
+    "mayonnaise": (("eggs",), False, True),
+    "chicken": ((), False, False),
+    "beef": ((), False, False),
+    "bacon": ((), False, False),
+    "anchovies": (("fish",), False, False),
+    "fish sauce": (("fish",), False, False),
+    "salmon": (("fish",), False, False),
+    "shrimp": (("shellfish",), False, False),
+    "crab": (("shellfish",), False, False),
+    "peanuts": (("peanuts",), True, True),
+    "peanut butter": (("peanuts",), True, True),
+    "almonds": (("tree_nuts",), True, True),
+    "cashews": (("tree_nuts",), True, True),
+    "walnuts": (("tree_nuts",), True, True),
+    "sesame seeds": (("sesame",), True, True),
+    "tahini": (("sesame",), True, True),
+    "tomatoes": ((), True, True),
+    "onions": ((), True, True),
+    "garlic": ((), True, True),
+    "basil": ((), True, True),
+    "oregano": ((), True, True),
+    "black pepper": ((), True, True),
+    "paprika": ((), True, True),
+    "lemon juice": ((), True, True),
+    "vinegar": ((), True, True),
+    "rice": ((), True, True),
+    "potatoes": ((), True, True),
+    "carrots": ((), True, True),
+    "celery": ((), True, True),
+    "mushrooms": ((), True, True),
+    "spinach": ((), True, True),
+    "cilantro": ((), True, True),
+    "lime juice": ((), True, True),
+    "honey": ((), False, True),
+    "brown sugar": ((), True, True),
+    "corn starch": ((), True, True),
+    "baking soda": ((), True, True),
+    "natural flavors": ((), True, True),
+    "xanthan gum": ((), True, True),
+}
+
+
+def oracle(ingredients: list) -> dict:
+    """Ground-truth parse standing in for the model"""
+    allergens, vegan, vegetarian = [], True, True
+    for ingredient in ingredients:
+        found, is_vegan, is_vegetarian = VOCABULARY[ingredient]
+        allergens.extend(a for a in found if a not in allergens)
+        vegan &= is_vegan
+        vegetarian &= is_vegetarian
+    dietary = [c for c, ok in (("vegan", vegan), ("vegetarian", vegetarian)) if ok]
+    return {"allergens": allergens, "dietaryCategories": dietary, "extractedIngredients": list(ingredients)}
+
+
+def render(ingredients: list, rng: random.Random) -> str:
+    """Write an ingredient list the way a particular location might"""
+    items = list(ingredients)
+    rng.shuffle(items)
+    if rng.random() < 0.3:
+        i = rng.randrange(len(items))
+        items[i] = "organic " + items[i]
+    if rng.random() < 0.2 and len(items) > 3:
+        # Group the last few as a sub-ingredient list
+        items = items[:-3] + [f"seasoning ({', '.join(items[-3:])})"]
+    if rng.random() < 0.3:
+        items = [item.upper() if rng.random() < 0.5 else item.title() for item in items]
+    separator = rng.choice([", ", "; ", ",", " , "])
+    text = separator.join(items)
+    if rng.random() < 0.3:
+        text = "Ingredients: " + text
+    if rng.random() < 0.3:
+        text += "."
+    return text
+
+
+def variant(recipe: list, rng: random.Random) -> list:
+    """The recipe as one location actually makes it"""
+    items = list(recipe)
+    roll = rng.random()
+    if roll < 0.15 and len(items) > 3:
+        items.remove(rng.choice(items))
+    elif roll < 0.25:
+        extra = rng.choice([i for i in VOCABULARY if i not in items])
+        items.append(extra)
+    elif roll < 0.30:
+        items.remove(rng.choice(items))
+        items.append(rng.choice([i for i in VOCABULARY if i not in items]))
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--recipes", type=int, default=200, help="base recipes")
+    parser.add_argument("--locations", type=int, default=20, help="franchise locations")
+    parser.add_argument("--menu-share", type=float, default=0.5, help="share of recipes each location submits")
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = list(VOCABULARY)
+    recipes = [rng.sample(vocabulary, rng.randint(5, 14)) for _ in range(args.recipes)]
+
+    submissions = []
+    for _ in range(args.locations):
+        for recipe in recipes:
+            if rng.random() < args.menu_share:
+                items = variant(recipe, rng)
+                submissions.append((render(items, rng), items))
+    rng.shuffle(submissions)
+
+    index = SimilarParseIndex(threshold=args.threshold, max_entries=len(submissions) + 1)
+    model_calls = under_reported = over_reported = dietary_overclaims = 0
+    lookup_seconds = 0.0
+
+    for text, items in submissions:
+        truth = oracle(items)
+        started = time.perf_counter()
+        result = index.lookup(text)
+        lookup_seconds += time.perf_counter() - started
+        if result is None:
+            model_calls += 1
+            index.add(text, truth)
+            continue
+        if set(truth["allergens"]) - set(result["allergens"]):
+            under_reported += 1
+        if set(result["allergens"]) - set(truth["allergens"]):
+            over_reported += 1
+        if set(result["dietaryCategories"]) - set(truth["dietaryCategories"]):
+            dietary_overclaims += 1
+
+    stats = index.stats()
+    reused = stats["exact_hits"] + stats["merged_hits"]
+    print("== Ingredient list reuse ==")
+    print(f"submitted lists:          {len(submissions)}")
+    print(f"distinct base recipes:    {args.recipes}")
+    print(f"model calls:              {model_calls}")
+    print(f"reused (exact canonical): {stats['exact_hits']}")
+    print(f"reused (near-duplicate):  {stats['merged_hits']}")
+    print(f"reuse rate:               {reused / len(submissions):.1%}")
+    print(f"avg lookup:               {lookup_seconds / len(submissions) * 1e6:.0f} us")
+    print("== Safety of reused results ==")
+    print(f"under-reported allergens: {under_reported}")
+    print(f"over-reported allergens:  {over_reported}")
+    print(f"dietary over-claims:      {dietary_overclaims}")
+
+
+if __name__ == "__main__":
+    main()
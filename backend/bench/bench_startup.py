@@ -0,0 +1,123 @@
+"""Cold-start benchmark for the backend.
+
+Reports the import-time profile of ``main`` (via ``python -X importtime``) and
+the time from process launch until the first successful ``/healthz`` and
+``/readyz`` responses.
+
+Usage (from the backend directory):
+    python bench/bench_startup.py [--top 15] [--timeout 60]
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+
+def import_time_report(top: int):
+    """Import main in a fresh interpreter and collect per-module import times"""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import sys, main; print('genai_loaded=%s' % ('google.generativeai' in sys.modules))",
+        ],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+    )
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    total_us = sum(self_us for _, self_us, _ in modules)
+    main_entry = next((m for m in modules if m[0] == "main"), None)
+
+    print("== Import time ==")
+    print(f"modules imported:        {len(modules)}")
+    print(f"total import time:       {total_us / 1000:.1f} ms")
+    if main_entry:
+        print(f"import main (cumulative): {main_entry[2] / 1000:.1f} ms")
+    print(result.stdout.strip())
+    print(f"top {top} modules by cumulative time:")
+    for name, self_us, cumulative_us in sorted(modules, key=lambda m: m[2], reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:9.1f} ms  {self_us / 1000:8.1f} ms self  {name}")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, deadline: float):
+    """Poll url until it returns 200; returns (ok, error detail)"""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True, None
+        except urllib.error.HTTPError as e:
+            # /readyz reports a failed initialization instead of hanging
+            detail = json.loads(e.read() or b"{}").get("error")
+            if detail:
+                return False, detail
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    return False, "timed out"
+
+
+def first_request_report(timeout: float):
+    """Launch uvicorn and time the first healthy and first ready responses"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=APP_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = started + timeout
+        print("== Time to first request ==")
+        ok, error = wait_for(f"http://127.0.0.1:{port}/healthz", deadline)
+        if not ok:
+            print(f"time to /healthz:        {error}")
+            return
+        print(f"time to /healthz:        {time.perf_counter() - started:.3f} s")
+        ok, error = wait_for(f"http://127.0.0.1:{port}/readyz", deadline)
+        if ok:
+            print(f"time to /readyz:         {time.perf_counter() - started:.3f} s")
+        else:
+            print(f"time to /readyz:         not ready ({error})")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    import_time_report(args.top)
+    print()
+    first_request_report(args.timeout)
+
+
+if __name__ == "__main__":
+    main()
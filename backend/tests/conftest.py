@@ -0,0 +1,184 @@
+"""Fixtures that run the API against counting in-memory Firebase fakes.
+
+``backend`` replaces ``firebase_admin.db`` with a MemoryDatabase and the
+``firebase_admin.auth`` calls the app makes with FakeAuth. Both record
+every call, so tests can assert how many round trips a request made and how
+many database nodes it downloaded.
+"""
+import os
+
+# Configure the app for tests before any app module reads the environment
+os.environ.pop("SESSION_SIGNING_KEYS", None)
+os.environ["MENU_WRITE_BEHIND"] = "0"
+os.environ["GEMINI_FAKE_MODELS"] = "gemini-1.5-flash=ok"
+os.environ["AI_RATE_BURST"] = "1000"
+
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from firebase_admin import auth, db
+
+import ai_parser
+import auth_routes
+import routes
+from ingredient_similarity import SimilarParseIndex
+from memory_db import MemoryDatabase
+from menu_views import MENU_VIEWS
+from session_tokens import TokenSigner
+
+OWNER_RESTAURANT = "10001"
+
+
+class FakeAuth:
+    """Counting stand-in for the firebase_admin.auth user management calls."""
+
+    def __init__(self):
+        self.users: Dict[str, SimpleNamespace] = {}
+        self.calls: List[Tuple[str, str]] = []
+
+    def add(self, uid: str, email: str, display_name: Optional[str] = None) -> SimpleNamespace:
+        user = SimpleNamespace(uid=uid, email=email, display_name=display_name)
+        self.users[uid] = user
+        return user
+
+    def create_user(self, email: str, password: str, display_name: Optional[str] = None, **kwargs):
+        self.calls.append(("create_user", email))
+        if any(user.email == email for user in self.users.values()):
+            raise auth.EmailAlreadyExistsError("Email already exists", None, None)
+        return self.add(f"uid-{len(self.users) + 1}", email, display_name)
+
+    def get_user(self, uid: str, app=None):
+        self.calls.append(("get_user", uid))
+        if uid not in self.users:
+            raise auth.UserNotFoundError(f"No user record found for {uid}")
+        return self.users[uid]
+
+    def get_user_by_email(self, email: str, app=None):
+        self.calls.append(("get_user_by_email", email))
+        for user in self.users.values():
+            if user.email == email:
+                return user
+        raise auth.UserNotFoundError(f"No user record found for {email}")
+
+    def get_users(self, identifiers, app=None):
+        self.calls.append(("get_users", str(len(identifiers))))
+        found = [self.users[i.uid] for i in identifiers if i.uid in self.users]
+        missing = [i for i in identifiers if i.uid not in self.users]
+        return SimpleNamespace(users=found, not_found=missing)
+
+
+@dataclass
+class Usage:
+    """Backend calls made while serving one request"""
+
+    db_calls: List[Tuple[str, str, int]] = field(default_factory=list)
+    auth_calls: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def round_trips(self) -> int:
+        return len(self.db_calls)
+
+    @property
+    def nodes(self) -> int:
+        return sum(nodes for _, _, nodes in self.db_calls)
+
+    @property
+    def auth_round_trips(self) -> int:
+        return len(self.auth_calls)
+
+    def describe(self) -> str:
+        lines = [f"  db   {op:<11} {path} ({nodes} nodes)" for op, path, nodes in self.db_calls]
+        lines += [f"  auth {op:<11} {arg}" for op, arg in self.auth_calls]
+        return "\n".join(lines) or "  (no calls)"
+
+
+class Backend:
+    def __init__(self, database: MemoryDatabase, fake_auth: FakeAuth, monkeypatch):
+        self.db = database
+        self.auth = fake_auth
+        self._monkeypatch = monkeypatch
+        app = FastAPI()
+        app.include_router(auth_routes.auth_router, prefix="/auth")
+        app.include_router(routes.router)
+        self.client = TestClient(app)
+
+    def login(self, uid: str, is_admin: bool = False) -> dict:
+        """Authorization headers for an in-memory session"""
+        token = f"token-{uid}"
+        user = self.auth.users.get(uid)
+        auth_routes.SESSION_TOKENS[token] = {
+            "uid": uid,
+            "email": user.email if user else f"{uid}@example.com",
+            "name": uid,
+            "is_admin": is_admin,
+        }
+        return {"Authorization": f"Bearer {token}"}
+
+    def login_signed(self, uid: str, is_admin: bool = False) -> dict:
+        """Authorization headers for a signed session token; enables signing"""
+        if auth_routes.SIGNER is None:
+            self._monkeypatch.setattr(auth_routes, "SIGNER", TokenSigner([("test", b"test-secret")]))
+        token, _ = auth_routes.SIGNER.issue(uid, f"{uid}@example.com", uid, is_admin)
+        return {"Authorization": f"Bearer {token}"}
+
+    def seed(self, n: int):
+        """An owner with one restaurant of ``n`` menu items, plus ``n`` other
+        users who each own a one-item restaurant"""
+        self.auth.add("owner", "owner@example.com", "Owner")
+        self.auth.add("admin", "admin@example.com", "Admin")
+        users = {
+            "owner": {"email": "owner@example.com", "name": "Owner", "is_admin": False,
+                      "restaurant_id": OWNER_RESTAURANT, "created_at": 1,
+                      "allergen_profiles": {"p1": {"name": "Kids", "allergen_free": ["milk"]}}},
+            "admin": {"email": "admin@example.com", "name": "Admin", "is_admin": True, "created_at": 2},
+        }
+        restaurants = {
+            OWNER_RESTAURANT: {"name": "Owner's", "address": "1 Main St", "phone": "555",
+                               "cuisine_type": "italian", "owner_uid": "owner"},
+        }
+        menu_items = {}
+        for i in range(n):
+            uid, restaurant_id = f"user{i}", str(20000 + i)
+            self.auth.add(uid, f"{uid}@example.com", uid)
+            users[uid] = {"email": f"{uid}@example.com", "name": uid, "is_admin": False,
+                          "restaurant_id": restaurant_id, "created_at": 10 + i}
+            restaurants[restaurant_id] = {"name": f"R{i}", "address": "2 Side St", "phone": "555",
+                                          "cuisine_type": "thai", "owner_uid": uid}
+            menu_items[str(30000 + i)] = {"restaurant_id": OWNER_RESTAURANT, "name": f"Dish {i}",
+                                          "description": "", "price": 9.5,
+                                          "allergens": ["milk"] if i % 2 else [],
+                                          "dietaryCategories": ["vegetarian"]}
+            menu_items[str(40000 + i)] = {"restaurant_id": restaurant_id, "name": f"Other {i}",
+                                          "description": "", "price": 7.0, "allergens": ["eggs"]}
+        self.db.reference("/").set(
+            {"users": users, "restaurants": restaurants, "menu_items": menu_items}
+        )
+        self.db.reset_counters()
+        self.auth.calls = []
+
+    def measure(self, method: str, url: str, **kwargs):
+        """Send one request and return (response, Usage)"""
+        self.db.reset_counters()
+        self.auth.calls = []
+        response = self.client.request(method, url, **kwargs)
+        return response, Usage(list(self.db.calls), list(self.auth.calls))
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    database = MemoryDatabase()
+    fake_auth = FakeAuth()
+    monkeypatch.setattr(db, "reference", lambda path="/", app=None, url=None: database.reference(path))
+    for name in ("create_user", "get_user", "get_user_by_email", "get_users"):
+        monkeypatch.setattr(auth, name, getattr(fake_auth, name))
+
+    # Start every test with cold caches and no sessions
+    monkeypatch.setattr(ai_parser, "SIMILAR_PARSES", SimilarParseIndex(threshold=0.9, max_entries=100))
+    auth_routes.SESSION_TOKENS.clear()
+    routes.RESTAURANT_CACHE.clear()
+    MENU_VIEWS.clear()
+    return Backend(database, fake_auth, monkeypatch)
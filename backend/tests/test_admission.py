@@ -0,0 +1,153 @@
+"""Admission gates, load shedding and the AI rate limit, driven directly."""
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdmissionGate, AdmissionMiddleware, TokenBucketLimiter, endpoint_class
+
+
+class Blocking:
+    """ASGI app whose requests hold their slot until ``release`` is set"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = 0
+
+    async def __call__(self, scope, receive, send):
+        self.started += 1
+        await self.release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def call(app, path, method="GET"):
+    """Send one request through ``app``; returns (status, headers)"""
+    scope = {"type": "http", "method": method, "path": path, "headers": [], "query_string": b""}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = messages[0]
+    return start["status"], dict(start.get("headers", []))
+
+
+@pytest.fixture
+def gates(monkeypatch):
+    gates = {
+        "ai": AdmissionGate("ai", limit=1, max_waiting=1, max_wait=0.05),
+        "crud": AdmissionGate("crud", limit=1, max_waiting=1, max_wait=0.05),
+        "poll": AdmissionGate("poll", limit=2, max_waiting=0, max_wait=0.05),
+    }
+    monkeypatch.setattr(admission, "GATES", gates)
+    return gates
+
+
+def test_endpoint_classes():
+    assert endpoint_class("/ai/parse-ingredients", "POST") == "ai"
+    assert endpoint_class("/ai/jobs", "POST") == "ai"
+    assert endpoint_class("/ai/jobs/abc", "GET") == "poll"
+    assert endpoint_class("/ai/jobs/stats", "GET") == "crud"
+    assert endpoint_class("/auth/login", "POST") == "auth"
+    assert endpoint_class("/restaurants", "GET") == "crud"
+    assert endpoint_class("/events/stream", "GET") is None
+    assert endpoint_class("/admin/profiling/start", "POST") is None
+
+
+def test_full_queue_and_wait_timeout_are_shed_with_retry_after(gates):
+    async def scenario():
+        app = Blocking()
+        middleware = AdmissionMiddleware(app)
+        running = asyncio.ensure_future(call(middleware, "/restaurants"))
+        waiting = asyncio.ensure_future(call(middleware, "/restaurants"))
+        await asyncio.sleep(0.01)
+        # One running, one queued: the third finds the queue full
+        full = await call(middleware, "/restaurants")
+        timed_out = await waiting
+        app.release.set()
+        return full, timed_out, await running
+
+    full, timed_out, ok = asyncio.run(scenario())
+    assert full[0] == 503 and int(full[1][b"retry-after"]) >= 1
+    assert timed_out[0] == 503 and b"retry-after" in timed_out[1]
+    assert ok[0] == 200
+    assert gates["crud"].shed_queue_full == 1 and gates["crud"].shed_timeout == 1
+    assert gates["crud"].in_flight == 0
+
+
+def test_classes_do_not_share_slots(gates):
+    async def scenario():
+        app = Blocking()
+        middleware = AdmissionMiddleware(app)
+        # Long-polls and an AI parse fill their own gates...
+        held = [asyncio.ensure_future(call(middleware, path, method)) for path, method in (
+            ("/ai/jobs/a", "GET"), ("/ai/jobs/b", "GET"), ("/ai/parse-ingredients", "POST"),
+        )]
+        await asyncio.sleep(0.01)
+        assert app.started == 3
+        # ...while a CRUD request is still admitted at once
+        crud = asyncio.ensure_future(call(middleware, "/restaurants"))
+        await asyncio.sleep(0.01)
+        started = app.started
+        app.release.set()
+        return started, await crud, await asyncio.gather(*held)
+
+    started, crud, held = asyncio.run(scenario())
+    assert started == 4 and crud[0] == 200
+    assert [status for status, _ in held] == [200, 200, 200]
+
+
+def test_options_and_exempt_paths_pass_through(gates):
+    for gate in gates.values():
+        gate.limit = 1
+        gate.max_waiting = 0
+
+    async def scenario():
+        app = Blocking()
+        middleware = AdmissionMiddleware(app)
+        held = asyncio.ensure_future(call(middleware, "/restaurants"))
+        await asyncio.sleep(0.01)
+        others = [
+            asyncio.ensure_future(call(middleware, path, method)) for path, method in (
+                ("/restaurants", "OPTIONS"), ("/healthz", "GET"), ("/admin/stats", "GET"),
+            )
+        ]
+        await asyncio.sleep(0.01)
+        started = app.started
+        app.release.set()
+        return started, await held, await asyncio.gather(*others)
+
+    started, held, others = asyncio.run(scenario())
+    assert started == 4
+    assert [status for status, _ in others] == [200, 200, 200]
+
+
+def test_token_bucket_allows_a_burst_then_rejects(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    limiter = TokenBucketLimiter(rate=1.0, burst=2)
+
+    assert limiter.take("u1") == 0 and limiter.take("u1") == 0
+    wait = limiter.take("u1")
+    assert wait == pytest.approx(1.0)
+    # Other users have their own bucket
+    assert limiter.take("u2") == 0
+
+    now[0] += 1.0
+    assert limiter.take("u1") == 0
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_rate_limited_dependency_returns_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(admission, "AI_RATE_LIMIT", TokenBucketLimiter(rate=0.5, burst=1))
+    token = {"uid": "u1"}
+    assert asyncio.run(admission.ai_rate_limited(token)) == token
+    with pytest.raises(admission.HTTPException) as error:
+        asyncio.run(admission.ai_rate_limited(token))
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "2"
@@ -0,0 +1,91 @@
+"""AI job submission rules and job ownership across processes."""
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import ai_jobs
+from ai_jobs import JobQueue, jobs_router
+from conftest import OWNER_RESTAURANT
+
+
+@pytest.fixture
+def client(backend, tmp_path, monkeypatch):
+    backend.seed(1)
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), workers=0, max_queued=10, retention_seconds=60)
+    monkeypatch.setattr(ai_jobs, "AI_JOBS", queue)
+    app = FastAPI()
+    app.include_router(jobs_router, prefix="/ai/jobs")
+    with TestClient(app) as client:
+        client.portal.call(queue.start)
+        yield client
+        client.portal.call(queue.stop)
+
+
+def submit(client, headers, **payload):
+    return client.post("/ai/jobs", json={"ingredients": "flour, eggs", **payload}, headers=headers)
+
+
+def test_only_the_owner_or_an_admin_can_use_a_restaurant_lane(client, backend):
+    assert submit(client, backend.login("owner"), restaurant_id=OWNER_RESTAURANT).status_code == 202
+    assert submit(client, backend.login("user0"), restaurant_id=OWNER_RESTAURANT).status_code == 403
+    assert submit(client, backend.login("admin", is_admin=True), restaurant_id=OWNER_RESTAURANT).status_code == 202
+    assert submit(client, backend.login("owner"), restaurant_id="missing").status_code == 404
+
+
+def test_only_admins_can_jump_the_queue(client, backend):
+    assert submit(client, backend.login("owner"), priority=9).status_code == 202
+    assert submit(client, backend.login("owner"), priority=4).status_code == 403
+    assert submit(client, backend.login("admin", is_admin=True), priority=0).status_code == 202
+
+
+def start(path):
+    queue = JobQueue(path, workers=0, max_queued=10, retention_seconds=60)
+    queue.store = ai_jobs.JobStore(path)
+    queue._ready = ai_jobs.asyncio.Semaphore(0)
+    return queue
+
+
+def test_live_jobs_are_not_taken_over(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    first, second = start(path), start(path)
+    job = first.submit("owner", "user:owner", 5, "flour")
+
+    second.recover()
+    assert len(second.queue) == 0
+    # Even a stale queue entry can't run another process's job
+    assert not second.store.claim(job["id"], second.owner, time.time(), time.time() + 60)
+    assert first.store.claim(job["id"], first.owner, time.time(), time.time() + 60)
+
+
+def test_expired_leases_are_taken_over_once(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    first, second, third = start(path), start(path), start(path)
+    job = first.submit("owner", "user:owner", 5, "flour")
+    first.store.claim(job["id"], first.owner, time.time(), time.time() + 60)
+    first.store.release_leases(first.owner)
+
+    second.recover()
+    third.recover()
+    assert len(second.queue) == 1 and len(third.queue) == 0
+    taken = second.store.get(job["id"])
+    assert taken["status"] == "queued" and taken["owner"] == second.owner
+    assert second.store.claim(job["id"], second.owner, time.time(), time.time() + 60)
+
+
+def test_waiters_do_not_leak_events(tmp_path):
+    queue = start(str(tmp_path / "jobs.sqlite3"))
+    job = queue.submit("owner", "user:owner", 5, "flour")
+
+    async def waits():
+        # Timed out, as when another process runs the job
+        await ai_jobs.asyncio.gather(queue.wait(job["id"], 0.01), queue.wait(job["id"], 0.02))
+        assert queue._finished_events == {} and not queue._waiters
+        # Already finished, and unknown
+        queue.store.update(job["id"], status="done")
+        await queue.wait(job["id"], 1)
+        await queue.wait("missing", 1)
+
+    ai_jobs.asyncio.run(waits())
+    assert queue._finished_events == {} and not queue._waiters
@@ -0,0 +1,66 @@
+"""Catalog counters change together with the data they count."""
+import asyncio
+
+import catalog_stats
+from catalog_stats import STATS_PATH, StatsReconciler, apply_deltas
+from conftest import OWNER_RESTAURANT
+
+DISH = {"name": "Soup", "description": "Tomato", "price": 6.5, "allergens": ["milk"], "dietaryCategories": []}
+
+
+def test_menu_write_increments_counters_in_the_same_update(backend):
+    backend.seed(2)
+    response, usage = backend.measure(
+        "POST", f"/restaurants/{OWNER_RESTAURANT}/menu", json=DISH, headers=backend.login("owner")
+    )
+    assert response.status_code == 200, response.text
+
+    stats = backend.db.reference(STATS_PATH).get()
+    assert stats["menu_items"]["total"] == 1
+    assert stats["menu_items"]["by_allergen"]["milk"] == 1
+    # The counters need no transaction of their own
+    assert [path for op, path, _ in usage.db_calls if op == "transaction"] == [
+        f"/menu_changes/{OWNER_RESTAURANT}/seq"
+    ]
+
+
+def test_reconcile_fixes_drift_when_no_writes_happen(backend):
+    backend.seed(3)
+    report = StatsReconciler().run(fix=True)
+
+    assert report["fixed"] and report["writes_during_scan"] == 0
+    assert StatsReconciler().run(fix=False)["drift"] == {}
+    assert backend.db.reference(f"{STATS_PATH}/menu_items/total").get() == 6
+
+
+def test_reconcile_does_not_fix_after_writes_during_the_scan(backend, monkeypatch):
+    backend.seed(3)
+    scan = catalog_stats.iter_children
+
+    def scan_with_a_write(tree, page_size):
+        if tree == "menu_items":
+            apply_deltas({"menu_items/total": 1})
+        return scan(tree, page_size)
+
+    monkeypatch.setattr(catalog_stats, "iter_children", scan_with_a_write)
+    report = StatsReconciler().run(fix=True)
+
+    assert report["drift"] and not report["fixed"]
+    assert report["writes_during_scan"] == 1
+    assert backend.db.reference(f"{STATS_PATH}/menu_items/total").get() == 1
+
+
+def test_background_reconcile_keeps_its_task_until_it_finishes(backend):
+    backend.seed(2)
+    reconciler = StatsReconciler()
+
+    async def start_and_wait():
+        reconciler.start(fix=False)
+        task = reconciler.task
+        assert task is not None and reconciler.running
+        await task
+        return task
+
+    task = asyncio.run(start_and_wait())
+    assert task.done() and reconciler.task is None and not reconciler.running
+    assert "error" not in reconciler.report and reconciler.report["drift"]
@@ -0,0 +1,52 @@
+"""Event stream tickets keep session tokens out of URLs."""
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+import auth_routes
+from auth_routes import issue_scoped_token, resolve_scoped_token, resolve_token
+from change_events import STREAM_SCOPE, events_router
+
+
+@pytest.fixture
+def client(backend):
+    auth_routes.SCOPED_TOKENS.clear()
+    app = FastAPI()
+    app.include_router(events_router, prefix="/events")
+    return TestClient(app)
+
+
+def test_session_tokens_are_not_accepted_in_the_url(client, backend):
+    token = backend.login("owner")["Authorization"].split("Bearer ")[1]
+    assert client.get("/events/stream", params={"access_token": token}).status_code == 401
+    assert client.get("/events/stream", params={"ticket": token}).status_code == 401
+
+
+def test_in_memory_tickets_work_once(client, backend):
+    response = client.post("/events/ticket", headers=backend.login("owner"))
+    assert response.status_code == 200
+    ticket = response.json()["ticket"]
+
+    assert resolve_scoped_token(ticket, STREAM_SCOPE)["uid"] == "owner"
+    with pytest.raises(HTTPException):
+        resolve_scoped_token(ticket, STREAM_SCOPE)
+
+
+def test_signed_tickets_are_scoped_to_event_streams(client, backend, monkeypatch):
+    session = backend.login_signed("owner")["Authorization"].split("Bearer ")[1]
+    token_data = resolve_token(session)
+    ticket = issue_scoped_token(session, token_data, STREAM_SCOPE)
+
+    stream_data = resolve_scoped_token(ticket, STREAM_SCOPE)
+    assert stream_data["uid"] == "owner"
+    # Streams still end when the session would
+    assert stream_data["exp"] == token_data["exp"]
+    with pytest.raises(HTTPException):
+        resolve_token(ticket)
+    with pytest.raises(HTTPException):
+        resolve_scoped_token(ticket, "other")
+
+    # Logging out revokes the session's tickets too
+    monkeypatch.setitem(auth_routes.REVOCATIONS._revoked, token_data["jti"], token_data["exp"])
+    with pytest.raises(HTTPException):
+        resolve_scoped_token(ticket, STREAM_SCOPE)
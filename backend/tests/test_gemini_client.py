@@ -0,0 +1,124 @@
+"""Hedging, circuit breaking, deadlines and request coalescing against the fake SDK."""
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import ai_parser
+import gemini_client
+from fake_gemini import FakeGenAI
+from gemini_client import GeminiClient
+from singleflight import SingleFlight
+
+PROMPT = "Text: flour, eggs"
+
+
+@pytest.fixture(autouse=True)
+def no_fallback_models(monkeypatch):
+    # Only the fake's own models are candidates
+    monkeypatch.setattr(gemini_client, "FALLBACK_MODELS", [])
+
+
+def client(behaviors, **options):
+    settings = {"deadline": 5.0, "attempt_timeout": 5.0, "hedge_delay": 5.0}
+    settings.update(options)
+    genai = FakeGenAI(behaviors)
+    return GeminiClient(genai, **settings), genai
+
+
+def test_hedge_fires_after_the_delay():
+    gemini, genai = client({"a-slow": "slow:0.3", "b-fast": "ok"}, hedge_delay=0.05)
+
+    started = time.monotonic()
+    text = asyncio.run(gemini.generate(PROMPT))
+    assert "eggs" in text
+    assert genai.calls == ["a-slow", "b-fast"]
+    assert time.monotonic() - started < 0.3 + 0.25
+
+
+def test_no_hedge_when_the_first_model_answers_in_time():
+    gemini, genai = client({"a-fast": "ok", "b-fast": "ok"}, hedge_delay=0.2)
+
+    asyncio.run(gemini.generate(PROMPT))
+    assert genai.calls == ["a-fast"]
+
+
+def test_breaker_opens_after_failures_and_recovers_after_half_open():
+    gemini, genai = client({"a-model": "fail"}, breaker_threshold=2, breaker_cooldown=0.1)
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(gemini.generate(PROMPT))
+        assert error.value.status_code == 503
+    assert gemini.breaker_states() == {"a-model": "open"}
+
+    # Open: the model is skipped without a call
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(gemini.generate(PROMPT))
+    assert "temporarily disabled" in error.value.detail
+    assert genai.calls == ["a-model", "a-model"]
+
+    time.sleep(0.1)
+    assert gemini.breaker_states() == {"a-model": "half_open"}
+    genai.behaviors["a-model"] = "ok"
+    asyncio.run(gemini.generate(PROMPT))
+    assert gemini.breaker_states() == {"a-model": "closed"}
+
+
+def test_failed_half_open_trial_reopens_the_breaker():
+    gemini, genai = client({"a-model": "fail"}, breaker_threshold=1, breaker_cooldown=0.1)
+
+    with pytest.raises(HTTPException):
+        asyncio.run(gemini.generate(PROMPT))
+    time.sleep(0.1)
+    with pytest.raises(HTTPException):
+        asyncio.run(gemini.generate(PROMPT))
+    assert gemini.breaker_states() == {"a-model": "open"}
+    assert genai.calls == ["a-model", "a-model"]
+
+
+def test_only_the_trial_call_ends_the_trial(monkeypatch):
+    breaker = gemini_client.CircuitBreaker(threshold=1, cooldown=10)
+    earlier = breaker.allow()
+    breaker.record_failure(breaker.allow())
+    assert breaker.state == "open"
+
+    monkeypatch.setattr(gemini_client.time, "monotonic", lambda: breaker.opened_at + 10)
+    trial = breaker.allow()
+    assert trial is not None and breaker.allow() is None
+
+    # A call from before the breaker opened is abandoned, e.g. a lost hedge
+    breaker.release(earlier)
+    assert breaker.allow() is None
+
+    breaker.release(trial)
+    assert breaker.allow() is not None
+
+
+def test_overall_deadline_returns_504():
+    gemini, genai = client({"a-slow": "slow:1", "b-slow": "slow:1"}, deadline=0.15, hedge_delay=0.05)
+
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(gemini.generate(PROMPT))
+    assert error.value.status_code == 504
+    assert genai.calls == ["a-slow", "b-slow"]
+    assert time.monotonic() - started < 0.5
+
+
+def test_identical_concurrent_parses_share_one_model_call(backend, monkeypatch):
+    gemini, genai = client({"a-slow": "slow:0.1"})
+    monkeypatch.setattr(ai_parser, "get_gemini_client", lambda: gemini)
+    monkeypatch.setattr(ai_parser, "AI_PARSES", SingleFlight())
+
+    async def parse_three():
+        return await asyncio.gather(
+            *(ai_parser.parse_ingredients_shared("Flour, eggs") for _ in range(3))
+        )
+
+    results = asyncio.run(parse_three())
+    assert genai.calls == ["a-slow"]
+    assert ai_parser.AI_PARSES.stats() == {"in_flight": 0, "started": 1, "coalesced": 2}
+    assert results[0] == results[1] == results[2]
+    assert "eggs" in results[0]["allergens"]
@@ -0,0 +1,152 @@
+"""Reuse of AI parse results for near-duplicate ingredient lists."""
+import time
+
+import pytest
+
+from ingredient_similarity import (
+    RESULTS_PATH,
+    SimilarParseIndex,
+    canonical_tokens,
+    merge_results,
+    tokens_key,
+)
+
+BASE = [f"ingredient {word}" for word in (
+    "alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf",
+    "hotel", "india", "juliett", "kilo", "lima", "mike", "november",
+    "oscar", "papa", "quebec", "romeo", "sierra", "tango",
+)]
+
+
+def ingredients(*phrases: str) -> str:
+    return ", ".join(phrases)
+
+
+def result(allergens, dietary) -> dict:
+    return {"allergens": allergens, "dietaryCategories": dietary, "extractedIngredients": []}
+
+
+@pytest.mark.parametrize("text, tokens", [
+    ("Sugar, Salt", {"sugar", "salt"}),
+    ("SALT; sugar.", {"sugar", "salt"}),
+    ("Ingredients: Organic Wheat Flour (wheat flour, niacin), Sugar", {"wheat flour", "niacin", "sugar"}),
+    ("Water, salt 2% or less, yeast. Contains: milk", {"water", "salt", "yeast", "milk"}),
+    ("Eggs and milk with vanilla", {"eggs", "milk", "vanilla"}),
+    ("Vitamin B1.5 mix", {"vitamin b1 5 mix"}),
+    ("", set()),
+    (None, set()),
+])
+def test_canonical_tokens(text, tokens):
+    assert canonical_tokens(text) == frozenset(tokens)
+
+
+def test_exact_match_ignores_order_and_case():
+    index = SimilarParseIndex(threshold=0.9, max_entries=100)
+    index.add("Sugar, Salt, Wheat Flour", result(["wheat"], ["vegan"]))
+
+    assert index.lookup("wheat flour; SALT; organic sugar") == result(["wheat"], ["vegan"])
+    assert index.stats()["exact_hits"] == 1
+
+
+def test_near_duplicate_subset_is_reused():
+    index = SimilarParseIndex(threshold=0.9, max_entries=100)
+    index.add(ingredients(*BASE), result(["milk"], ["vegetarian"]))
+
+    reused = index.lookup(ingredients(*BASE[1:]))
+
+    assert reused["allergens"] == ["milk"]
+    assert reused["dietaryCategories"] == ["vegetarian"]
+    assert index.stats()["merged_hits"] == 1
+
+
+def test_similar_list_with_an_unseen_phrase_is_not_reused():
+    # Similar enough, but no stored list says anything about "peanut oil"
+    index = SimilarParseIndex(threshold=0.9, max_entries=100)
+    index.add(ingredients(*BASE), result([], ["vegan"]))
+
+    assert index.lookup(ingredients(*BASE, "peanut oil")) is None
+    assert index.stats()["misses"] == 1
+
+
+def test_lists_below_the_threshold_are_not_reused():
+    index = SimilarParseIndex(threshold=0.9, max_entries=100)
+    index.add(ingredients(*BASE), result([], ["vegan"]))
+
+    assert index.lookup(ingredients(*BASE[:15])) is None
+
+
+def test_matches_that_together_cover_the_list_are_merged():
+    index = SimilarParseIndex(threshold=0.9, max_entries=100)
+    index.add(ingredients(*BASE, "whey"), result(["milk"], ["vegetarian", "gluten_free"]))
+    index.add(ingredients(*BASE, "egg yolk"), result(["eggs"], ["gluten_free"]))
+
+    reused = index.lookup(ingredients(*BASE, "whey", "egg yolk"))
+
+    assert sorted(reused["allergens"]) == ["eggs", "milk"]
+    assert reused["dietaryCategories"] == ["gluten_free"]
+
+
+def test_merge_never_drops_an_allergen():
+    tokens = canonical_tokens("flour, whey, egg")
+    merged = merge_results(
+        [
+            {"allergens": ["wheat"], "dietaryCategories": ["vegetarian"],
+             "extractedIngredients": ["flour", "whey"]},
+            {"allergens": ["eggs", "wheat"], "dietaryCategories": ["vegetarian", "vegan"],
+             "extractedIngredients": ["flour", "egg", "peanut"]},
+        ],
+        tokens,
+    )
+
+    assert merged["allergens"] == ["wheat", "eggs"]
+    assert merged["dietaryCategories"] == ["vegetarian"]
+    # Ingredients that are not in the new list are left out
+    assert merged["extractedIngredients"] == ["flour", "whey", "egg"]
+
+
+def test_threshold_above_one_disables_reuse():
+    index = SimilarParseIndex(threshold=1.01, max_entries=100)
+
+    assert index.add("sugar, salt", result([], [])) is None
+    assert index.lookup("sugar, salt") is None
+
+
+def test_index_evicts_least_recently_used_lists():
+    index = SimilarParseIndex(threshold=0.9, max_entries=2)
+    index.add("sugar", result([], []))
+    index.add("salt", result([], []))
+    index.lookup("sugar")
+    index.add("pepper", result([], []))
+
+    assert len(index) == 2
+    assert index.lookup("salt") is None
+    assert index.lookup("sugar") is not None
+
+
+def test_expired_persisted_lists_are_purged_and_not_loaded(backend, monkeypatch):
+    now = time.time()
+    index = SimilarParseIndex(threshold=0.9, max_entries=100, persist_ttl_seconds=86400)
+    index.persist(canonical_tokens("sugar, salt"), result([], ["vegan"]))
+    monkeypatch.setattr(time, "time", lambda: now - 2 * 86400)
+    index.persist(canonical_tokens("whey, salt"), result(["milk"], []))
+    monkeypatch.setattr(time, "time", lambda: now)
+    backend.db.reference(f"{RESULTS_PATH}/legacy").set({"tokens": ["eggs"], "result": {}})
+
+    fresh = SimilarParseIndex(threshold=0.9, max_entries=100, persist_ttl_seconds=86400)
+    fresh.load_persisted(page_size=1)
+
+    stored = backend.db.reference(RESULTS_PATH).get()
+    assert list(stored) == [tokens_key(canonical_tokens("sugar, salt"))]
+    assert len(fresh) == 1
+    assert fresh.lookup("salt, sugar") == result([], ["vegan"])
+
+
+def test_persisted_lists_are_kept_without_a_ttl(backend, monkeypatch):
+    now = time.time()
+    index = SimilarParseIndex(threshold=0.9, max_entries=100)
+    monkeypatch.setattr(time, "time", lambda: 0)
+    index.persist(canonical_tokens("whey"), result(["milk"], []))
+    monkeypatch.setattr(time, "time", lambda: now)
+
+    assert index.purge_persisted() == 0
+    assert len(backend.db.reference(RESULTS_PATH).get()) == 1
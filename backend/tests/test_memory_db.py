@@ -0,0 +1,64 @@
+"""The in-memory database must order and filter like Firebase, or the
+budgets measured against it would not hold against the real thing."""
+from memory_db import MemoryDatabase, count_nodes
+
+
+def make_db():
+    return MemoryDatabase({
+        "menu_items": {
+            "b": {"restaurant_id": "r2", "price": 3},
+            "10": {"restaurant_id": "r1", "price": 2},
+            "9": {"restaurant_id": "r1"},
+            "a": {"restaurant_id": "r1", "price": "x"},
+        }
+    })
+
+
+def test_key_order_puts_integer_keys_first():
+    database = make_db()
+    page = database.reference("menu_items").order_by_key().limit_to_first(3).get()
+    assert list(page) == ["9", "10", "a"]
+    page = database.reference("menu_items").order_by_key().start_at("a").get()
+    assert list(page) == ["a", "b"]
+
+
+def test_child_order_and_equal_to():
+    database = make_db()
+    by_price = database.reference("menu_items").order_by_child("price").get()
+    # Missing values first, then numbers, then strings
+    assert list(by_price) == ["9", "10", "b", "a"]
+    matches = database.reference("menu_items").order_by_child("restaurant_id").equal_to("r1").get()
+    assert set(matches) == {"9", "10", "a"}
+
+
+def test_writes_prune_empty_nodes_and_lists_round_trip():
+    database = make_db()
+    root = database.reference("/")
+    root.update({"menu_items/b": None, "menu_items/10/allergens": ["milk", "eggs"]})
+    assert database.reference("menu_items/b").get() is None
+    assert database.reference("menu_items/10/allergens").get() == ["milk", "eggs"]
+    database.reference("menu_items/9/restaurant_id").delete()
+    assert database.reference("menu_items/9").get() is None
+
+
+def test_counters():
+    database = make_db()
+    database.reset_counters()
+    value = database.reference("menu_items/10").get()
+    database.reference("menu_items").get(shallow=True)
+    database.reference("stats/count").transaction(lambda current: (current or 0) + 1)
+    # A transaction is a read with its ETag plus a conditional write
+    assert database.round_trips == 4
+    assert database.nodes_downloaded == count_nodes(value) + 4
+    assert [op for op, _, _ in database.calls] == ["get", "get", "transaction", "transaction_commit"]
+
+
+def test_increment_server_values():
+    database = make_db()
+    database.reference("/").update({
+        "stats/count": {".sv": {"increment": 2}},
+        "menu_items/10/price": {".sv": {"increment": -1}},
+    })
+    database.reference("stats/count").set({".sv": {"increment": 3}})
+    assert database.reference("stats/count").get() == 5
+    assert database.reference("menu_items/10/price").get() == 1
@@ -0,0 +1,104 @@
+"""Delta sync never skips a change log entry that commits out of order."""
+from conftest import OWNER_RESTAURANT
+
+import menu_changes
+from menu_changes import changes_since, committed_sequence, record_changes
+
+RID = OWNER_RESTAURANT
+
+
+def reserve(item_id: str) -> dict:
+    """Reserve a sequence number for an upsert and return its uncommitted update"""
+    updates = {f"menu_items/{item_id}": {"restaurant_id": RID, "name": item_id}}
+    record_changes(RID, [("upsert", item_id, updates[f"menu_items/{item_id}"])], updates)
+    return updates
+
+
+def commit(backend, updates: dict):
+    backend.db.reference("/").update(updates)
+
+
+def test_delta_sync_waits_for_an_earlier_reservation(backend):
+    backend.seed(1)
+    first, second = reserve("a"), reserve("b")
+    commit(backend, second)
+
+    # Entry 2 is visible, but entry 1 is still in flight
+    assert changes_since(RID, 0)["seq"] == 0
+    assert changes_since(RID, 0)["upserts"] == []
+    assert committed_sequence(RID) == 0
+
+    commit(backend, first)
+    changes = changes_since(RID, 0)
+    assert changes["seq"] == 2
+    assert sorted(item["id"] for item in changes["upserts"]) == ["a", "b"]
+    assert committed_sequence(RID) == 2
+
+
+def test_abandoned_reservation_is_skipped_after_the_timeout(backend, monkeypatch):
+    backend.seed(1)
+    reserve("a")  # its write failed and is never committed
+    commit(backend, reserve("b"))
+    monkeypatch.setattr(menu_changes, "GAP_TIMEOUT_MS", -1)
+
+    changes = changes_since(RID, 0)
+    assert changes["seq"] == 2
+    assert [item["id"] for item in changes["upserts"]] == ["b"]
+    assert committed_sequence(RID) == 2
+
+
+def test_snapshot_sequence_excludes_uncommitted_entries(backend):
+    backend.seed(1)
+    commit(backend, reserve("a"))
+    reserve("b")
+    commit(backend, reserve("c"))
+
+    response = backend.client.get(f"/restaurants/{RID}/menu/changes", headers=backend.login("owner"))
+    assert response.status_code == 200, response.text
+    assert response.json()["seq"] == 1
+
+
+def test_cached_menu_view_is_not_keyed_by_a_reserved_sequence(backend):
+    backend.seed(1)
+    headers = backend.login("owner")
+    menu = f"/restaurants/{RID}/menu"
+
+    # A worker reads the menu after another worker reserved a sequence
+    # number but before that worker's data was committed
+    pending = reserve("new")
+    before = backend.client.get(menu, headers=headers).json()
+    assert "new" not in [item["id"] for item in before]
+
+    commit(backend, pending)
+    after = backend.client.get(menu, headers=headers).json()
+    assert "new" in [item["id"] for item in after]
+
+
+def test_compaction_keeps_recent_entries_and_resets_older_clients(backend, monkeypatch):
+    backend.seed(1)
+    monkeypatch.setattr(menu_changes, "MAX_LOG_ENTRIES", 5)
+    monkeypatch.setattr(menu_changes, "COMPACT_EVERY", 4)
+    for i in range(12):
+        item = {"restaurant_id": RID, "name": f"item{i}"}
+        menu_changes.write_menu_changes(RID, {f"menu_items/item{i}": item}, [("upsert", f"item{i}", item)])
+
+    # Compaction at sequence 12 keeps the last five entries
+    log = backend.db.reference(f"menu_changes/{RID}/log").get()
+    assert sorted(int(key) for key in log) == [8, 9, 10, 11, 12]
+    assert backend.db.reference(f"menu_changes/{RID}/floor").get() == 8
+    assert committed_sequence(RID) == 12
+
+    changes = changes_since(RID, 7)
+    assert changes["seq"] == 12
+    assert [item["id"] for item in changes["upserts"]] == [f"item{i}" for i in range(7, 12)]
+
+    # A client behind the floor gets a full snapshot instead
+    assert changes_since(RID, 6) is None
+    response = backend.client.get(
+        f"/restaurants/{RID}/menu/changes", params={"since": 6}, headers=backend.login("owner")
+    )
+    assert response.status_code == 200, response.text
+    snapshot = response.json()
+    assert snapshot["reset"] is True
+    assert snapshot["seq"] == 12
+    assert {f"item{i}" for i in range(12)} <= {item["id"] for item in snapshot["upserts"]}
@@ -0,0 +1,34 @@
+"""PATCH /restaurants/{id}/menu/{item_id} writes only valid, changed fields."""
+import pytest
+
+from conftest import OWNER_RESTAURANT
+
+ITEM = f"/restaurants/{OWNER_RESTAURANT}/menu/30001"
+
+
+@pytest.mark.parametrize("body", [
+    {"name": None, "price": None},
+    {"allergens": None},
+    {"description": "Spicy", "dietaryCategories": None},
+])
+def test_null_fields_are_rejected(backend, body):
+    backend.seed(5)
+    before = dict(backend.db.data["menu_items"]["30001"])
+    response = backend.client.patch(ITEM, json=body, headers=backend.login("owner"))
+
+    assert response.status_code == 400
+    assert "cannot be null" in response.json()["detail"]
+    assert backend.db.data["menu_items"]["30001"] == before
+
+
+def test_patch_updates_only_the_given_fields(backend):
+    backend.seed(5)
+    response = backend.client.patch(
+        ITEM, json={"price": 11.0, "allergens": []}, headers=backend.login("owner")
+    )
+
+    assert response.status_code == 200, response.text
+    stored = backend.db.data["menu_items"]["30001"]
+    assert stored["price"] == 11.0
+    assert "allergens" not in stored  # an empty list is stored as no value
+    assert stored["name"] == "Dish 1"
@@ -0,0 +1,20 @@
+"""Saved allergen profiles applied to menu views."""
+from conftest import OWNER_RESTAURANT
+
+MENU = f"/restaurants/{OWNER_RESTAURANT}/menu?profile=p1"
+
+
+def test_profile_edit_from_another_worker_applies_to_the_next_view(backend):
+    backend.seed(4)
+    headers = backend.login("owner")
+    # The seeded profile hides milk, which odd-numbered dishes contain
+    first = backend.client.get(MENU, headers=headers).json()
+    assert sorted(item["id"] for item in first) == ["30000", "30002"]
+
+    # Written directly, as another worker would
+    backend.db.reference("users/owner/allergen_profiles/p1/allergen_free").set([])
+    second = backend.client.get(MENU, headers=headers).json()
+    assert len(second) == 4
+
+    backend.db.reference("users/owner/allergen_profiles/p1").delete()
+    assert backend.client.get(MENU, headers=headers).status_code == 404
@@ -0,0 +1,55 @@
+"""Route selection for on-demand profiling."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routes
+from conftest import OWNER_RESTAURANT
+from profiling import PROFILER, ProfilingMiddleware, profiling_router
+
+MENU_ROUTE = "/restaurants/{restaurant_id}/menu"
+
+
+@pytest.fixture
+def client(backend):
+    backend.seed(2)
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(profiling_router, prefix="/admin/profiling")
+    app.include_router(routes.router)
+    yield TestClient(app)
+    PROFILER.stop()
+    PROFILER.reset()
+
+
+def start(client, backend, **config):
+    response = client.post(
+        "/admin/profiling/start",
+        json={"sample_rate": 1, "duration_seconds": 60, **config},
+        headers=backend.login("admin", is_admin=True),
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_route_profiles_every_method_of_the_path(client, backend):
+    start(client, backend, route=MENU_ROUTE)
+
+    assert client.get(f"/restaurants/{OWNER_RESTAURANT}/menu", headers=backend.login("owner")).status_code == 200
+    assert PROFILER.status()["profiled_requests"] == 1
+
+
+def test_method_narrows_the_profiled_route(client, backend):
+    start(client, backend, route=MENU_ROUTE, method="post")
+
+    assert client.get(f"/restaurants/{OWNER_RESTAURANT}/menu", headers=backend.login("owner")).status_code == 200
+    assert PROFILER.status()["profiled_requests"] == 0
+
+
+def test_unknown_method_of_a_route_is_rejected(client, backend):
+    response = client.post(
+        "/admin/profiling/start",
+        json={"sample_rate": 1, "route": MENU_ROUTE, "method": "PATCH"},
+        headers=backend.login("admin", is_admin=True),
+    )
+    assert response.status_code == 404
@@ -0,0 +1,40 @@
+"""Committing a reclassified page re-checks the items it writes."""
+from conftest import OWNER_RESTAURANT
+from reclassify import ReclassifyJob
+
+
+def scanned(backend, *item_ids):
+    """(id, item as scanned, item with peanuts added) for each id"""
+    changed = []
+    for item_id in item_ids:
+        item = backend.db.reference(f"menu_items/{item_id}").get()
+        changed.append((item_id, item, {**item, "allergens": sorted(item.get("allergens", []) + ["peanuts"])}))
+    return changed
+
+
+def test_commit_applies_added_allergens_to_the_current_item(backend):
+    backend.seed(3)
+    job = ReclassifyJob()
+    job.progress = job._new_progress(None)
+    changed = scanned(backend, "30000", "30001", "40002")
+
+    # Between the scan and the commit: one item is edited, one deleted,
+    # and another restaurant goes away
+    backend.db.reference("menu_items/30000").update({"name": "Renamed", "allergens": ["sesame"]})
+    backend.db.reference("menu_items/30001").delete()
+    backend.db.reference("restaurants/20002").delete()
+
+    restaurants, committed = job.commit_page(changed)
+
+    assert [item_id for item_id, _, _ in committed] == ["30000"]
+    assert job.progress["skipped_stale"] == 2
+    assert backend.db.reference("menu_items/30000").get()["allergens"] == ["peanuts", "sesame"]
+    # No orphan nodes are written for the items that went away
+    assert backend.db.reference("menu_items/30001").get() is None
+    assert backend.db.reference("menu_items/40002").get()["allergens"] == ["eggs"]
+
+    _, seq = restaurants[OWNER_RESTAURANT]
+    log = backend.db.reference(f"menu_changes/{OWNER_RESTAURANT}/log").get()
+    entry = next(entry for entry in log.values() if entry["seq"] == seq)
+    assert entry["item"]["name"] == "Renamed"
+    assert entry["item"]["allergens"] == ["peanuts", "sesame"]
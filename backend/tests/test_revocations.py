@@ -0,0 +1,43 @@
+"""Revocation sync health, as reported to the readiness probe."""
+import asyncio
+
+import pytest
+
+import session_tokens
+from session_tokens import RevocationList
+
+
+def sync_once(revocations, monkeypatch):
+    """Run one pass of the sync loop"""
+    async def stop(interval):
+        raise asyncio.CancelledError
+
+    monkeypatch.setattr(session_tokens.asyncio, "sleep", stop)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(revocations.run_sync_loop(15))
+
+
+def test_sync_failure_is_reported(backend, monkeypatch):
+    revocations = RevocationList()
+    assert revocations.problem() is None
+
+    def missing_index():
+        raise ValueError('Index not defined, add ".indexOn": ".value"')
+
+    monkeypatch.setattr(revocations, "sync", missing_index)
+    sync_once(revocations, monkeypatch)
+    assert "Index not defined" in revocations.problem()
+
+
+def test_successful_sync_clears_the_problem(backend, monkeypatch):
+    revocations = RevocationList()
+    revocations.last_error = "earlier failure"
+    backend.db.reference("revoked_tokens").set({"old": 1, "live": 2**40})
+
+    sync_once(revocations, monkeypatch)
+    assert revocations.problem() is None
+    assert revocations.is_revoked("live") and not revocations.is_revoked("old")
+    assert backend.db.reference("revoked_tokens").get() == {"live": 2**40}
+
+    revocations.last_sync -= 3 * 15 + 1
+    assert revocations.problem() == "Token revocations have not synced recently"
@@ -0,0 +1,186 @@
+"""Round-trip and download budgets for every endpoint in routes.py and auth_routes.py.
+
+Each case states how many database round trips, downloaded database nodes
+and Auth calls one request may use, as a function of the data size ``n``
+(see ``Backend.seed``): the owner's restaurant has ``n`` menu items, and
+there are ``n`` other users, each with their own one-item restaurant. Every
+case runs at two sizes, so a handler that starts reading a whole tree, or
+calling Firebase in a loop, fails with the list of calls it made.
+"""
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+import pytest
+
+import auth_routes
+import routes
+from conftest import OWNER_RESTAURANT
+
+SIZES = (5, 50)
+
+Limit = Union[int, Callable[[int], int]]
+
+
+@dataclass
+class Budget:
+    db: Limit
+    nodes: Limit
+    auth: Limit = 0
+
+
+@dataclass
+class Case:
+    name: str
+    method: str
+    url: str
+    budget: Budget
+    user: Optional[str] = "owner"
+    admin: bool = False
+    signed: bool = False
+    json: Optional[dict] = None
+    status: int = 200
+    setup: Optional[Callable] = None
+
+
+def limit(value: Limit, n: int) -> int:
+    return value(n) if callable(value) else value
+
+
+def warm_menu(backend, headers):
+    backend.client.get(f"/restaurants/{OWNER_RESTAURANT}/menu", headers=headers)
+
+
+def warm_profile_menu(backend, headers):
+    backend.client.get(f"/restaurants/{OWNER_RESTAURANT}/menu?profile=p1", headers=headers)
+
+
+def edit_menu(backend, headers):
+    # Four change-log entries; the delta since the first one returns three
+    for price in (7.0, 7.5, 8.0):
+        backend.client.patch(f"/restaurants/{OWNER_RESTAURANT}/menu/30001", json={"price": price}, headers=headers)
+    backend.client.delete(f"/restaurants/{OWNER_RESTAURANT}/menu/30002", headers=headers)
+
+
+MENU = f"/restaurants/{OWNER_RESTAURANT}/menu"
+ITEM = f"{MENU}/30001"
+DISH = {"name": "Soup", "description": "Tomato", "price": 6.5, "allergens": ["milk"], "dietaryCategories": []}
+PLACE = {"name": "New", "address": "3 Main St", "phone": "555", "cuisine_type": "thai"}
+
+# Upper bounds on the nodes one seeded record downloads, including its key
+USER_NODES = 10        # the owner's user record with one saved profile
+RESTAURANT_NODES = 6
+ITEM_NODES = 9
+CHANGE_NODES = ITEM_NODES + 4  # a change-log entry wraps the item with its op and timestamp
+
+
+def auth_batches(n: int) -> int:
+    # get_users looks up at most 100 users per call; seed adds owner and admin
+    return -(-(n + 2) // 100)
+
+
+CASES = [
+    # routes.py
+    Case("parse ingredients", "POST", "/ai/parse-ingredients", Budget(db=1, nodes=0),
+         json={"ingredients": "wheat flour, milk, eggs"}),
+    Case("create restaurant", "POST", "/restaurants/", Budget(db=3, nodes=5),
+         user="user0", json=PLACE),
+    Case("list own restaurants", "GET", "/restaurants",
+         Budget(db=2, nodes=USER_NODES + RESTAURANT_NODES)),
+    Case("list all restaurants (admin)", "GET", "/restaurants",
+         Budget(db=2, nodes=lambda n: USER_NODES + RESTAURANT_NODES * (n + 1)),
+         user="admin", admin=True),
+    Case("get restaurant", "GET", f"/restaurants/{OWNER_RESTAURANT}",
+         Budget(db=2, nodes=USER_NODES + RESTAURANT_NODES)),
+    Case("update restaurant", "PUT", f"/restaurants/{OWNER_RESTAURANT}", Budget(db=2, nodes=5),
+         json={"name": "Renamed"}),
+    Case("delete restaurant", "DELETE", f"/restaurants/{OWNER_RESTAURANT}",
+         Budget(db=4, nodes=lambda n: RESTAURANT_NODES + 1 + ITEM_NODES * n)),
+    Case("add menu item", "POST", MENU, Budget(db=6, nodes=15), json=DISH),
+    Case("get menu", "GET", MENU,
+         Budget(db=4, nodes=lambda n: USER_NODES + RESTAURANT_NODES + ITEM_NODES * n)),
+    Case("get menu (cached)", "GET", MENU, Budget(db=2, nodes=USER_NODES), setup=warm_menu),
+    Case("get menu with profile", "GET", f"{MENU}?profile=p1",
+         Budget(db=5, nodes=lambda n: USER_NODES + RESTAURANT_NODES + 3 + ITEM_NODES * n)),
+    Case("get menu with profile (cached)", "GET", f"{MENU}?profile=p1",
+         Budget(db=3, nodes=USER_NODES + 3), setup=warm_profile_menu),
+    Case("get menu changes (snapshot)", "GET", f"{MENU}/changes",
+         Budget(db=4, nodes=lambda n: RESTAURANT_NODES + ITEM_NODES * n)),
+    Case("get menu changes (delta)", "GET", f"{MENU}/changes?since=0",
+         Budget(db=3, nodes=RESTAURANT_NODES)),
+    Case("get menu changes (delta, with changes)", "GET", f"{MENU}/changes?since=1",
+         Budget(db=3, nodes=RESTAURANT_NODES + 3 * CHANGE_NODES), setup=edit_menu),
+    Case("update menu item", "PUT", ITEM, Budget(db=5, nodes=13), json=DISH),
+    Case("patch menu item", "PATCH", ITEM, Budget(db=5, nodes=13), json={"price": 7.25}),
+    Case("delete menu item", "DELETE", ITEM, Budget(db=5, nodes=13)),
+    # auth_routes.py
+    Case("register", "POST", "/auth/register", Budget(db=2, nodes=0, auth=1), user=None,
+         json={"email": "new@example.com", "password": "secret123", "name": "New"}),
+    Case("login", "POST", "/auth/login", Budget(db=2, nodes=USER_NODES + RESTAURANT_NODES, auth=1),
+         user=None, json={"email": "owner@example.com", "password": "secret123"}),
+    Case("current user", "GET", "/auth/user",
+         Budget(db=2, nodes=USER_NODES + RESTAURANT_NODES, auth=1)),
+    Case("list users (admin)", "GET", "/auth/users",
+         Budget(db=2, nodes=lambda n: 2 * USER_NODES + (USER_NODES + RESTAURANT_NODES) * n,
+                auth=auth_batches),
+         user="admin", admin=True),
+    Case("make admin by email", "POST", "/auth/make-admin-by-email", Budget(db=2, nodes=1, auth=1),
+         user="admin", admin=True, json={"email": "user0@example.com"}),
+    Case("make admin by id", "POST", "/auth/make-admin/user0", Budget(db=2, nodes=1, auth=1),
+         user="admin", admin=True),
+    Case("remove admin by email", "POST", "/auth/remove-admin-by-email", Budget(db=2, nodes=1, auth=1),
+         user="admin", admin=True, json={"email": "user0@example.com"}),
+    Case("logout", "POST", "/auth/logout", Budget(db=0, nodes=0)),
+    Case("logout (signed token)", "POST", "/auth/logout", Budget(db=1, nodes=0), signed=True),
+    Case("refresh", "POST", "/auth/refresh", Budget(db=2, nodes=USER_NODES),
+         signed=True),
+    Case("list profiles", "GET", "/auth/profiles", Budget(db=1, nodes=4)),
+    Case("create profile", "POST", "/auth/profiles", Budget(db=2, nodes=1), status=201,
+         json={"name": "Vegan", "dietaryCategories": ["vegan"]}),
+    Case("update profile", "PUT", "/auth/profiles/p1", Budget(db=2, nodes=2),
+         json={"name": "Kids", "allergen_free": ["milk", "eggs"]}),
+    Case("delete profile", "DELETE", "/auth/profiles/p1", Budget(db=2, nodes=2)),
+]
+
+
+@pytest.mark.parametrize("n", SIZES)
+@pytest.mark.parametrize("case", CASES, ids=[case.name for case in CASES])
+def test_round_trip_budget(backend, case, n):
+    backend.seed(n)
+    headers = {}
+    if case.user:
+        login = backend.login_signed if case.signed else backend.login
+        headers = login(case.user, is_admin=case.admin)
+    if case.setup:
+        case.setup(backend, headers)
+
+    response, usage = backend.measure(case.method, case.url, json=case.json, headers=headers)
+    assert response.status_code == case.status, response.text
+
+    over = []
+    for label, actual, allowed in (
+        ("db round trips", usage.round_trips, limit(case.budget.db, n)),
+        ("db nodes downloaded", usage.nodes, limit(case.budget.nodes, n)),
+        ("auth round trips", usage.auth_round_trips, limit(case.budget.auth, n)),
+    ):
+        if actual > allowed:
+            over.append(f"  {label}: {actual} > budget {allowed}")
+    assert not over, (
+        f"{case.method} {case.url} ({case.name}) at n={n} is over budget:\n"
+        + "\n".join(over)
+        + f"\ncalls made:\n{usage.describe()}"
+    )
+
+
+def test_every_route_has_a_budget():
+    missing = []
+    for prefix, router in (("", routes.router), ("/auth", auth_routes.auth_router)):
+        for route in router.routes:
+            for method in route.methods:
+                covered = any(
+                    case.method == method and route.path_regex.match(case.url.split("?")[0][len(prefix):])
+                    for case in CASES
+                    if case.url.startswith(prefix)
+                )
+                if not covered:
+                    missing.append(f"{method} {prefix}{route.path}")
+    assert not missing, "Routes without a round-trip budget:\n" + "\n".join(missing)
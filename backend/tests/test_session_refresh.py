@@ -0,0 +1,58 @@
+"""Refreshing signed session tokens."""
+import time
+
+import auth_routes
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def claims_of(headers: dict) -> dict:
+    return auth_routes.SIGNER.verify(headers["Authorization"].split("Bearer ")[1])
+
+
+def test_refresh_revokes_the_presented_token(backend):
+    backend.seed(1)
+    old = backend.login_signed("owner")
+
+    response = backend.client.post("/auth/refresh", headers=old)
+    assert response.status_code == 200
+    new = bearer(response.json()["token"])
+
+    assert backend.client.get("/auth/profiles", headers=new).status_code == 200
+    assert backend.client.get("/auth/profiles", headers=old).status_code == 401
+    assert backend.client.post("/auth/refresh", headers=old).status_code == 401
+    assert claims_of(old)["jti"] in backend.db.reference("revoked_tokens").get()
+
+
+def test_refresh_keeps_the_login_time(backend):
+    backend.seed(1)
+    headers = backend.login_signed("owner")
+    signer = auth_routes.SIGNER
+    login = claims_of(headers)
+    assert "rids" not in login
+
+    # A session close to its maximum age gets a token that ends with it
+    claims = {**login, "auth_time": int(time.time()) - signer.max_age_seconds + 60}
+    response = backend.client.post("/auth/refresh", headers=bearer(signer.sign_claims(claims)))
+
+    refreshed = signer.verify(response.json()["token"])
+    assert refreshed["auth_time"] == claims["auth_time"]
+    assert refreshed["exp"] == claims["auth_time"] + signer.max_age_seconds
+    assert response.json()["expires_at"] == refreshed["exp"]
+
+
+def test_sessions_past_the_maximum_age_cannot_be_refreshed(backend):
+    backend.seed(1)
+    headers = backend.login_signed("owner")
+    signer = auth_routes.SIGNER
+    now = int(time.time())
+    # Tokens issued before auth_time existed fall back to their iat
+    claims = {**claims_of(headers), "iat": now - signer.max_age_seconds - 1, "exp": now + 60}
+    del claims["auth_time"]
+
+    response = backend.client.post("/auth/refresh", headers=bearer(signer.sign_claims(claims)))
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Session too old, please log in again"
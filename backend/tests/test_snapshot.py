@@ -0,0 +1,106 @@
+"""Snapshot export and restore against the in-memory database."""
+import gzip
+import json
+
+import pytest
+
+from conftest import OWNER_RESTAURANT
+from memory_db import MemoryDatabase
+from snapshot import SnapshotError, check_snapshot, export_snapshot, import_snapshot
+
+
+def test_export_then_import_restores_the_catalog(backend, tmp_path):
+    backend.seed(50)
+    original = {tree: backend.db.data[tree] for tree in ("restaurants", "menu_items", "users")}
+    path = str(tmp_path / "catalog.jsonl.gz")
+
+    counts = export_snapshot(path, page_size=20)
+    assert counts == {"restaurants": 51, "menu_items": 100, "users": 52}
+    # Trees are read a page at a time, never whole
+    assert all(op == "query" for op, _, _ in backend.db.calls)
+
+    backend.db.data = {"restaurants": {"99999": {"name": "Stale"}}}
+    backend.db.reset_counters()
+    report = import_snapshot(path, batch_size=40, workers=4, replace=True)
+
+    assert report["items"] == 203
+    assert report["batches"] == 6
+    restored = {tree: backend.db.data[tree] for tree in original}
+    assert restored == MemoryDatabase(original).data
+    # Six data batches, then one change-log reset per restaurant
+    assert report["change_logs_reset"] == 51
+    assert [op for op, _, _ in backend.db.calls].count("update") == 6 + 51
+
+
+def test_import_without_replace_resets_touched_change_logs(backend, tmp_path):
+    backend.seed(2)
+    headers = backend.login("owner")
+    menu = f"/restaurants/{OWNER_RESTAURANT}/menu"
+    path = str(tmp_path / "catalog.jsonl.gz")
+    export_snapshot(path, trees=["menu_items"])
+
+    backend.client.patch(f"{menu}/30001", json={"price": 12.25}, headers=headers)
+    synced = backend.client.get(f"{menu}/changes", headers=headers).json()["seq"]
+    version = backend.db.reference(f"menu_changes/{OWNER_RESTAURANT}/version").get()
+
+    report = import_snapshot(path)
+    # The owner's restaurant and the two others whose items were restored
+    assert report["change_logs_reset"] == 3
+    assert backend.db.reference(f"menu_changes/{OWNER_RESTAURANT}/version").get() > version
+    changes = backend.client.get(f"{menu}/changes?since={synced}", headers=headers).json()
+    assert changes["reset"]
+    assert {item["id"]: item["price"] for item in changes["upserts"]}["30001"] == 9.5
+
+
+def test_truncated_snapshot_writes_nothing(backend, tmp_path):
+    backend.seed(5)
+    path = str(tmp_path / "catalog.jsonl.gz")
+    export_snapshot(path)
+    with gzip.open(path, "rt") as f:
+        lines = f.readlines()
+    with gzip.open(path, "wt") as f:
+        f.writelines(lines[:-1])
+
+    backend.db.reset_counters()
+    with pytest.raises(SnapshotError):
+        import_snapshot(path, replace=True)
+    assert backend.db.calls == []
+
+
+def test_mismatched_counts_are_rejected(tmp_path):
+    path = str(tmp_path / "catalog.jsonl.gz")
+    with gzip.open(path, "wt") as f:
+        f.write(json.dumps({"format": "safeeats-snapshot", "version": 1, "trees": ["users"]}) + "\n")
+        f.write(json.dumps({"tree": "users", "records": {"a": {"name": "A"}}}) + "\n")
+        f.write(json.dumps({"end": True, "counts": {"users": 2}}) + "\n")
+    with pytest.raises(SnapshotError):
+        check_snapshot(path)
+
+
+def test_replacing_import_resets_change_logs_and_parse_results(backend, tmp_path):
+    backend.seed(5)
+    headers = backend.login("owner")
+    menu = f"/restaurants/{OWNER_RESTAURANT}/menu"
+    path = str(tmp_path / "catalog.jsonl.gz")
+    export_snapshot(path)
+
+    backend.client.patch(f"{menu}/30001", json={"price": 12.25}, headers=headers)
+    synced = backend.client.get(f"{menu}/changes", headers=headers).json()["seq"]
+    backend.db.reference("ai_parse_results/abc").set({"tokens": ["milk"], "result": {}})
+
+    report = import_snapshot(path, replace=True)
+    # Every restaurant in the snapshot, including the one with a change log
+    assert report["change_logs_reset"] == 6
+    assert backend.db.reference("ai_parse_results").get() is None
+    assert backend.db.reference(f"menu_changes/{OWNER_RESTAURANT}/log").get() is None
+
+    # A client that synced before the restore refetches the whole menu
+    changes = backend.client.get(f"{menu}/changes?since={synced}", headers=headers).json()
+    assert changes["reset"] and changes["seq"] > synced
+    prices = {item["id"]: item["price"] for item in changes["upserts"]}
+    assert prices["30001"] != 12.25
+
+    # and syncs normally from there
+    backend.client.patch(f"{menu}/30001", json={"price": 3.0}, headers=headers)
+    delta = backend.client.get(f"{menu}/changes?since={changes['seq']}", headers=headers).json()
+    assert not delta["reset"] and [item["price"] for item in delta["upserts"]] == [3.0]
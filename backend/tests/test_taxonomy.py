@@ -0,0 +1,55 @@
+"""Keyword classification and re-classification of menu item labels."""
+import pytest
+
+from reclassify import reclassify_item
+from taxonomy import classify_text
+
+
+@pytest.mark.parametrize("text, allergens", [
+    ("Vegan eggplant curry", set()),
+    ("Butternut squash soup", set()),
+    ("Peanut butter", {"peanuts"}),
+    ("Coconut cream pie (vegan)", set()),
+    ("Dairy-free cheese", set()),
+    ("Almond milk latte", {"tree_nuts"}),
+    ("Gluten-free bread", set()),
+    ("Cheese pizza", {"milk"}),
+    ("Buttermilk pancakes with butter", {"milk"}),
+    ("Eggs benedict", {"eggs"}),
+    ("Grilled anchovies", {"fish"}),
+    ("Shrimp pad thai with peanuts", {"shellfish", "peanuts"}),
+    ("Walnuts and pine nuts", {"tree_nuts"}),
+    ("Egg-free pasta", {"wheat"}),
+])
+def test_classify_text_allergens(text, allergens):
+    assert classify_text(text)[0] == allergens
+
+
+@pytest.mark.parametrize("text, not_vegan, not_vegetarian", [
+    ("Vegan eggplant curry", False, False),
+    ("Veggie burger", False, False),
+    ("Tofu steak", False, False),
+    ("Beef steak", True, True),
+    ("Honey glazed carrots", True, False),
+    ("Cheese pizza", True, False),
+])
+def test_classify_text_dietary(text, not_vegan, not_vegetarian):
+    _, vegan_ruled_out, vegetarian_ruled_out = classify_text(text)
+    assert (vegan_ruled_out, vegetarian_ruled_out) == (not_vegan, not_vegetarian)
+
+
+def test_reclassify_flags_dietary_labels_instead_of_removing_them():
+    item = {"name": "Cheese pizza", "allergens": ["wheat"], "dietaryCategories": ["vegan", "vegetarian"]}
+    new, flagged = reclassify_item(item, *classify_text(item["name"]))
+
+    assert new["allergens"] == ["milk", "wheat"]
+    assert new["dietaryCategories"] == ["vegan", "vegetarian"]
+    assert flagged == ["vegan"]
+
+
+def test_reclassify_keeps_owner_labels_for_false_positive_names():
+    item = {"name": "Vegan eggplant curry", "allergens": [], "dietaryCategories": ["vegan"]}
+    new, flagged = reclassify_item(item, *classify_text(item["name"]))
+
+    assert new == item
+    assert flagged == []
@@ -0,0 +1,130 @@
+"""Write-behind buffer bookkeeping, without a background flush loop."""
+import pytest
+
+from memory_db import MemoryReference
+from write_behind import WriteBehindBuffer
+
+
+@pytest.fixture
+def buffer(tmp_path):
+    buffer = WriteBehindBuffer(
+        enabled=True, journal_dir=str(tmp_path), flush_interval=1, max_batch=100, max_pending=100
+    )
+    buffer.recover()
+    return buffer
+
+
+def test_has_pending_sees_field_writes_beneath_an_item(buffer):
+    buffer.submit("10001", {"menu_items/30001/price": 7.25}, [("upsert", "30001", {"price": 7.25})])
+
+    assert buffer.has_pending("menu_items/30001")
+    assert buffer.has_pending("menu_items/30001/price")
+    assert not buffer.has_pending("menu_items/3000")
+    assert not buffer.has_pending("menu_items/30002")
+
+
+def test_has_pending_sees_fields_of_a_pending_item(buffer):
+    buffer.submit("10001", {"menu_items/30001": {"name": "Soup"}}, [("upsert", "30001", {"name": "Soup"})])
+
+    assert buffer.has_pending("menu_items/30001/name")
+    assert not buffer.has_pending("menu_items/300011")
+
+
+def crash(buffer):
+    """Drop a buffer the way an exited process would, leaving its journal"""
+    buffer._segment.close()
+    buffer._worker_lock.close()
+
+
+def make_buffer(tmp_path):
+    buffer = WriteBehindBuffer(
+        enabled=True, journal_dir=str(tmp_path), flush_interval=1, max_batch=100, max_pending=100
+    )
+    buffer.recover()
+    return buffer
+
+
+def test_live_journals_are_not_adopted(backend, buffer, tmp_path):
+    buffer.submit("10001", {"menu_items/30001": {"name": "Soup"}}, [])
+
+    other = make_buffer(tmp_path)
+    assert other._adopted == []
+    assert other.flush() == 0
+    assert backend.db.reference("menu_items/30001").get() is None
+    assert buffer.has_pending("menu_items/30001")
+
+
+def test_journal_of_an_exited_process_is_replayed(backend, buffer, tmp_path):
+    buffer.submit("10001", {"menu_items/30001": {"name": "Soup"}}, [], {"menu_items/total": 1})
+    crash(buffer)
+
+    other = make_buffer(tmp_path)
+    assert other.flush() == 1
+    assert backend.db.reference("menu_items/30001").get() == {"name": "Soup"}
+    assert backend.db.reference("stats/catalog/menu_items/total").get() == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == [other._worker_dir.rsplit("/", 1)[1]]
+
+
+def test_committed_segments_are_not_replayed_twice(backend, buffer, tmp_path):
+    buffer.submit("10001", {"menu_items/30001": {"name": "Soup"}}, [], {"menu_items/total": 1})
+    segment = buffer._segment.name
+    with open(segment, encoding="utf-8") as f:
+        journal = f.read()
+    buffer.flush()
+    # Exit after the commit but before the segment was deleted
+    with open(segment, "w", encoding="utf-8") as f:
+        f.write(journal)
+    crash(buffer)
+
+    other = make_buffer(tmp_path)
+    assert other.flush() == 0
+    assert backend.db.reference("stats/catalog/menu_items/total").get() == 1
+    assert not (tmp_path / segment).exists()
+
+
+def fail_next_update(monkeypatch, applied: bool):
+    """Make the next multi-path update raise, after applying it if ``applied``"""
+    original = MemoryReference.update
+    calls = []
+
+    def update(self, value):
+        if not calls:
+            calls.append(value)
+            if applied:
+                original(self, value)
+            raise ConnectionError("connection reset")
+        return original(self, value)
+
+    monkeypatch.setattr(MemoryReference, "update", update)
+
+
+@pytest.mark.parametrize("applied", [True, False])
+def test_failed_flush_applies_increments_once(backend, buffer, monkeypatch, applied):
+    buffer.submit("10001", {"menu_items/30001": {"name": "Soup"}}, [], {"menu_items/total": 1})
+    fail_next_update(monkeypatch, applied)
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+    # Still visible to reads while its outcome is unknown
+    assert buffer.has_pending("menu_items/30001")
+
+    buffer.submit("10001", {"menu_items/30002": {"name": "Salad"}}, [], {"menu_items/total": 1})
+    assert buffer.flush() == (1 if applied else 2)
+
+    assert backend.db.reference("stats/catalog/menu_items/total").get() == 2
+    assert backend.db.reference("menu_items/30001").get() == {"name": "Soup"}
+    assert backend.db.reference("menu_items/30002").get() == {"name": "Salad"}
+    assert not buffer.has_pending("menu_items/30001")
+    assert buffer._sealed == []
+
+
+def test_discard_drops_an_unconfirmed_batch(backend, buffer, monkeypatch):
+    buffer.submit("10001", {"menu_items/30001": {"name": "Soup"}}, [], {"menu_items/total": 1})
+    fail_next_update(monkeypatch, applied=False)
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+
+    buffer.discard("10001")
+    buffer.flush()
+
+    assert backend.db.reference("menu_items/30001").get() is None
+    assert backend.db.reference("stats/catalog/menu_items/total").get() is None
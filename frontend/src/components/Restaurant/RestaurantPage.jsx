@@ -11,7 +11,7 @@ const allergenOptions = [
   { id: 'fish', label: 'Fish', icon: '🐟' },
   { id: 'tree_nuts', label: 'Tree Nuts', icon: '🌰' },
   { id: 'wheat', label: 'Wheat', icon: '🌾' },
-  { id: 'crustaceans', label: 'Crustaceans', icon: '🦀' },
+  { id: 'shellfish', label: 'Shellfish', icon: '🦀' },
   { id: 'gluten_free', label: 'Gluten-Free', icon: '🌾' },
   { id: 'peanuts', label: 'Peanuts', icon: '🥜' },
   { id: 'soybeans', label: 'Soybeans', icon: '🫘' },
@@ -117,6 +117,24 @@ const RestaurantPage = () => {
     fetchRestaurantData();
   }, [restaurantId]);
 
+  // Apply changes made elsewhere (other tabs, staff, admins) as they happen
+  useEffect(() => {
+    const unsubscribe = api.subscribeToChanges(restaurantId, (event) => {
+      if (event.type === 'resync') {
+        fetchRestaurantData();
+      } else if (event.type === 'menu' && event.op === 'delete') {
+        setMenuItems(items => items.filter(item => item.id !== event.item_id));
+      } else if (event.type === 'menu') {
+        setMenuItems(items => items.some(item => item.id === event.item_id)
+          ? items.map(item => item.id === event.item_id ? event.item : item)
+          : [...items, event.item]);
+      } else if (event.type === 'restaurant' && event.op === 'upsert') {
+        setRestaurant(current => ({ ...current, ...event.restaurant }));
+      }
+    });
+    return unsubscribe;
+  }, [restaurantId]);
+
   // Separate useEffect for handling success messages from localStorage
   useEffect(() => {
     // Check for success message from localStorage after component mounts
@@ -256,8 +274,18 @@ const RestaurantPage = () => {
 
   const handleSaveEdit = async (updatedItem) => {
     try {
-      // Send the updated item to the API
-      await api.updateMenuItem(restaurantId, updatedItem.id, updatedItem);
+      // Send only the fields that changed since editing started
+      const editableFields = ['name', 'description', 'price', 'allergens', 'dietaryCategories'];
+      const changedFields = {};
+      editableFields.forEach(field => {
+        if (JSON.stringify(updatedItem[field]) !== JSON.stringify(originalItem?.[field])) {
+          changedFields[field] = updatedItem[field];
+        }
+      });
+
+      if (Object.keys(changedFields).length > 0) {
+        await api.patchMenuItem(restaurantId, updatedItem.id, changedFields);
+      }
       
       // Update the local items list
       setMenuItems(menuItems.map(item => 
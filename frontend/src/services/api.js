@@ -20,9 +20,43 @@ const getAuthToken = () => {
   return localStorage.getItem('auth_token');
 };
 
-// Set authentication token
-const setAuthToken = (token) => {
+// Set authentication token (expiresAt is set for signed, short-lived tokens)
+const setAuthToken = (token, expiresAt) => {
   localStorage.setItem('auth_token', token);
+  if (expiresAt) {
+    localStorage.setItem('auth_token_expires_at', String(expiresAt));
+  } else {
+    localStorage.removeItem('auth_token_expires_at');
+  }
+};
+
+// Refresh signed tokens shortly before they expire
+let refreshPromise = null;
+const refreshAuthTokenIfNeeded = async () => {
+  const expiresAt = Number(localStorage.getItem('auth_token_expires_at'));
+  if (!expiresAt || expiresAt - Date.now() / 1000 > 60) {
+    return;
+  }
+  if (!refreshPromise) {
+    refreshPromise = CapacitorHttp.request({
+      method: 'POST',
+      url: `${BASE_URL}/auth/refresh`,
+      headers: {
+        'Accept': 'application/json',
+        'Authorization': `Bearer ${getAuthToken()}`
+      }
+    }).then(response => {
+      if (response.status === 200) {
+        setAuthToken(response.data.token, response.data.expires_at);
+        setUserRole(response.data.is_admin);
+      }
+    }).catch(error => {
+      console.warn('Token refresh failed:', error);
+    }).finally(() => {
+      refreshPromise = null;
+    });
+  }
+  await refreshPromise;
 };
 
 // Set user ID
@@ -72,6 +106,7 @@ const isUserAdmin = () => {
 // Clear authentication data
 const clearAuthData = () => {
   localStorage.removeItem('auth_token');
+  localStorage.removeItem('auth_token_expires_at');
   localStorage.removeItem('user_id');
   localStorage.removeItem('user_name');
   localStorage.removeItem('email');
@@ -101,6 +136,7 @@ const httpRequest = async (options) => {
   try {
     // Add authorization header if not already set
     if (!options.headers?.Authorization) {
+      await refreshAuthTokenIfNeeded();
       const token = getAuthToken();
       if (token) {
         if (!options.headers) {
@@ -157,7 +193,7 @@ export const api = {
       }
       
       // Store token and user data directly
-      setAuthToken(response.data.token);
+      setAuthToken(response.data.token, response.data.expires_at);
       setUserId(response.data.uid);
       setUserEmail(response.data.email);
       setUserName(response.data.name);
@@ -201,7 +237,7 @@ export const api = {
       console.log('Login successful, storing token and user data');
       
       // Store token and user data directly
-      setAuthToken(response.data.token);
+      setAuthToken(response.data.token, response.data.expires_at);
       setUserId(response.data.uid);
       setUserEmail(response.data.email);
       setUserName(response.data.name);
@@ -409,6 +445,50 @@ export const api = {
     }
   },
 
+  updateRestaurant: async (restaurantId, restaurantData) => {
+    try {
+      const response = await httpRequest({
+        method: 'PUT',
+        url: `${BASE_URL}/restaurants/${restaurantId}`,
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'application/json'
+        },
+        data: restaurantData
+      });
+      
+      if (response.status !== 200) {
+        throw new Error(response.data?.detail || 'Failed to update restaurant');
+      }
+      
+      return response.data;
+    } catch (error) {
+      console.error('Error updating restaurant:', error);
+      throw error;
+    }
+  },
+
+  deleteRestaurant: async (restaurantId) => {
+    try {
+      const response = await httpRequest({
+        method: 'DELETE',
+        url: `${BASE_URL}/restaurants/${restaurantId}`,
+        headers: {
+          'Accept': 'application/json'
+        }
+      });
+      
+      if (response.status !== 200) {
+        throw new Error(response.data?.detail || 'Failed to delete restaurant');
+      }
+      
+      return response.data;
+    } catch (error) {
+      console.error('Error deleting restaurant:', error);
+      throw error;
+    }
+  },
+
   addMenuItem: async (restaurantId, menuItemData) => {
     try {
       const response = await httpRequest({
@@ -434,7 +514,7 @@ export const api = {
 
   getMenuItems: async (restaurantId, filters = {}) => {
     try {
-      const { dietaryCategory, allergenFree } = filters;
+      const { dietaryCategory, allergenFree, profile } = filters;
       let url = `${BASE_URL}/restaurants/${restaurantId}/menu`;
       
       // Add query parameters if filters are provided
@@ -447,6 +527,9 @@ export const api = {
           queryParams.append('allergen_free', allergen);
         });
       }
+      if (profile) {
+        queryParams.append('profile', profile);
+      }
       
       const queryString = queryParams.toString();
       if (queryString) {
@@ -472,6 +555,96 @@ export const api = {
     }
   },
 
+  // Delta sync: changes since the last seen sequence (omit since for a full snapshot)
+  getMenuChanges: async (restaurantId, since) => {
+    try {
+      let url = `${BASE_URL}/restaurants/${restaurantId}/menu/changes`;
+      if (since !== undefined && since !== null) {
+        url += `?since=${since}`;
+      }
+
+      const response = await httpRequest({
+        method: 'GET',
+        url,
+        headers: {
+          'Accept': 'application/json'
+        }
+      });
+      
+      if (response.status !== 200) {
+        throw new Error(response.data?.detail || 'Failed to fetch menu changes');
+      }
+      
+      return response.data;
+    } catch (error) {
+      console.error('Error fetching menu changes:', error);
+      throw error;
+    }
+  },
+
+  // Live menu/restaurant change events; returns a function that closes the stream
+  subscribeToChanges: (restaurantId, onEvent) => {
+    let source = null;
+    let closed = false;
+
+    const connect = async () => {
+      await refreshAuthTokenIfNeeded();
+      if (closed) {
+        return;
+      }
+      // URLs end up in server logs, so the stream gets a single-use ticket
+      // instead of the session token
+      let ticket;
+      try {
+        const response = await httpRequest({
+          method: 'POST',
+          url: `${BASE_URL}/events/ticket`,
+          headers: { 'Accept': 'application/json' }
+        });
+        ticket = response.data?.ticket;
+      } catch (error) {
+        console.error('Error opening change stream:', error);
+      }
+      if (closed) {
+        return;
+      }
+      if (!ticket) {
+        setTimeout(connect, 3000);
+        return;
+      }
+      const params = new URLSearchParams({ ticket });
+      if (restaurantId) {
+        params.set('restaurant_id', restaurantId);
+      }
+      source = new EventSource(`${BASE_URL}/events/stream?${params}`);
+
+      source.onerror = () => {
+        // The browser retries with the same, already used ticket, which the
+        // server refuses; start over with a new one
+        if (source.readyState === EventSource.CLOSED && !closed) {
+          setTimeout(connect, 3000);
+        }
+      };
+      const handle = (e) => onEvent(JSON.parse(e.data));
+      source.addEventListener('menu', handle);
+      source.addEventListener('restaurant', handle);
+      source.addEventListener('resync', handle);
+      source.addEventListener('expired', () => {
+        // Token ran out; reconnect with a refreshed one
+        source.close();
+        connect();
+      });
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      if (source) {
+        source.close();
+      }
+    };
+  },
+
   // AI parsing
   parseIngredientsWithAI: async (ingredientsText) => {
     try {
@@ -518,6 +691,72 @@ export const api = {
       throw error;
     }
   },
+
+  // Saved allergen profiles; pass { profile: id } to getMenuItems to apply one
+  getAllergenProfiles: async () => {
+    try {
+      const response = await httpRequest({
+        method: 'GET',
+        url: `${BASE_URL}/auth/profiles`,
+        headers: {
+          'Accept': 'application/json'
+        }
+      });
+      
+      if (response.status !== 200) {
+        throw new Error(response.data?.detail || 'Failed to fetch profiles');
+      }
+      
+      return response.data;
+    } catch (error) {
+      console.error('Error fetching allergen profiles:', error);
+      throw error;
+    }
+  },
+
+  saveAllergenProfile: async (profileData, profileId = null) => {
+    try {
+      const response = await httpRequest({
+        method: profileId ? 'PUT' : 'POST',
+        url: profileId ? `${BASE_URL}/auth/profiles/${profileId}` : `${BASE_URL}/auth/profiles`,
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'application/json'
+        },
+        data: profileData
+      });
+      
+      if (response.status !== 200 && response.status !== 201) {
+        throw new Error(response.data?.detail || 'Failed to save profile');
+      }
+      
+      return response.data;
+    } catch (error) {
+      console.error('Error saving allergen profile:', error);
+      throw error;
+    }
+  },
+
+  deleteAllergenProfile: async (profileId) => {
+    try {
+      const response = await httpRequest({
+        method: 'DELETE',
+        url: `${BASE_URL}/auth/profiles/${profileId}`,
+        headers: {
+          'Accept': 'application/json'
+        }
+      });
+      
+      if (response.status !== 200) {
+        throw new Error(response.data?.detail || 'Failed to delete profile');
+      }
+      
+      return response.data;
+    } catch (error) {
+      console.error('Error deleting allergen profile:', error);
+      throw error;
+    }
+  },
   
   // User role and data helpers
   isAdmin: () => {
@@ -584,6 +823,31 @@ export const api = {
     }
   },
 
+  // Send only the fields that changed
+  patchMenuItem: async (restaurantId, menuItemId, changedFields) => {
+    try {
+      const response = await httpRequest({
+        method: 'PATCH',
+        url: `${BASE_URL}/restaurants/${restaurantId}/menu/${menuItemId}`,
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'application/json'
+        },
+        data: changedFields
+      });
+      
+      if (response.status !== 200) {
+        const errorData = response.data;
+        throw new Error(errorData?.detail || 'Failed to update menu item');
+      }
+      
+      return response.data;
+    } catch (error) {
+      console.error('Error updating menu item:', error);
+      throw error;
+    }
+  },
+
   deleteMenuItem: async (restaurantId, menuItemId) => {
     try {
       const response = await CapacitorHttp.request({